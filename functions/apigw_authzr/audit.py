@@ -0,0 +1,160 @@
+"""
+Audit Events
+
+Structured audit events for the auth flow (login success/failure, session
+creation and renewal, authorization denials, logouts). Handlers call emit(),
+which only appends to an in-memory buffer; a background thread writes the
+buffer to the configured sink in batches, so auditing adds no I/O to the
+request path (in particular the authorizer's).
+
+The buffer is bounded: when it is full new events are dropped and counted,
+and events of a batch the sink rejects are counted as failed. Whenever
+either counter has grown since the last flush, an "audit.dropped" event
+carrying the totals is written with the next batch, so gaps are visible in
+the sink itself.
+
+Buffered events are written while the container is warm. The Fn platform
+freezes the container between invocations, so a batch can wait until the
+next invocation; events still buffered when an idle container is reclaimed
+are lost. Treat the stream as an operational audit trail, not a ledger.
+
+This module is copied verbatim into every function directory. Keep the
+copies identical.
+
+Configuration (environment):
+    AUDIT_SINK            none (default) | log | stream
+    AUDIT_BUFFER_SIZE     Max buffered events (default 1000)
+    AUDIT_BATCH_SIZE      Events per sink write (default 100)
+    AUDIT_FLUSH_INTERVAL  Seconds between background flushes (default 1)
+    AUDIT_STREAM_MAXLEN   Approximate length cap of the stream (default 100000)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+AUDIT_SINK = os.environ.get('AUDIT_SINK', 'none').lower()
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', '1000'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '1'))
+AUDIT_STREAM_MAXLEN = int(os.environ.get('AUDIT_STREAM_MAXLEN', '100000'))
+
+ENABLED = AUDIT_SINK not in ('', 'none', 'off')
+
+_buffer = deque()
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_thread = None
+
+# Totals since the container started
+counters = {"emitted": 0, "dropped": 0, "written": 0, "failed": 0}
+_reported = {"dropped": 0, "failed": 0}
+
+
+def ref(value: str) -> str:
+    """Short non-reversible reference for a session ID or similar secret."""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16] if value else ""
+
+
+def emit(source: str, event: str, **fields):
+    """Buffer an audit event (never blocks on I/O; dropped and counted when the buffer is full)."""
+    if not ENABLED:
+        return
+    record = {"ts": round(time.time(), 3), "source": source, "event": event}
+    record.update(fields)
+    with _lock:
+        if len(_buffer) >= AUDIT_BUFFER_SIZE:
+            counters["dropped"] += 1
+            return
+        _buffer.append(record)
+        counters["emitted"] += 1
+        batch_ready = len(_buffer) >= AUDIT_BATCH_SIZE
+    _ensure_worker()
+    if batch_ready:
+        _wakeup.set()
+
+
+def _ensure_worker():
+    global _thread
+    if _thread is None:
+        with _lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_worker, name="audit-flush", daemon=True)
+                _thread.start()
+
+
+def _worker():
+    while True:
+        _wakeup.wait(AUDIT_FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush()
+
+
+def _take_batch() -> list:
+    with _lock:
+        batch = [_buffer.popleft() for _ in range(min(AUDIT_BATCH_SIZE, len(_buffer)))]
+        lost = {k: counters[k] - _reported[k] for k in _reported}
+        if any(lost.values()):
+            _reported.update({k: counters[k] for k in _reported})
+            batch.append({"ts": round(time.time(), 3), "source": "audit", "event": "audit.dropped",
+                          "dropped_total": counters["dropped"], "failed_total": counters["failed"]})
+    return batch
+
+
+def flush():
+    """Write everything buffered to the sink (called by the background thread)."""
+    while True:
+        batch = _take_batch()
+        if not batch:
+            return
+        try:
+            _sink(batch)
+            with _lock:
+                counters["written"] += len(batch)
+        except Exception as e:
+            with _lock:
+                counters["failed"] += len(batch)
+            logger.warning(f"Audit sink write failed, {len(batch)} event(s) lost: {str(e)}")
+            return
+
+
+def log_sink(batch: list):
+    """Write each event as a single log line."""
+    for record in batch:
+        logger.info(f"AUDIT {json.dumps(record, separators=(',', ':'))}")
+
+
+def stream_sink(batch: list):
+    """Append the batch to the audit_events stream in OCI Cache (one pipelined round trip)."""
+    import session_store
+    pipe = session_store.get_client().pipeline(transaction=False)
+    for record in batch:
+        pipe.xadd(
+            session_store.audit_stream_key(),
+            {"event": record["event"], "data": json.dumps(record, separators=(',', ':'))},
+            maxlen=AUDIT_STREAM_MAXLEN,
+            approximate=True
+        )
+    pipe.execute()
+
+
+SINKS = {
+    'log': log_sink,
+    'stream': stream_sink,
+}
+
+_sink = SINKS.get(AUDIT_SINK, log_sink)
+
+
+def set_sink(sink):
+    """Install a custom sink: a callable taking a list of event dicts (raise to count them as failed)."""
+    global _sink, ENABLED
+    _sink = sink
+    ENABLED = True
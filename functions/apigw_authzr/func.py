@@ -5,40 +5,899 @@ Validates session cookies for API Gateway authorizer.
 Returns allow/deny decision based on session validity.
 """
 
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
 import io
 import os
 import json
+import math
+import time
+import hmac
+import hashlib
+import audit
 import logging
+import usage
+import tracing
+import threading
+import session_store
 
 from fdk import response
-from datetime import datetime, timezone
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+profiling.end_import_timing("apigw_authzr")
 
 # Environment variables - read at module load
 OCI_VAULT_PEPPER_OCID = os.environ.get('OCI_VAULT_PEPPER_OCID')
-OCI_CACHE_ENDPOINT = os.environ.get('OCI_CACHE_ENDPOINT')
+# Pepper being rotated out: still accepted for decryption until
+# scripts/rotate_session_keys.py has re-encrypted every session
+OCI_VAULT_PEPPER_PREVIOUS_OCID = os.environ.get('OCI_VAULT_PEPPER_PREVIOUS_OCID')
 SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'session_id')
+SESSION_COOKIE_PREFIX = SESSION_COOKIE_NAME + '='
+
+# Request size limits: oversized input is denied before any parsing
+AUTHZ_MAX_BODY_BYTES = int(os.environ.get('AUTHZ_MAX_BODY_BYTES', '16384'))
+AUTHZ_MAX_COOKIE_BYTES = int(os.environ.get('AUTHZ_MAX_COOKIE_BYTES', '8192'))
+
+# Sealed session cookies (oidc_callback SESSION_MODE=stateless) are verified
+# locally; revocations come from a copy of revoked_sessions synced at most
+# every REVOCATION_SYNC_SECONDS. If syncing fails for longer than
+# REVOCATION_MAX_STALENESS_SECONDS, sealed cookies are denied.
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', '5'))
+REVOCATION_MAX_STALENESS_SECONDS = float(os.environ.get('REVOCATION_MAX_STALENESS_SECONDS', '60'))
+# Re-read this much before the last sync (writer clock skew, replication lag)
+REVOCATION_SYNC_OVERLAP_SECONDS = 30
+# Sealed cookie field -> session field (as in oidc_callback)
+COOKIE_FIELDS = (('i', 'sid'), ('s', 'sub'), ('e', 'email'), ('n', 'name'), ('u', 'preferred_username'),
+                 ('gn', 'given_name'), ('fn', 'family_name'), ('g', 'groups'), ('t', 'iat_ts'), ('x', 'exp_ts'))
+
+# Local cache of authorization decisions (0 = off). Entries are dropped as
+# soon as a session_invalidations message names the session or its user;
+# while that subscription is down (or has not been heard from recently, e.g.
+# after the container was paused) they are trusted for at most
+# SESSION_CACHE_DISCONNECTED_SECONDS.
+SESSION_CACHE_SECONDS = float(os.environ.get('SESSION_CACHE_SECONDS', '0'))
+SESSION_CACHE_DISCONNECTED_SECONDS = float(os.environ.get('SESSION_CACHE_DISCONNECTED_SECONDS', '5'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+INVALIDATION_HEALTH_CHECK_SECONDS = int(os.environ.get('INVALIDATION_HEALTH_CHECK_SECONDS', '30'))
+# The listener polls every INVALIDATION_POLL_SECONDS; silence longer than
+# INVALIDATION_SILENCE_SECONDS means it is not running (paused container)
+INVALIDATION_POLL_SECONDS = 1.0
+INVALIDATION_SILENCE_SECONDS = 3.0
+
+# Per-principal request rate limit (0 = off). Each container spends tokens
+# from local buckets and every AUTHZ_RATE_SYNC_SECONDS adds its counts to
+# shared per-window counters, charging its buckets for what other
+# containers admitted, so requests never wait on the cache for this.
+AUTHZ_RATE_PER_SEC = float(os.environ.get('AUTHZ_RATE_PER_SEC', '0'))
+AUTHZ_RATE_BURST = int(os.environ.get('AUTHZ_RATE_BURST', '100'))
+AUTHZ_RATE_SYNC_SECONDS = float(os.environ.get('AUTHZ_RATE_SYNC_SECONDS', '2'))
+AUTHZ_RATE_MAX_PRINCIPALS = int(os.environ.get('AUTHZ_RATE_MAX_PRINCIPALS', '10000'))
+# Shared counters restart every window (and expire after two)
+AUTHZ_RATE_WINDOW_SECONDS = 60
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
+# Silent renewal with the session's refresh token (see oidc_callback)
+SESSION_REFRESH_ENABLED = os.environ.get('SESSION_REFRESH_ENABLED', 'false').lower() == 'true'
+SESSION_REFRESH_WINDOW_SECONDS = int(os.environ.get('SESSION_REFRESH_WINDOW_SECONDS', '900'))
+SESSION_REFRESH_LOCK_SECONDS = int(os.environ.get('SESSION_REFRESH_LOCK_SECONDS', '30'))
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '28800'))
+SESSION_MAX_LIFETIME_SECONDS = int(os.environ.get('SESSION_MAX_LIFETIME_SECONDS', '604800'))
+OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
+OCI_VAULT_CLIENT_CREDS_OCID = os.environ.get('OCI_VAULT_CLIENT_CREDS_OCID')
+# Groups resolved through SCIM at login (oidc_callback): renewal keeps them
+# rather than taking the id_token's possibly truncated user_groups claim
+GROUPS_SCIM_ENABLED = os.environ.get('GROUPS_SCIM_ENABLED', 'false').lower() == 'true'
 
 # In-memory cache for secrets
 _secrets_cache = {}
 
+# Decoded pepper bytes, derived once from _secrets_cache
+_pepper = None
+_previous_pepper = None
+
+# Sealed-cookie keys derived from the peppers, and the local copy of
+# revoked_sessions (revocation ref -> revoked at)
+_cookie_keys = None
+_revoked = {}
+_revoked_synced = 0.0
+_revoked_lock = threading.Lock()
+
+# Cached authorizations (revocation ref -> (cached_at, user_ref, exp_ts,
+# response)) and the session_invalidations listener that maintains them.
+# _invalidation_seq counts applied messages, so a lookup that raced with an
+# invalidation is not cached.
+_session_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_invalidation_seq = 0
+_invalidation_listener = None
+_invalidations_connected = False
+_invalidations_heard = 0.0
+
+# Rate-limit buckets (principal ref -> RateBucket, least recently used
+# first) and the thread that reconciles them with the shared counters
+_rate_buckets = OrderedDict()
+_rate_lock = threading.Lock()
+_rate_sync_thread = None
+# Cookie ref -> time its throttled marker expires (one SET per throttled period)
+_throttled = OrderedDict()
+
+# OpenID configuration, fetched on the first renewal
+_openid_config = None
+
+# Shared per-user claims (oidc_callback CLAIMS_DEDUP_ENABLED), cached by
+# content version: a new version is a new key, so entries never go stale
+CLAIMS_CACHE_SIZE = int(os.environ.get('CLAIMS_CACHE_SIZE', '1000'))
+CLAIM_FIELDS = ('email', 'name', 'preferred_username', 'given_name', 'family_name', 'groups', 'raw_claims')
+_claims_cache = OrderedDict()
+
+# Registered lookup script, reused across warm invocations
+_session_lookup = None
+
+# Single round-trip session lookup.
+# KEYS[1] = session:<id>, KEYS[2] = session_owner:<id>
+# ARGV[1] = user epoch key prefix, or '' to skip the per-user reads (cluster
+#           mode: the user's keys live in another slot and are fetched separately)
+# ARGV[2] = current claims version key prefix
+# Returns {encrypted_session, remaining_ttl_ms, current_user_epoch, owner,
+#          current_claims_version}.
+SESSION_LOOKUP_SCRIPT = """
+local blob = redis.call('GET', KEYS[1])
+if not blob then
+    return {false, -2, false, false, false}
+end
+local ttl = redis.call('PTTL', KEYS[1])
+local owner = redis.call('GET', KEYS[2])
+local epoch = false
+local claims = false
+if owner and ARGV[1] ~= '' then
+    epoch = redis.call('GET', ARGV[1] .. owner)
+    claims = redis.call('GET', ARGV[2] .. owner)
+end
+return {blob, ttl, epoch, owner, claims}
+"""
+SESSION_LOOKUP_SHA = hashlib.sha1(SESSION_LOOKUP_SCRIPT.encode('utf-8')).hexdigest()
+
+
+def find_cookie(cookie_header: str, prefix: str = SESSION_COOKIE_PREFIX):
+    """
+    Return the value of one cookie ('name=') without splitting the others.
+
+    The first cookie of that name wins (browsers send the most specific
+    path first). Returns None if the cookie is absent.
+    """
+    start = 0
+    while True:
+        i = cookie_header.find(prefix, start)
+        if i < 0:
+            return None
+        # Must begin the header or follow '; ' (not be the tail of another name)
+        j = i - 1
+        while j >= 0 and cookie_header[j] == ' ':
+            j -= 1
+        if j < 0 or cookie_header[j] == ';':
+            i += len(prefix)
+            end = cookie_header.find(';', i)
+            return (cookie_header[i:end] if end >= 0 else cookie_header[i:]).strip()
+        start = i + 1
+
+
+def get_redis_client():
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
+
+
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
+
+
+def get_vault_secret(secret_ocid: str) -> str:
+    """Retrieve a secret from OCI Vault, decoded once (cached while warm)."""
+    if secret_ocid not in _secrets_cache:
+        import base64
+        content = fetch_secret_bundle_content(secret_ocid)
+        _secrets_cache[secret_ocid] = base64.b64decode(content).decode('utf-8')
+    return _secrets_cache[secret_ocid]
+
+
+def derive_key(session_id: str, pepper: bytes) -> bytes:
+    """Derive the session encryption key from session_id and pepper using HKDF."""
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives import hashes
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=pepper,
+        info=b"session_encryption"
+    )
+    return hkdf.derive(session_id.encode('utf-8'))
+
+
+def encrypt_session(session_data: dict, session_id: str, pepper: bytes) -> bytes:
+    """Encrypt session data using AES-256-GCM (same format as oidc_callback)."""
+    import secrets
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    nonce = secrets.token_bytes(12)
+    return nonce + AESGCM(derive_key(session_id, pepper)).encrypt(nonce, json.dumps(session_data).encode('utf-8'), None)
+
+
+def load_peppers() -> tuple:
+    """Current and previous (or None) pepper bytes, decoded once per container."""
+    global _pepper, _previous_pepper
+    if _pepper is None:
+        import base64
+        if OCI_VAULT_PEPPER_PREVIOUS_OCID:
+            _previous_pepper = base64.b64decode(get_vault_secret(OCI_VAULT_PEPPER_PREVIOUS_OCID))
+        _pepper = base64.b64decode(get_vault_secret(OCI_VAULT_PEPPER_OCID))
+        logger.info(f"Pepper loaded from Vault, length: {len(_pepper)} bytes")
+    return _pepper, _previous_pepper
+
+
+def open_session_cookie(cookie_value: str) -> dict:
+    """Verify and decrypt a sealed session cookie ("<format>.<base64url>") into session fields."""
+    global _cookie_keys
+    import base64
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    if _cookie_keys is None:
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        from cryptography.hazmat.primitives import hashes
+        _cookie_keys = [
+            HKDF(algorithm=hashes.SHA256(), length=32, salt=pepper, info=b"cookie_seal").derive(b"session_cookie")
+            for pepper in load_peppers() if pepper is not None
+        ]
+    cookie_format, sealed = cookie_value.split('.', 1)
+    if cookie_format != "v1":
+        raise ValueError(f"unknown cookie format {cookie_format[:8]}")
+    blob = base64.urlsafe_b64decode(sealed + '=' * (-len(sealed) % 4))
+    for key in _cookie_keys:
+        try:
+            payload = json.loads(AESGCM(key).decrypt(blob[:12], blob[12:], b"v1"))
+            break
+        except InvalidTag:
+            continue
+    else:
+        raise ValueError("sealed cookie does not verify")
+    session_data = {name: payload[short] for short, name in COOKIE_FIELDS if short in payload}
+    session_data['exp'] = datetime.fromtimestamp(session_data['exp_ts'], timezone.utc).isoformat()
+    if 'iat_ts' in session_data:
+        session_data['iat'] = datetime.fromtimestamp(session_data['iat_ts'], timezone.utc).isoformat()
+    return session_data
+
+
+def sync_revocations(now: float):
+    """Merge revoked_sessions entries added since the last sync into the local copy."""
+    global _revoked_synced
+    key = session_store.revoked_sessions_key()
+    if _revoked_synced:
+        since = _revoked_synced - REVOCATION_SYNC_OVERLAP_SECONDS
+    else:
+        since = now - session_store.REVOCATION_RETENTION_SECONDS
+    with tracing.span("redis.sync_revocations"):
+        entries = session_store.get_reader_client().zrangebyscore(key, since, '+inf', withscores=True)
+    for member, revoked_at in entries:
+        _revoked[member.decode('utf-8')] = revoked_at
+    cutoff = now - session_store.REVOCATION_RETENTION_SECONDS
+    for ref in [ref for ref, revoked_at in _revoked.items() if revoked_at < cutoff]:
+        del _revoked[ref]
+    _revoked_synced = now
+
+
+def is_revoked(session_id: str) -> bool:
+    """
+    Check the local copy of revoked_sessions, syncing it first when older
+    than REVOCATION_SYNC_SECONDS. Raises if it cannot be brought within
+    REVOCATION_MAX_STALENESS_SECONDS.
+    """
+    ensure_invalidation_listener()
+    now = time.time()
+    if now - _revoked_synced >= REVOCATION_SYNC_SECONDS:
+        with _revoked_lock:
+            if now - _revoked_synced >= REVOCATION_SYNC_SECONDS:
+                try:
+                    sync_revocations(now)
+                except Exception as e:
+                    logger.warning(f"Revocation sync failed: {str(e)}")
+    if now - _revoked_synced > REVOCATION_MAX_STALENESS_SECONDS:
+        raise RuntimeError("revocation list is stale")
+    return session_store.revocation_ref(session_id) in _revoked
+
+
+def apply_invalidation(message: bytes):
+    """Drop cached state named by a session_invalidations message ("s:<ref>" / "u:<user_ref>" tokens)."""
+    global _invalidation_seq
+    users = set()
+    now = time.time()
+    with _cache_lock:
+        _invalidation_seq += 1
+        for token in message.decode('utf-8').split():
+            kind, _, ref = token.partition(':')
+            if kind == 's':
+                _session_cache.pop(ref, None)
+                if _revoked_synced:
+                    _revoked[ref] = now
+            elif kind == 'u':
+                users.add(ref)
+        if users:
+            for key in [key for key, entry in _session_cache.items() if entry[1] in users]:
+                del _session_cache[key]
+
+
+def drop_cached_sessions():
+    """Forget every cached authorization (messages may have been missed)."""
+    global _invalidation_seq
+    with _cache_lock:
+        _invalidation_seq += 1
+        _session_cache.clear()
+
+
+def listen_invalidations():
+    """Background thread: apply session_invalidations messages, reconnecting with backoff."""
+    global _invalidations_connected, _invalidations_heard
+    backoff = 1
+    while True:
+        pubsub = None
+        try:
+            client = session_store.create_client(
+                health_check_interval=INVALIDATION_HEALTH_CHECK_SECONDS,
+                socket_connect_timeout=5,
+                socket_keepalive=True
+            )
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(session_store.invalidations_channel())
+            # Anything published while disconnected was missed
+            drop_cached_sessions()
+            _invalidations_connected = True
+            backoff = 1
+            logger.info("Subscribed to session invalidations")
+            while True:
+                _invalidations_heard = time.time()
+                message = pubsub.get_message(timeout=INVALIDATION_POLL_SECONDS)
+                if message and message['type'] == 'message':
+                    apply_invalidation(message['data'])
+        except Exception as e:
+            logger.warning(f"Session invalidation subscription lost: {str(e)}")
+        finally:
+            _invalidations_connected = False
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+def ensure_invalidation_listener():
+    """Start the session_invalidations listener once per container."""
+    global _invalidation_listener
+    if _invalidation_listener is None:
+        with _cache_lock:
+            if _invalidation_listener is None:
+                _invalidation_listener = threading.Thread(
+                    target=listen_invalidations, name="session-invalidations", daemon=True
+                )
+                _invalidation_listener.start()
+
+
+def cached_authorization(session_id: str):
+    """A recent success response for this session, or None."""
+    ensure_invalidation_listener()
+    now = time.time()
+    if _invalidations_connected and now - _invalidations_heard < INVALIDATION_SILENCE_SECONDS:
+        max_age = SESSION_CACHE_SECONDS
+    else:
+        max_age = min(SESSION_CACHE_SECONDS, SESSION_CACHE_DISCONNECTED_SECONDS)
+    key = session_store.revocation_ref(session_id)
+    with _cache_lock:
+        entry = _session_cache.get(key)
+        if entry is None:
+            return None
+        cached_at, _, exp_ts, success_response = entry
+        if now - cached_at > max_age or now > exp_ts:
+            del _session_cache[key]
+            return None
+        _session_cache.move_to_end(key)
+    return success_response
+
+
+def remember_authorization(session_id: str, session_data: dict, exp_ts, success_response: dict, seq: int):
+    """Cache a success response, unless an invalidation arrived since the lookup began (seq)."""
+    with _cache_lock:
+        if seq != _invalidation_seq:
+            return
+        _session_cache[session_store.revocation_ref(session_id)] = (
+            time.time(), user_ref(session_data.get('sub') or ''),
+            exp_ts if exp_ts is not None else float('inf'), success_response
+        )
+        while len(_session_cache) > SESSION_CACHE_SIZE:
+            _session_cache.popitem(last=False)
+
+
+class RateBucket:
+    """Token bucket for one principal, plus its share of the current shared window."""
+
+    __slots__ = ('tokens', 'updated_at', 'pending', 'window', 'pushed', 'others')
+
+    def __init__(self, now: float):
+        self.tokens = float(AUTHZ_RATE_BURST)
+        self.updated_at = now
+        self.pending = 0   # admitted here, not yet added to the shared counter
+        self.window = 0
+        self.pushed = 0    # added to the shared counter this window
+        self.others = 0    # other containers' count this window, already charged
+
+
+def take_rate_token(principal: str) -> int:
+    """Spend one of the principal's tokens; 0, or the seconds until one is available."""
+    ensure_rate_sync()
+    key = user_ref(principal)
+    now = time.time()
+    with _rate_lock:
+        bucket = _rate_buckets.get(key)
+        if bucket is None:
+            bucket = _rate_buckets[key] = RateBucket(now)
+            while len(_rate_buckets) > AUTHZ_RATE_MAX_PRINCIPALS:
+                _rate_buckets.popitem(last=False)
+        else:
+            _rate_buckets.move_to_end(key)
+            bucket.tokens = min(AUTHZ_RATE_BURST, bucket.tokens + (now - bucket.updated_at) * AUTHZ_RATE_PER_SEC)
+            bucket.updated_at = now
+        if bucket.tokens < 1:
+            return max(1, math.ceil((1 - bucket.tokens) / AUTHZ_RATE_PER_SEC))
+        bucket.tokens -= 1
+        bucket.pending += 1
+    return 0
+
+
+def mark_throttled(cookie_value: str, retry_after: int):
+    """
+    Record that a session cookie is throttled, for retry_after seconds.
+
+    The gateway turns the denial into a redirect to /auth/login; a new
+    session would be throttled too (the bucket is per principal), so
+    oidc_authn answers 429 while the marker lives instead of sending the
+    browser through the IdP.
+    """
+    ref = session_store.revocation_ref(cookie_value)
+    now = time.time()
+    with _rate_lock:
+        if _throttled.get(ref, 0) > now:
+            return
+        _throttled[ref] = now + retry_after
+        _throttled.move_to_end(ref)
+        while len(_throttled) > AUTHZ_RATE_MAX_PRINCIPALS:
+            _throttled.popitem(last=False)
+    try:
+        get_redis_client().set(session_store.authz_throttled_key(ref), b"1", ex=retry_after)
+    except Exception as e:
+        logger.warning(f"Failed to record throttled session: {str(e)}")
 
-def parse_cookies(cookie_header: str) -> dict:
-    """Parse Cookie header into dict."""
-    cookies = {}
-    if cookie_header:
-        for item in cookie_header.split(';'):
-            item = item.strip()
-            if '=' in item:
-                key, value = item.split('=', 1)
-                cookies[key.strip()] = value.strip()
-    return cookies
 
+def sync_rate_limits():
+    """
+    Add local counts to the shared per-window counters (one pipeline for all
+    principals seen this window) and charge local buckets for the requests
+    other containers admitted since the last sync.
+    """
+    now = time.time()
+    window = int(now // AUTHZ_RATE_WINDOW_SECONDS)
+    batch = []
+    with _rate_lock:
+        for key, bucket in _rate_buckets.items():
+            if bucket.window != window:
+                bucket.window, bucket.pushed, bucket.others = window, 0, 0
+            # INCRBY 0 still reads what other containers admitted
+            if bucket.pending or now - bucket.updated_at < AUTHZ_RATE_WINDOW_SECONDS:
+                batch.append((key, bucket.pending))
+                bucket.pushed += bucket.pending
+                bucket.pending = 0
+    if not batch:
+        return
 
-def authorize_success(session_data: dict, session_id: str) -> dict:
+    pipe = get_redis_client().pipeline(transaction=False)
+    for key, count in batch:
+        counter = session_store.authz_rate_key(key, window)
+        pipe.incrby(counter, count)
+        pipe.expire(counter, 2 * AUTHZ_RATE_WINDOW_SECONDS)
+    try:
+        results = pipe.execute()
+    except Exception:
+        # Keep the counts for the next sync
+        with _rate_lock:
+            for key, count in batch:
+                bucket = _rate_buckets.get(key)
+                if bucket is not None and bucket.window == window:
+                    bucket.pushed -= count
+                    bucket.pending += count
+        raise
+
+    now = time.time()
+    with _rate_lock:
+        for (key, _), total in zip(batch, results[0::2]):
+            bucket = _rate_buckets.get(key)
+            if bucket is None or bucket.window != window:
+                continue
+            others = int(total) - bucket.pushed
+            if others > bucket.others:
+                bucket.tokens = min(AUTHZ_RATE_BURST, bucket.tokens + (now - bucket.updated_at) * AUTHZ_RATE_PER_SEC)
+                bucket.updated_at = now
+                # Never more than one burst in debt, so a flood elsewhere
+                # does not lock the principal out for minutes
+                bucket.tokens = max(-AUTHZ_RATE_BURST, bucket.tokens - (others - bucket.others))
+                bucket.others = others
+
+
+def rate_sync_worker():
+    """Background thread: sync_rate_limits every AUTHZ_RATE_SYNC_SECONDS (failures are retried)."""
+    while True:
+        time.sleep(AUTHZ_RATE_SYNC_SECONDS)
+        try:
+            sync_rate_limits()
+        except Exception as e:
+            logger.warning(f"Rate limit sync failed: {str(e)}")
+
+
+def ensure_rate_sync():
+    """Start the rate-limit sync thread once per container."""
+    global _rate_sync_thread
+    if _rate_sync_thread is None:
+        with _rate_lock:
+            if _rate_sync_thread is None:
+                _rate_sync_thread = threading.Thread(target=rate_sync_worker, name="authz-rate-sync", daemon=True)
+                _rate_sync_thread.start()
+
+
+def authorized(ctx, success_response: dict, cookie_value: str):
+    """Return a success response, or a rate_limited denial when the principal is over its limit."""
+    retry_after = take_rate_token(success_response['principal']) if AUTHZ_RATE_PER_SEC > 0 else 0
+    if retry_after:
+        logger.info(f"Rate limit exceeded: {user_ref(success_response['principal'])[:8]}...")
+        mark_throttled(cookie_value, retry_after)
+        success_response = authorize_failure("rate_limited")
+    elif usage.ENABLED:
+        context = success_response['context']
+        usage.count("authz.allow", user=user_ref(context['sub'] or success_response['principal']),
+                    session=session_store.revocation_ref(context['session_id']))
+    return response.Response(
+        ctx,
+        response_data=json.dumps(success_response),
+        status_code=200,
+        headers={"Content-Type": "application/json"}
+    )
+
+
+def authorize_sealed_cookie(ctx, cookie_value: str):
+    """Authorize a sealed session cookie without reading the session from the cache."""
+    try:
+        session_data = open_session_cookie(cookie_value)
+    except Exception as e:
+        logger.info(f"Invalid sealed session cookie: {str(e)}")
+        reason = "vault_error" if _pepper is None else "invalid_session"
+        return response.Response(
+            ctx,
+            response_data=json.dumps(authorize_failure(reason)),
+            status_code=200,
+            headers={"Content-Type": "application/json"}
+        )
+
+    session_id = session_data.get('sid', '')
+    reason = None
+    if time.time() > session_data['exp_ts']:
+        reason = "session_expired"
+    else:
+        try:
+            if is_revoked(session_id):
+                reason = "session_revoked"
+        except Exception as e:
+            logger.error(f"Cannot check revocations: {str(e)}")
+            reason = "cache_error"
+    if reason:
+        logger.info(f"Sealed session cookie denied ({reason}): {session_id[:8]}...")
+        return response.Response(
+            ctx,
+            response_data=json.dumps(authorize_failure(reason)),
+            status_code=200,
+            headers={"Content-Type": "application/json"}
+        )
+
+    success_response = authorize_success(session_data, session_id)
+    logger.debug("Authorized %s until %s (sealed cookie)", success_response['principal'], success_response['expiresAt'])
+    return authorized(ctx, success_response, cookie_value)
+
+
+def decrypt_session(encrypted_session: bytes, session_id: str, pepper: bytes) -> dict:
+    """Decrypt session data (12-byte nonce, then AES-256-GCM ciphertext)."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return json.loads(AESGCM(derive_key(session_id, pepper)).decrypt(encrypted_session[:12], encrypted_session[12:], None))
+
+
+def _post_form(url: str, form: dict) -> tuple:
+    """POST a form to the IdP; returns (status, parsed JSON body)."""
+    import urllib.request
+    import urllib.error
+    from urllib.parse import urlencode
+    request = urllib.request.Request(url, data=urlencode(form).encode('utf-8'), method='POST')
+    request.add_header('Content-Type', 'application/x-www-form-urlencoded')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read())
+        except ValueError:
+            return e.code, {}
+
+
+def get_openid_configuration() -> dict:
+    """Fetch the Identity Domain's OpenID configuration (cached while warm)."""
+    global _openid_config
+    if _openid_config is None:
+        import urllib.request
+        config_url = f"{OCI_IAM_BASE_URL}/.well-known/openid-configuration"
+        with tracing.span("idp.discovery", **{"http.url": config_url}):
+            with urllib.request.urlopen(config_url, timeout=10) as resp:
+                _openid_config = json.loads(resp.read())
+    return _openid_config
+
+
+def decode_id_token(id_token: str, issuer: str, client_id: str) -> dict:
+    """
+    Decode a refreshed id_token and check iss and aud.
+
+    The signature is not verified, as in oidc_callback: the token comes
+    straight from the token endpoint over TLS.
+    """
+    import base64
+    payload = id_token.split('.')[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    aud = claims.get('aud')
+    if claims.get('iss') != issuer or client_id not in (aud if isinstance(aud, list) else [aud]):
+        raise ValueError("refreshed id_token has unexpected iss or aud")
+    return claims
+
+
+def needs_refresh(session_data: dict) -> bool:
+    """True when a renewable session is within the refresh window and below its maximum lifetime."""
+    if not session_data.get('refresh_token') or not session_data.get('exp') or not session_data.get('iat'):
+        return False
+    now = time.time()
+    exp_ts = session_data.get('exp_ts') or datetime.fromisoformat(session_data['exp'].replace('Z', '+00:00')).timestamp()
+    remaining = exp_ts - now
+    if remaining >= SESSION_REFRESH_WINDOW_SECONDS:
+        return False
+    login = datetime.fromisoformat(session_data['iat'].replace('Z', '+00:00')).timestamp()
+    return login + SESSION_MAX_LIFETIME_SECONDS - now > remaining
+
+
+def refresh_session(session_id: str, session_data: dict, pepper: bytes):
+    """
+    Renew a session with its refresh token and store the extended session.
+
+    Only the invocation that wins session_refresh_lock:<id> (SET NX) calls
+    the IdP; concurrent requests keep using the current session, which is
+    still valid. The new expiry is capped at SESSION_MAX_LIFETIME_SECONDS
+    after login. Returns the renewed session data, or None if this
+    invocation did not renew.
+    """
+    r = get_redis_client()
+    if not r.set(session_store.refresh_lock_key(session_id), b"1", nx=True, ex=SESSION_REFRESH_LOCK_SECONDS):
+        return None
+
+    creds = json.loads(get_vault_secret(OCI_VAULT_CLIENT_CREDS_OCID))
+    openid_config = get_openid_configuration()
+    token_endpoint = openid_config['token_endpoint']
+    with tracing.span("idp.token_refresh", **{"http.url": token_endpoint}) as s:
+        status, tokens = _post_form(token_endpoint, {
+            'grant_type': 'refresh_token',
+            'refresh_token': session_data['refresh_token'],
+            'client_id': creds['client_id'],
+            'client_secret': creds['client_secret'],
+        })
+        if s is not None:
+            s.set("http.status_code", status)
+
+    session_key = session_store.session_key(session_id)
+    owner = user_ref(session_data['sub'])
+    deduplicated = 'claims_version' in session_data
+    if status != 200:
+        logger.warning(f"Session refresh rejected by IdP ({status} {tokens.get('error', '')}): {session_id[:8]}...")
+        if tokens.get('error') == 'invalid_grant':
+            # Refresh token revoked or expired: stop retrying, let the session run out
+            stored = {k: v for k, v in session_data.items() if k != 'refresh_token'}
+            if deduplicated:
+                stored = split_claims(stored, owner, pepper)[0]
+            r.set(session_key, encrypt_session(stored, session_id, pepper), xx=True, keepttl=True)
+        return None
+
+    renewed = dict(session_data)
+    if tokens.get('id_token'):
+        claims = decode_id_token(tokens['id_token'], openid_config['issuer'], creds['client_id'])
+        if claims.get('sub') != session_data.get('sub'):
+            raise ValueError("refreshed id_token is for a different subject")
+        renewed.update({
+            'email': claims.get('user_email') or claims.get('email') or renewed.get('email', ''),
+            'name': claims.get('user_displayname') or claims.get('name') or renewed.get('name', ''),
+            'given_name': claims.get('user_given_name') or claims.get('given_name') or renewed.get('given_name', ''),
+            'family_name': claims.get('user_family_name') or claims.get('family_name') or renewed.get('family_name', ''),
+            'id_token': tokens['id_token'],
+            'raw_claims': list(claims.keys()),
+        })
+        if not GROUPS_SCIM_ENABLED:
+            renewed['groups'] = claims.get('user_groups') or claims.get('groups') or renewed.get('groups', [])
+    # Identity Domains may rotate the refresh token
+    renewed['refresh_token'] = tokens.get('refresh_token') or session_data['refresh_token']
+
+    now = datetime.now(timezone.utc)
+    login = datetime.fromisoformat(session_data['iat'].replace('Z', '+00:00'))
+    ttl = int(min(SESSION_TTL_SECONDS, (login - now).total_seconds() + SESSION_MAX_LIFETIME_SECONDS))
+    if ttl <= 0:
+        return None
+    new_exp = now + timedelta(seconds=ttl)
+    renewed['exp'] = new_exp.isoformat()
+    renewed['exp_ts'] = int(new_exp.timestamp())
+    renewed['refreshed_at'] = now.isoformat()
+
+    stored = renewed
+    if deduplicated:
+        stored, version, claims_blob = split_claims(renewed, owner, pepper)
+        renewed['claims_version'] = version
+
+    # XX: never resurrect a session that was logged out meanwhile
+    if not r.set(session_key, encrypt_session(stored, session_id, pepper), xx=True, ex=ttl):
+        return None
+    pipe = r.pipeline(transaction=False)
+    if deduplicated:
+        # Full TTL, not the capped one: the user's other sessions may outlive this one
+        pipe.set(session_store.user_claims_key(owner, version), claims_blob, ex=SESSION_TTL_SECONDS)
+        pipe.set(session_store.user_claims_current_key(owner), version, ex=SESSION_TTL_SECONDS)
+    pipe.expire(session_store.owner_key(session_id), ttl)
+    index_key = session_store.user_sessions_key(owner)
+    pipe.zadd(index_key, {session_id: int(new_exp.timestamp())}, xx=True)
+    pipe.expire(index_key, ttl, gt=True)
+    if renewed.get('id_token'):
+        sid = decode_id_token(renewed['id_token'], openid_config['issuer'], creds['client_id']).get('sid')
+        if sid:
+            sid_ref = hashlib.sha256(sid.encode('utf-8')).hexdigest()[:32]
+            pipe.expire(session_store.idp_sessions_key(sid_ref), ttl, gt=True)
+    pipe.execute()
+    logger.info(f"Session renewed until {renewed['exp']}: {session_id[:8]}...")
+    audit.emit("apigw_authzr", "session.renewed", user=owner, session=audit.ref(session_id), exp=renewed['exp'])
+    return renewed
+
+
+def user_ref(sub: str) -> str:
+    """Stable, non-reversible per-user key component derived from sub."""
+    return hashlib.sha256(sub.encode('utf-8')).hexdigest()[:32]
+
+
+def derive_claims_keys(owner: str, pepper: bytes) -> tuple:
+    """Per-user (encryption key, version MAC key) for shared claims, as in oidc_callback."""
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives import hashes
+    key_material = HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=pepper,
+        info=b"user_claims"
+    ).derive(owner.encode('utf-8'))
+    return key_material[:32], key_material[32:]
+
+
+def seal_claims(claims: dict, owner: str, pepper: bytes) -> tuple:
+    """Encrypt a user's shared claims; returns (version, blob) like oidc_callback."""
+    import secrets
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    enc_key, mac_key = derive_claims_keys(owner, pepper)
+    plaintext = json.dumps(claims, sort_keys=True).encode('utf-8')
+    version = hmac.new(mac_key, plaintext, hashlib.sha256).hexdigest()[:16]
+    nonce = secrets.token_bytes(12)
+    return version, nonce + AESGCM(enc_key).encrypt(nonce, plaintext, version.encode('utf-8'))
+
+
+def load_claims(owner: str, version: str, pepper: bytes) -> dict:
+    """Get a user's shared claims by version (in-process LRU, then the cache)."""
+    key = session_store.user_claims_key(owner, version)
+    claims = _claims_cache.get(key)
+    if claims is not None:
+        _claims_cache.move_to_end(key)
+        return claims
+
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    with tracing.span("redis.get_claims"):
+        blob = session_store.get_reader_client().get(key)
+        if blob is None and session_store.READ_FROM_REPLICAS:
+            blob = get_redis_client().get(key)
+    if blob is None:
+        raise KeyError(f"claims version {version} not found")
+    try:
+        enc_key, _ = derive_claims_keys(owner, pepper)
+        claims = json.loads(AESGCM(enc_key).decrypt(blob[:12], blob[12:], version.encode('utf-8')))
+    except InvalidTag:
+        if _previous_pepper is None:
+            raise
+        enc_key, _ = derive_claims_keys(owner, _previous_pepper)
+        claims = json.loads(AESGCM(enc_key).decrypt(blob[:12], blob[12:], version.encode('utf-8')))
+
+    _claims_cache[key] = claims
+    while len(_claims_cache) > CLAIMS_CACHE_SIZE:
+        _claims_cache.popitem(last=False)
+    return claims
+
+
+def split_claims(session_data: dict, owner: str, pepper: bytes) -> tuple:
+    """Split merged session data into (session fields with claims_version, version, sealed claims)."""
+    stored = {k: v for k, v in session_data.items() if k not in CLAIM_FIELDS}
+    version, blob = seal_claims({field: session_data.get(field) for field in CLAIM_FIELDS}, owner, pepper)
+    stored['claims_version'] = version
+    return stored, version, blob
+
+
+def _run_lookup(r, session_id: str, read_only: bool = False) -> tuple:
+    """Run the lookup script on one client; read_only uses EVALSHA_RO so replicas accept it."""
+    global _session_lookup
+    keys = [session_store.session_key(session_id), session_store.owner_key(session_id)]
+    args = ["" if session_store.CLUSTER_MODE else "user_epoch:", "user_claims_current:"]
+    if read_only:
+        from redis.exceptions import NoScriptError
+        try:
+            result = r.evalsha_ro(SESSION_LOOKUP_SHA, len(keys), *keys, *args)
+        except NoScriptError:
+            result = r.eval_ro(SESSION_LOOKUP_SCRIPT, len(keys), *keys, *args)
+    else:
+        if _session_lookup is None:
+            _session_lookup = r.register_script(SESSION_LOOKUP_SCRIPT)
+        result = _session_lookup(keys=keys, args=args)
+    encrypted_session, ttl_ms, epoch, owner, claims_version = result
+    if session_store.CLUSTER_MODE and encrypted_session and owner:
+        owner = owner.decode('utf-8')
+        epoch, claims_version = r.mget(session_store.user_epoch_key(owner), session_store.user_claims_current_key(owner))
+    claims_version = claims_version.decode('utf-8') if claims_version else None
+    return encrypted_session, int(ttl_ms), int(epoch) if epoch else 0, claims_version
+
+
+def lookup_session(session_id: str) -> tuple:
+    """
+    Fetch session, remaining TTL and the owner's revocation epoch.
+
+    One round trip on a standalone cache. In cluster mode the session and
+    owner keys share a slot but the user's epoch and claims pointer do not,
+    so a found session costs a second round trip (MGET).
+
+    With OCI_CACHE_READER_ENDPOINT set the lookup goes to a replica first.
+    A miss (or a replica error) is retried on the primary, because a session
+    created moments ago by oidc_callback may not have replicated yet.
+
+    Returns (encrypted_session, ttl_ms, current_epoch, claims_version).
+    encrypted_session is None when the session does not exist;
+    claims_version is the user's current shared claims version, if any.
+    """
+    if session_store.READ_FROM_REPLICAS:
+        try:
+            with tracing.span("redis.session_lookup.replica"):
+                result = _run_lookup(session_store.get_reader_client(), session_id, read_only=True)
+            if result[0]:
+                return result
+        except Exception as e:
+            logger.warning(f"Replica lookup failed, using primary: {str(e)}")
+    return _run_lookup(get_redis_client(), session_id)
+
+
+def authorize_success(session_data: dict, session_id: str, ttl_ms: int = -1) -> dict:
     """Return successful authorization response."""
     # Build groups as comma-separated string for header compatibility
     groups = session_data.get("groups", [])
@@ -60,9 +919,10 @@ def authorize_success(session_data: dict, session_id: str) -> dict:
     # Ensure expiresAt is a valid ISO datetime string
     expires_at = session_data.get("exp", "")
     if not expires_at:
-        # Set a default expiry 8 hours from now if not provided
+        # Fall back to the key's remaining TTL, or 8 hours if it has none
         from datetime import datetime, timedelta, timezone
-        expires_at = (datetime.now(timezone.utc) + timedelta(hours=8)).isoformat()
+        remaining = timedelta(milliseconds=ttl_ms) if ttl_ms > 0 else timedelta(hours=8)
+        expires_at = (datetime.now(timezone.utc) + remaining).isoformat()
 
     return {
         "active": True,
@@ -86,39 +946,70 @@ def authorize_success(session_data: dict, session_id: str) -> dict:
 
 
 def authorize_failure(reason: str = "invalid_token") -> dict:
-    """Return authorization failure response."""
+    """Return authorization failure response (and buffer an authz.deny audit event)."""
+    audit.emit("apigw_authzr", "authz.deny", reason=reason)
+    usage.count(f"authz.deny.{reason}")
     return {
         "active": False,
         "wwwAuthenticate": f'Bearer realm="app", error="{reason}"'
     }
 
 
+@profiling.profiled("apigw_authzr")
+@tracing.traced("apigw_authzr")
 def handler(ctx, data: io.BytesIO = None):
     """Handle session authorization."""
-    logger.info("=== AUTHORIZER INVOKED ===")
     try:
-        # Parse input
+        # Parse input (bounded; only the Cookie and traceparent fields are used)
+        raw = data.getvalue() if data else b""
+        if len(raw) > AUTHZ_MAX_BODY_BYTES:
+            logger.warning(f"Authorizer input too large: {len(raw)} bytes")
+            return response.Response(
+                ctx,
+                response_data=json.dumps(authorize_failure("request_too_large")),
+                status_code=200,
+                headers={"Content-Type": "application/json"}
+            )
         body = {}
-        if data:
-            raw = data.getvalue()
-            logger.info(f"Raw input length: {len(raw) if raw else 0}")
-            if raw:
-                try:
-                    body = json.loads(raw)
-                    logger.info(f"Parsed body keys: {list(body.keys())}")
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse request body as JSON")
+        if raw:
+            try:
+                body = json.loads(raw)
+            except json.JSONDecodeError:
+                logger.warning("Failed to parse request body as JSON")
 
-        auth_data = body.get('data', body)
-        logger.info(f"auth_data keys: {list(auth_data.keys()) if isinstance(auth_data, dict) else 'not a dict'}")
+        # Only API Gateway's multi-argument authorizer payload is accepted;
+        # auth_router also relies on this for invocations without a URL
+        if not isinstance(body, dict) or body.get('type') != "USER_DEFINED":
+            logger.warning("Authorizer input is not a USER_DEFINED payload")
+            return response.Response(
+                ctx,
+                response_data=json.dumps(authorize_failure("invalid_request")),
+                status_code=200,
+                headers={"Content-Type": "application/json"}
+            )
 
-        # Extract headers (handle both case variations)
-        cookie_header = auth_data.get('Cookie', auth_data.get('cookie', ''))
-        user_agent = auth_data.get('User-Agent', auth_data.get('userAgent', ''))
+        auth_data = body.get('data', body)
+        if not isinstance(auth_data, dict):
+            auth_data = {}
+        traceparent = auth_data.get('traceparent')
+        if traceparent:
+            tracing.continue_from(traceparent)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Authorizer input: %d bytes, keys %s", len(raw), list(auth_data))
 
-        # Parse cookies and get session_id
-        cookies = parse_cookies(cookie_header)
-        session_id = cookies.get(SESSION_COOKIE_NAME)
+        # The deployment maps the header to "Cookie"; "cookie" is a fallback
+        cookie_header = auth_data.get('Cookie')
+        if cookie_header is None:
+            cookie_header = auth_data.get('cookie') or ''
+        if len(cookie_header) > AUTHZ_MAX_COOKIE_BYTES:
+            logger.warning(f"Cookie header too large: {len(cookie_header)} bytes")
+            return response.Response(
+                ctx,
+                response_data=json.dumps(authorize_failure("request_too_large")),
+                status_code=200,
+                headers={"Content-Type": "application/json"}
+            )
+        session_id = find_cookie(cookie_header) if cookie_header else None
 
         if not session_id:
             logger.info("No session cookie found")
@@ -129,26 +1020,26 @@ def handler(ctx, data: io.BytesIO = None):
                 headers={"Content-Type": "application/json"}
             )
 
+        # Sealed session cookie: verified locally, the cache is only read
+        # for revocations (periodically, not per request)
+        if '.' in session_id:
+            return authorize_sealed_cookie(ctx, session_id)
+
+        # Recently authorized (SESSION_CACHE_SECONDS); revocations reach the
+        # cache through session_invalidations
+        invalidation_seq = _invalidation_seq
+        if SESSION_CACHE_SECONDS > 0:
+            cached = cached_authorization(session_id)
+            if cached is not None:
+                return authorized(ctx, cached, session_id)
+
         # === LAZY IMPORTS - only loaded when session exists ===
-        import base64
-        import hashlib
-        import redis
-        import oci
-        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-        from cryptography.hazmat.primitives import hashes
-        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.exceptions import InvalidTag
 
-        # Get session from cache
+        # Get session, TTL and revocation epoch from cache (single round trip)
         try:
-            r = redis.Redis(
-                host=OCI_CACHE_ENDPOINT,
-                port=6379,
-                ssl=True,
-                ssl_cert_reqs="required",
-                decode_responses=False
-            )
-            encrypted_session = r.get(f"session:{session_id}")
-            r.close()
+            with tracing.span("redis.session_lookup"):
+                encrypted_session, ttl_ms, current_epoch, claims_version = lookup_session(session_id)
         except Exception as e:
             logger.error(f"Redis connection failed: {str(e)}")
             return response.Response(
@@ -167,20 +1058,11 @@ def handler(ctx, data: io.BytesIO = None):
                 headers={"Content-Type": "application/json"}
             )
 
-        logger.info(f"Session FOUND in cache, length: {len(encrypted_session)} bytes")
+        logger.debug("Session found in cache, length: %d bytes", len(encrypted_session))
 
-        # Get pepper from Vault
+        # Get pepper from Vault (decoded once per container)
         try:
-            logger.info(f"Getting pepper, cached: {OCI_VAULT_PEPPER_OCID in _secrets_cache}")
-            if OCI_VAULT_PEPPER_OCID not in _secrets_cache:
-                signer = oci.auth.signers.get_resource_principals_signer()
-                client = oci.secrets.SecretsClient({}, signer=signer)
-                resp = client.get_secret_bundle(OCI_VAULT_PEPPER_OCID)
-                content = resp.data.secret_bundle_content.content
-                _secrets_cache[OCI_VAULT_PEPPER_OCID] = base64.b64decode(content).decode('utf-8')
-                logger.info(f"Pepper loaded from Vault, length after first decode: {len(_secrets_cache[OCI_VAULT_PEPPER_OCID])}")
-            pepper = base64.b64decode(_secrets_cache[OCI_VAULT_PEPPER_OCID])
-            logger.info(f"Pepper ready, length: {len(pepper)} bytes")
+            pepper, previous_pepper = load_peppers()
         except Exception as e:
             logger.error(f"Failed to get pepper from Vault: {str(e)}", exc_info=True)
             return response.Response(
@@ -192,24 +1074,13 @@ def handler(ctx, data: io.BytesIO = None):
 
         # Decrypt session
         try:
-            logger.info("Starting session decryption...")
-            # Derive key using HKDF
-            hkdf = HKDF(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=pepper,
-                info=b"session_encryption"
-            )
-            key = hkdf.derive(session_id.encode('utf-8'))
-            logger.info("Key derived successfully")
-
-            # Decrypt with AES-GCM
-            nonce = encrypted_session[:12]
-            ciphertext = encrypted_session[12:]
-            aesgcm = AESGCM(key)
-            plaintext = aesgcm.decrypt(nonce, ciphertext, None)
-            session_data = json.loads(plaintext.decode('utf-8'))
-            logger.info(f"Session decrypted successfully, sub: {session_data.get('sub', 'N/A')}")
+            try:
+                session_data = decrypt_session(encrypted_session, session_id, pepper)
+            except InvalidTag:
+                if previous_pepper is None:
+                    raise
+                # Sealed before a pepper rotation and not migrated yet
+                session_data = decrypt_session(encrypted_session, session_id, previous_pepper)
         except Exception as e:
             logger.error(f"Failed to decrypt session: {str(e)}", exc_info=True)
             return response.Response(
@@ -219,11 +1090,12 @@ def handler(ctx, data: io.BytesIO = None):
                 headers={"Content-Type": "application/json"}
             )
 
-        # Check expiration
-        exp = session_data.get('exp')
-        if exp:
-            exp_dt = datetime.fromisoformat(exp.replace('Z', '+00:00'))
-            if datetime.now(timezone.utc) > exp_dt:
+        # Check expiration (integer exp_ts; ISO exp for sessions created before it)
+        exp_ts = session_data.get('exp_ts')
+        if exp_ts is None and session_data.get('exp'):
+            exp_ts = datetime.fromisoformat(session_data['exp'].replace('Z', '+00:00')).timestamp()
+        if exp_ts is not None:
+            if time.time() > exp_ts:
                 logger.info("Session expired")
                 return response.Response(
                     ctx,
@@ -232,7 +1104,47 @@ def handler(ctx, data: io.BytesIO = None):
                     headers={"Content-Type": "application/json"}
                 )
 
-        # Validate session binding (disabled for POC - UA handling differs between callback and authorizer)
+        # Check per-user revocation epoch ("sign out all devices")
+        if int(session_data.get('epoch', 0)) < current_epoch:
+            logger.info(f"Session revoked by user epoch {current_epoch}: {session_id[:8]}...")
+            return response.Response(
+                ctx,
+                response_data=json.dumps(authorize_failure("session_revoked")),
+                status_code=200,
+                headers={"Content-Type": "application/json"}
+            )
+
+        # Merge the user's shared claims (deduplicated sessions carry only a
+        # version; the current pointer wins so claim updates reach every session)
+        if session_data.get('claims_version'):
+            try:
+                session_data.update(load_claims(
+                    user_ref(session_data['sub']),
+                    claims_version or session_data['claims_version'],
+                    pepper
+                ))
+            except Exception as e:
+                logger.error(f"Failed to load shared claims: {str(e)}")
+                return response.Response(
+                    ctx,
+                    response_data=json.dumps(authorize_failure("invalid_session")),
+                    status_code=200,
+                    headers={"Content-Type": "application/json"}
+                )
+
+        # Silently renew a session close to expiry (failures keep the current one)
+        if SESSION_REFRESH_ENABLED and needs_refresh(session_data):
+            try:
+                with tracing.span("session.refresh"):
+                    renewed = refresh_session(session_id, session_data, pepper)
+                if renewed:
+                    session_data = renewed
+                    ttl_ms = -1
+            except Exception as e:
+                logger.warning(f"Session refresh failed: {str(e)}")
+
+        # Validate session binding (disabled for POC - UA handling differs between callback and authorizer;
+        # re-enabling it needs user_agent = auth_data.get('User-Agent', '') above)
         # stored_ua_hash = session_data.get('ua_hash', '')
         # if stored_ua_hash and user_agent:
         #     current_ua_hash = hashlib.sha256(user_agent.encode('utf-8')).hexdigest()[:16]
@@ -248,19 +1160,12 @@ def handler(ctx, data: io.BytesIO = None):
         #         )
 
         # Success
-        logger.info(f"Building success response for user: {session_data.get('sub', 'unknown')}")
-        success_response = authorize_success(session_data, session_id)
-        logger.info(f"Success response principal: {success_response.get('principal')}")
-        logger.info(f"Success response expiresAt: {success_response.get('expiresAt')}")
-        response_json = json.dumps(success_response)
-        logger.info(f"Response JSON length: {len(response_json)}")
-        logger.info("=== RETURNING SUCCESS ===")
-        return response.Response(
-            ctx,
-            response_data=response_json,
-            status_code=200,
-            headers={"Content-Type": "application/json"}
-        )
+        success_response = authorize_success(session_data, session_id, ttl_ms)
+        logger.debug("Authorized %s until %s", success_response['principal'], success_response['expiresAt'])
+        if SESSION_CACHE_SECONDS > 0:
+            remember_authorization(session_id, session_data, session_data.get('exp_ts', exp_ts),
+                                   success_response, invalidation_seq)
+        return authorized(ctx, success_response, session_id)
 
     except Exception as e:
         logger.error(f"Error in session_authorizer: {str(e)}", exc_info=True)
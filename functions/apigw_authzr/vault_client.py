@@ -0,0 +1,134 @@
+"""
+Lightweight Vault Secrets Client
+
+Fetches secret bundles from OCI Vault using the function's resource principal
+without importing the OCI SDK (a large share of cold-start time and memory).
+Implements only what the functions use: resource principal v2.2 request
+signing and GET /20190301/secretbundles/{secretId}.
+
+Enabled with VAULT_CLIENT=lite. This module is copied verbatim into every
+function directory that reads secrets. Keep the copies identical.
+
+Configuration (environment):
+    OCI_RESOURCE_PRINCIPAL_RPST         RPST token, or absolute path to it (set by OCI Functions)
+    OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM  Session private key PEM, or absolute path to it
+    OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM_PASSPHRASE  Optional passphrase, or path to it
+    OCI_RESOURCE_PRINCIPAL_REGION       Region identifier, e.g. us-chicago-1
+    VAULT_SECRETS_ENDPOINT              Override the secrets endpoint (e.g. a local stand-in)
+    VAULT_REALM_DOMAIN                  Realm domain (default oraclecloud.com)
+    VAULT_TIMEOUT_SECONDS               Request timeout (default 10)
+"""
+
+import os
+import json
+import base64
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from email.utils import formatdate
+
+VAULT_SECRETS_ENDPOINT = os.environ.get('VAULT_SECRETS_ENDPOINT', '')
+VAULT_REALM_DOMAIN = os.environ.get('VAULT_REALM_DOMAIN', 'oraclecloud.com')
+VAULT_TIMEOUT_SECONDS = float(os.environ.get('VAULT_TIMEOUT_SECONDS', '10'))
+
+SIGNED_HEADERS = ("date", "(request-target)", "host")
+
+
+class VaultClientError(Exception):
+    """Raised when a secret bundle cannot be retrieved."""
+    pass
+
+
+def _read_env_value(name: str, required: bool = True) -> str:
+    """Resource principal env vars hold either the value or an absolute path to it."""
+    value = os.environ.get(name, '')
+    if not value:
+        if required:
+            raise VaultClientError(f"{name} is not set (resource principal unavailable)")
+        return ''
+    if value.startswith('/'):
+        with open(value) as f:
+            return f.read().strip()
+    return value
+
+
+class ResourcePrincipalSigner:
+    """
+    Signs requests with the resource principal session key (OCI HTTP signature).
+
+    Credentials are re-read for every signer so that refreshed RPST files
+    provided by the platform are picked up.
+    """
+
+    def __init__(self):
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+        self.rpst = _read_env_value('OCI_RESOURCE_PRINCIPAL_RPST')
+        pem = _read_env_value('OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM')
+        passphrase = _read_env_value('OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM_PASSPHRASE', required=False)
+        self.private_key = load_pem_private_key(
+            pem.encode('utf-8'),
+            password=passphrase.encode('utf-8') if passphrase else None
+        )
+        self.region = os.environ.get('OCI_RESOURCE_PRINCIPAL_REGION', '')
+
+    def sign(self, method: str, url: str, headers: dict) -> dict:
+        """Return headers including Date and Authorization for a bodiless request."""
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        parsed = urllib.parse.urlsplit(url)
+        target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        signed = dict(headers)
+        signed.setdefault("date", formatdate(usegmt=True))
+        signed["host"] = parsed.netloc
+        values = {
+            "date": signed["date"],
+            "(request-target)": f"{method.lower()} {target}",
+            "host": signed["host"],
+        }
+        signing_string = "\n".join(f"{h}: {values[h]}" for h in SIGNED_HEADERS)
+        signature = self.private_key.sign(signing_string.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
+        signed["authorization"] = (
+            'Signature version="1",'
+            f'headers="{" ".join(SIGNED_HEADERS)}",'
+            f'keyId="ST${self.rpst}",'
+            'algorithm="rsa-sha256",'
+            f'signature="{base64.b64encode(signature).decode("ascii")}"'
+        )
+        return signed
+
+
+def secrets_endpoint(region: str) -> str:
+    if VAULT_SECRETS_ENDPOINT:
+        return VAULT_SECRETS_ENDPOINT.rstrip('/')
+    if not region:
+        raise VaultClientError("OCI_RESOURCE_PRINCIPAL_REGION is not set")
+    return f"https://secrets.vaults.{region}.oci.{VAULT_REALM_DOMAIN}"
+
+
+def get_secret_bundle_content(secret_ocid: str, timeout: float = None) -> str:
+    """
+    Fetch the current version of a secret bundle.
+
+    Returns secretBundleContent.content exactly as the SDK does
+    (the base64-encoded secret), so callers decode it the same way.
+    timeout defaults to VAULT_TIMEOUT_SECONDS.
+    """
+    signer = ResourcePrincipalSigner()
+    url = f"{secrets_endpoint(signer.region)}/20190301/secretbundles/{urllib.parse.quote(secret_ocid, safe='')}"
+    headers = signer.sign("GET", url, {"accept": "application/json"})
+    req = urllib.request.Request(url, headers=headers, method="GET")
+    try:
+        with urllib.request.urlopen(req, timeout=VAULT_TIMEOUT_SECONDS if timeout is None else timeout) as resp:
+            bundle = json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        detail = e.read()[:200].decode('utf-8', 'replace')
+        raise VaultClientError(f"Vault returned {e.code} for secret bundle: {detail}") from e
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise VaultClientError(f"Vault request failed: {e}") from e
+
+    content = (bundle.get("secretBundleContent") or {}).get("content")
+    if content is None:
+        raise VaultClientError("Secret bundle has no content")
+    return content
@@ -0,0 +1,101 @@
+"""
+Auth Router Function
+
+Optional single deployment unit for the whole auth flow. Dispatches each
+invocation to the unmodified login, callback, logout, back-channel logout,
+session info, health or authorizer handler, so keeping this one container
+warm keeps every step of the flow warm (instead of up to three stacked cold
+starts).
+
+The handlers are the sibling functions' func.py files, vendored into
+handlers/ by scripts/build_auth_router.sh before `fn deploy`. They share one
+Redis connection pool and one Vault secret cache.
+
+Dispatch:
+- HTTP invocations (with Fn-Http-Request-Url) go by the last path segments
+  of the URL, even when the body looks like an authorizer payload
+- Invocations without Fn-Http-Request-Url are API Gateway authorizer calls
+  and go to apigw_authzr
+"""
+
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
+import io
+import os
+import json
+import logging
+import importlib
+
+from fdk import response
+from urllib.parse import urlsplit
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Environment variables
+ROUTER_PRELOAD = os.environ.get('ROUTER_PRELOAD', 'true').lower() == 'true'
+
+# Path suffix -> handler module (under handlers/)
+ROUTES = {
+    "/auth/login": "oidc_authn",
+    "/auth/callback": "oidc_callback",
+    "/auth/logout": "oidc_logout",
+    "/auth/backchannel-logout": "oidc_backchannel_logout",
+    "/auth/session": "session_info",
+    "/health": "health",
+}
+AUTHORIZER = "apigw_authzr"
+
+# Shared across all handlers while the container is warm (the Redis client
+# is shared through session_store, which every handler imports)
+_secrets_cache = {}
+_handlers = {}
+
+
+def load_handler(name: str):
+    """Import a vendored handler module and point it at the shared secret cache."""
+    module = _handlers.get(name)
+    if module is None:
+        module = importlib.import_module(f"handlers.{name}")
+        if hasattr(module, '_secrets_cache'):
+            module._secrets_cache = _secrets_cache
+        _handlers[name] = module
+    return module
+
+
+def route(ctx, data) -> str:
+    """Return the handler name for an invocation, or '' if nothing matches."""
+    request_url = ctx.Headers().get("Fn-Http-Request-Url", "")
+    if isinstance(request_url, list):
+        request_url = request_url[0] if request_url else ""
+
+    if request_url:
+        # HTTP invocation: the URL decides, whatever the body contains
+        path = urlsplit(request_url).path.rstrip("/")
+        for suffix, name in ROUTES.items():
+            if path.endswith(suffix):
+                return name
+        return ""
+
+    # Authorizer invocations arrive without Fn-Http-Request-Url; apigw_authzr
+    # denies any payload whose type is not "USER_DEFINED"
+    return AUTHORIZER
+
+
+if ROUTER_PRELOAD:
+    for _name in (AUTHORIZER, *ROUTES.values()):
+        load_handler(_name)
+profiling.end_import_timing("auth_router")
+
+
+def handler(ctx, data: io.BytesIO = None):
+    """Dispatch to the matching auth handler."""
+    name = route(ctx, data)
+    if not name:
+        return response.Response(
+            ctx,
+            response_data=json.dumps({"error": "not_found"}),
+            status_code=404,
+            headers={"Content-Type": "application/json"}
+        )
+    return load_handler(name).handler(ctx, data)
@@ -0,0 +1,183 @@
+"""
+On-Demand Profiling
+
+Environment-controlled profiling for the OIDC functions:
+
+- imports: import-time breakdown at module load (and for lazy imports during
+  the first invocation), in the same format as `python -X importtime`
+- cpu:     cProfile of sampled invocations, written as pstats files
+- alloc:   tracemalloc snapshot of sampled invocations
+
+This module is copied verbatim into every function directory (each function
+is built as its own image). Keep the copies identical. It must be the first
+import in func.py so that the import timer sees the other imports.
+
+Configuration (environment):
+    PROFILE_MODE         off (default) | comma list of imports,cpu,alloc | all
+    PROFILE_SAMPLE_RATE  Fraction of invocations to profile (default 1.0)
+    PROFILE_OUTPUT       log (default) or a directory, e.g. /tmp/profiles
+    PROFILE_TOP_N        Entries to include in logged summaries (default 25)
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import logging
+import builtins
+import functools
+
+logger = logging.getLogger(__name__)
+
+_mode = os.environ.get('PROFILE_MODE', 'off').lower()
+if _mode == 'all':
+    _mode = 'imports,cpu,alloc'
+PROFILE_MODES = {m.strip() for m in _mode.split(',') if m.strip() and m.strip() != 'off'}
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', 'log')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '25'))
+
+ENABLED = bool(PROFILE_MODES)
+
+# === Import timing ===
+
+_original_import = builtins.__import__
+_import_stack = []
+_import_records = []
+_module_load_start = time.perf_counter_ns()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0 and name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = len(_import_stack)
+    _import_stack.append(0)
+    start = time.perf_counter_ns()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter_ns() - start
+        children = _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1] += elapsed
+        _import_records.append((depth, name, (elapsed - children) // 1000, elapsed // 1000))
+
+
+if 'imports' in PROFILE_MODES:
+    builtins.__import__ = _timed_import
+
+
+def _write_report(service_name: str, kind: str, text: str, suffix: str = 'txt', raw=None) -> str:
+    """Log a report, or write it (and an optional raw artifact) under PROFILE_OUTPUT."""
+    if PROFILE_OUTPUT == 'log':
+        logger.info(f"PROFILE {service_name} {kind}\n{text}")
+        return ''
+    os.makedirs(PROFILE_OUTPUT, exist_ok=True)
+    stem = os.path.join(PROFILE_OUTPUT, f"{service_name}-{kind}-{int(time.time() * 1000)}")
+    with open(f"{stem}.txt", 'w') as f:
+        f.write(text)
+    if raw is not None:
+        raw(f"{stem}.{suffix}")
+    logger.info(f"PROFILE {service_name} {kind} written to {stem}.*")
+    return stem
+
+
+def report_imports(service_name: str, label: str):
+    """Emit recorded imports in `-X importtime` format and reset the record."""
+    if not _import_records:
+        return
+    total_us = sum(cum for depth, _, _, cum in _import_records if depth == 0)
+    lines = ["import time: self [us] | cumulative | imported package"]
+    for depth, name, self_us, cum_us in _import_records:
+        lines.append(f"import time: {self_us:>9} | {cum_us:>10} | {'  ' * depth}{name}")
+    slowest = sorted((r for r in _import_records if r[0] == 0), key=lambda r: -r[3])[:PROFILE_TOP_N]
+    lines.append(f"# {label}: {len(_import_records)} modules, {total_us / 1000:.1f} ms in top-level imports")
+    lines.append("# slowest top-level imports: " + ", ".join(f"{r[1]}={r[3] / 1000:.1f}ms" for r in slowest))
+    _import_records.clear()
+    _write_report(service_name, f"imports-{label}", "\n".join(lines))
+
+
+def end_import_timing(service_name: str):
+    """Call at the end of func.py's imports to report module-load import time."""
+    if 'imports' not in PROFILE_MODES:
+        return
+    elapsed_ms = (time.perf_counter_ns() - _module_load_start) / 1e6
+    logger.info(f"PROFILE {service_name} module load {elapsed_ms:.1f} ms")
+    report_imports(service_name, "module-load")
+
+
+# === Invocation profiling ===
+
+_invocations = 0
+
+
+def profiled(service_name: str):
+    """
+    Decorator for fdk handlers.
+
+    Profiles a PROFILE_SAMPLE_RATE fraction of invocations with cProfile
+    and/or tracemalloc, and reports imports made during the first invocation
+    (lazy imports) before removing the import timer.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(ctx, data=None):
+            global _invocations
+            _invocations += 1
+            sampled = random.random() < PROFILE_SAMPLE_RATE
+            cpu = 'cpu' in PROFILE_MODES and sampled
+            alloc = 'alloc' in PROFILE_MODES and sampled
+
+            profiler = None
+            if alloc:
+                import tracemalloc
+                tracemalloc.start(10)
+            if cpu:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+            start = time.perf_counter_ns()
+            try:
+                return fn(ctx, data)
+            finally:
+                elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+                if profiler is not None:
+                    profiler.disable()
+                    _report_cpu(service_name, profiler, elapsed_ms)
+                if alloc:
+                    _report_alloc(service_name, elapsed_ms)
+                if _invocations == 1 and 'imports' in PROFILE_MODES:
+                    builtins.__import__ = _original_import
+                    report_imports(service_name, "first-invocation")
+
+        return wrapper
+    return decorator
+
+
+def _report_cpu(service_name: str, profiler, elapsed_ms: float):
+    import pstats
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+    text = f"# invocation {_invocations}: {elapsed_ms:.1f} ms wall\n{out.getvalue()}"
+    _write_report(service_name, "cpu", text, suffix='prof', raw=profiler.dump_stats)
+
+
+def _report_alloc(service_name: str, elapsed_ms: float):
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    lines = [f"# invocation {_invocations}: {elapsed_ms:.1f} ms wall, "
+             f"{current / 1024:.1f} KiB retained, {peak / 1024:.1f} KiB peak"]
+    for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]:
+        lines.append(str(stat))
+    _write_report(service_name, "alloc", "\n".join(lines), suffix='tracemalloc', raw=snapshot.dump)
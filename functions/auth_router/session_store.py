@@ -0,0 +1,270 @@
+"""
+Session Store Client and Key Layout
+
+Creates the OCI Cache (Redis) client and builds every key the functions use,
+so that standalone and cluster-mode caches share one code path.
+
+With OCI_CACHE_CLUSTER_MODE=true the client is redis.cluster.RedisCluster,
+which discovers the shard topology from OCI_CACHE_ENDPOINT and follows
+MOVED/ASK redirects, and keys that are read or written together carry a hash
+tag so they map to the same slot:
+
+    session:{<id>}, session_owner:{<id>}          read by one Lua script, one MGET, one DEL
+    session_refresh_lock:{<id>}                   guards renewal of that session
+    user_sessions:{<ref>}, user_epoch:{<ref>}     updated together on revocation
+    user_claims_current:{<ref>}, user_claims:{<ref>}:<version>
+                                                  read with the epoch (one MGET)
+    ratelimit:{login}:global, ratelimit:{login}:ip:<ip>   one Lua script (low volume)
+    stats:{usage}:<hour>:counts|users|sessions    PFCOUNT over several hours (see usage.py)
+
+Other keys (state, idp_sessions, bcl_jti, audit_events, revoked_sessions,
+ratelimit:authz, user_groups) are only used one at a time and spread freely. In standalone
+mode keys keep their original names, so enabling this module does not
+invalidate live sessions.
+
+Multi-key DEL is split per key in cluster mode (see delete()); callers must
+not assume keys of different sessions or users share a slot.
+
+Reads that tolerate replication lag (the authorizer's session lookups) can
+go to replicas through get_reader_client() when OCI_CACHE_READER_ENDPOINT is
+set: the cache's replicas endpoint in standalone mode, or any node in cluster
+mode (where the client then reads from each shard's replicas). Callers fall
+back to get_client() on a miss, since a key written moments ago may not have
+replicated yet.
+
+Every revocation (logout, logout everywhere, back-channel logout, admin
+revocation) also records the session in revoked_sessions through
+mark_revoked(), so authorizers that verify sealed session cookies locally
+(oidc_callback SESSION_MODE=stateless) can reject it. Entries are scored by
+revocation time and pruned after REVOCATION_RETENTION_SECONDS, which must
+cover the sealed cookie lifetime (SESSION_TTL_SECONDS). Logout everywhere
+and scripts/revoke_user_sessions.py share revoke_user_sessions().
+
+Revocations are also announced on the session_invalidations pub/sub channel
+through publish_invalidation(), so authorizers drop locally cached state at
+once instead of when it expires. Messages are space-separated tokens:
+"s:<revocation ref>" for a session and "u:<user_ref>" for all of a user's
+sessions. Delivery is best effort; subscribers bound staleness by TTL while
+disconnected.
+
+This module is copied verbatim into every function directory that uses
+OCI Cache. Keep the copies identical.
+
+Configuration (environment):
+    OCI_CACHE_ENDPOINT      Redis FQDN (cluster mode: any node or the cluster endpoint)
+    OCI_CACHE_PORT          Port (default 6379)
+    OCI_CACHE_TLS           true (default) | false for a local Redis
+    OCI_CACHE_CLUSTER_MODE  false (default) | true for a sharded OCI Cache cluster
+    OCI_CACHE_READER_ENDPOINT  Optional replicas endpoint for lag-tolerant reads
+    REVOCATION_RETENTION_SECONDS  How long revoked_sessions entries are kept (default 28800)
+"""
+
+import os
+import time
+import hashlib
+
+OCI_CACHE_ENDPOINT = os.environ.get('OCI_CACHE_ENDPOINT')
+OCI_CACHE_PORT = int(os.environ.get('OCI_CACHE_PORT', '6379'))
+OCI_CACHE_TLS = os.environ.get('OCI_CACHE_TLS', 'true').lower() == 'true'
+CLUSTER_MODE = os.environ.get('OCI_CACHE_CLUSTER_MODE', 'false').lower() == 'true'
+OCI_CACHE_READER_ENDPOINT = os.environ.get('OCI_CACHE_READER_ENDPOINT') or None
+READ_FROM_REPLICAS = OCI_CACHE_READER_ENDPOINT is not None
+REVOCATION_RETENTION_SECONDS = int(os.environ.get('REVOCATION_RETENTION_SECONDS', '28800'))
+INVALIDATION_BATCH = 500
+
+_client = None
+_reader_client = None
+
+
+def create_client(**overrides):
+    """Create a new client for the configured cache (overrides go to the constructor)."""
+    import redis
+    kwargs = {
+        "host": OCI_CACHE_ENDPOINT,
+        "port": OCI_CACHE_PORT,
+        "ssl": OCI_CACHE_TLS,
+        "ssl_cert_reqs": "required",
+        "decode_responses": False,
+    }
+    kwargs.update(overrides)
+    if CLUSTER_MODE:
+        from redis.cluster import RedisCluster
+        return RedisCluster(**kwargs)
+    return redis.Redis(**kwargs)
+
+
+def get_client():
+    """Get the process-wide client (connection pools and topology reused while warm)."""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def get_reader_client():
+    """Get the process-wide replica-read client (the primary client if none is configured)."""
+    global _reader_client
+    if not READ_FROM_REPLICAS:
+        return get_client()
+    if _reader_client is None:
+        if CLUSTER_MODE:
+            _reader_client = create_client(host=OCI_CACHE_READER_ENDPOINT, read_from_replicas=True)
+        else:
+            _reader_client = create_client(host=OCI_CACHE_READER_ENDPOINT)
+    return _reader_client
+
+
+def _tag(value: str) -> str:
+    return f"{{{value}}}" if CLUSTER_MODE else value
+
+
+def session_key(session_id: str) -> str:
+    return f"session:{_tag(session_id)}"
+
+
+def owner_key(session_id: str) -> str:
+    return f"session_owner:{_tag(session_id)}"
+
+
+def refresh_lock_key(session_id: str) -> str:
+    return f"session_refresh_lock:{_tag(session_id)}"
+
+
+def user_epoch_key(user_ref: str) -> str:
+    return f"user_epoch:{_tag(user_ref)}"
+
+
+def user_sessions_key(user_ref: str) -> str:
+    return f"user_sessions:{_tag(user_ref)}"
+
+
+def user_claims_key(user_ref: str, version: str) -> str:
+    return f"user_claims:{_tag(user_ref)}:{version}"
+
+
+def user_claims_current_key(user_ref: str) -> str:
+    return f"user_claims_current:{_tag(user_ref)}"
+
+
+def user_groups_key(user_ref: str) -> str:
+    """Encrypted group membership resolved through SCIM (oidc_callback GROUPS_SCIM_ENABLED)."""
+    return f"user_groups:{user_ref}"
+
+
+def idp_sessions_key(sid_ref: str) -> str:
+    return f"idp_sessions:{sid_ref}"
+
+
+def state_key(state: str) -> str:
+    return f"state:{state}"
+
+
+def logout_jti_key(jti_ref: str) -> str:
+    return f"bcl_jti:{jti_ref}"
+
+
+def login_rate_keys(client_ip: str) -> list:
+    """Global and per-IP login bucket keys (one slot in cluster mode)."""
+    prefix = f"ratelimit:{_tag('login')}"
+    return [f"{prefix}:global", f"{prefix}:ip:{client_ip}"]
+
+
+def authz_rate_key(user_ref: str, window: int) -> str:
+    """Per-principal request counter for one authorizer rate-limit window."""
+    return f"ratelimit:authz:{user_ref}:{window}"
+
+
+def authz_throttled_key(cookie_ref: str) -> str:
+    """Set while the authorizer throttles a session cookie; oidc_authn then answers 429, not a new login."""
+    return f"ratelimit:authz:throttled:{cookie_ref}"
+
+
+def usage_keys(hour: str) -> tuple:
+    """(counters hash, users HyperLogLog, sessions HyperLogLog) for one UTC hour (YYYYMMDDHH)."""
+    prefix = f"stats:{_tag('usage')}:{hour}"
+    return f"{prefix}:counts", f"{prefix}:users", f"{prefix}:sessions"
+
+
+def audit_stream_key() -> str:
+    return "audit_events"
+
+
+def revoked_sessions_key() -> str:
+    return "revoked_sessions"
+
+
+def revocation_ref(session_id: str) -> str:
+    """Member of revoked_sessions for a session (the ID itself is not stored)."""
+    return hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32]
+
+
+def mark_revoked(pipe, session_ids: list):
+    """Queue recording revoked sessions on a pipeline (and pruning expired entries)."""
+    if not session_ids:
+        return
+    now = time.time()
+    key = revoked_sessions_key()
+    pipe.zadd(key, {revocation_ref(s): now for s in session_ids})
+    pipe.zremrangebyscore(key, '-inf', now - REVOCATION_RETENTION_SECONDS)
+
+
+def invalidations_channel() -> str:
+    return "session_invalidations"
+
+
+def publish_invalidation(r, session_ids=(), owners=()):
+    """
+    Announce revoked sessions and users to warm authorizers.
+
+    r must be a client, not a pipeline: cluster pipelines refuse PUBLISH.
+    Large revocations are split into messages of INVALIDATION_BATCH tokens.
+    """
+    tokens = [f"s:{revocation_ref(s)}" for s in session_ids] + [f"u:{owner}" for owner in owners]
+    for i in range(0, len(tokens), INVALIDATION_BATCH):
+        r.publish(invalidations_channel(), " ".join(tokens[i:i + INVALIDATION_BATCH]))
+
+
+def revoke_user_sessions(r, owners: list, batch_size: int = INVALIDATION_BATCH, progress=None) -> int:
+    """
+    Revoke every session of the given users ("log out everywhere").
+
+    Reads each user's session index and bumps their revocation epoch (which
+    also covers sessions created before the index existed), then deletes the
+    sessions in pipelined batches and announces the revocation to warm
+    authorizers. Cost is O(sessions for those users), with three round trips
+    per batch of users; progress(batch_number, users, sessions) is called
+    after each batch. Returns the number of sessions found.
+    """
+    revoked = 0
+    for i in range(0, len(owners), batch_size):
+        batch = owners[i:i + batch_size]
+        pipe = r.pipeline(transaction=False)
+        for owner in batch:
+            pipe.zrange(user_sessions_key(owner), 0, -1)
+            pipe.incr(user_epoch_key(owner))
+        results = pipe.execute()
+
+        session_ids = [sid.decode('utf-8') for members in results[0::2] for sid in members]
+        revoked += len(session_ids)
+        pipe = r.pipeline(transaction=False)
+        for j in range(0, len(session_ids), batch_size):
+            chunk = session_ids[j:j + batch_size]
+            delete(pipe, *[key for sid in chunk for key in (session_key(sid), owner_key(sid))])
+        delete(pipe, *[user_sessions_key(owner) for owner in batch])
+        mark_revoked(pipe, session_ids)
+        pipe.execute()
+        publish_invalidation(r, session_ids, batch)
+        if progress:
+            progress(i // batch_size + 1, len(batch), len(session_ids))
+    return revoked
+
+
+def delete(pipe, *keys):
+    """Queue DEL of keys on a pipeline: one command, or one per key in cluster mode."""
+    if not keys:
+        return
+    if CLUSTER_MODE:
+        for key in keys:
+            pipe.delete(key)
+    else:
+        pipe.delete(*keys)
@@ -0,0 +1,123 @@
+"""
+Usage Counters
+
+Approximate activity figures per UTC hour, kept in OCI Cache so operators
+can see how many distinct users and sessions were active and how often
+logins, authorizations and each deny reason occurred, without scanning logs
+(scripts/usage_stats.py reads them):
+
+    stats:usage:<hour>:counts     hash of counters (login.success, authz.allow,
+                                  authz.deny.<reason>, ...), HINCRBY
+    stats:usage:<hour>:users      HyperLogLog of user refs, PFADD (~0.8% error, 12 KB)
+    stats:usage:<hour>:sessions   HyperLogLog of session refs
+
+(<hour> is UTC YYYYMMDDHH; in cluster mode "usage" is a hash tag, see
+session_store.usage_keys.)
+
+Handlers call count(), which only updates in-process totals and sets; a
+background thread adds them to the cache in one pipeline every
+USAGE_FLUSH_INTERVAL seconds (sooner when many distinct refs are waiting),
+so counting adds no round trip to any request. As with audit events, what
+is buffered when an idle container is reclaimed, or when a flush fails, is
+lost: the figures are for trends, not billing.
+
+This module is copied verbatim into every function directory that counts
+usage. Keep the copies identical.
+
+Configuration (environment):
+    USAGE_STATS_ENABLED     false (default) | true
+    USAGE_FLUSH_INTERVAL    Seconds between background flushes (default 10)
+    USAGE_BATCH_SIZE        Distinct refs buffered before an early flush (default 1000)
+    USAGE_RETENTION_HOURS   Hours the per-hour keys are kept (default 168)
+"""
+
+import os
+import time
+import logging
+import threading
+
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('USAGE_STATS_ENABLED', 'false').lower() == 'true'
+USAGE_FLUSH_INTERVAL = float(os.environ.get('USAGE_FLUSH_INTERVAL', '10'))
+USAGE_BATCH_SIZE = int(os.environ.get('USAGE_BATCH_SIZE', '1000'))
+USAGE_RETENTION_HOURS = int(os.environ.get('USAGE_RETENTION_HOURS', '168'))
+
+# hour -> counter name -> increment, and hour -> refs not yet written
+_counts = defaultdict(lambda: defaultdict(int))
+_users = defaultdict(set)
+_sessions = defaultdict(set)
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_thread = None
+
+
+def hour(ts: float = None) -> str:
+    """UTC hour bucket ("YYYYMMDDHH") of a timestamp (default now)."""
+    return time.strftime("%Y%m%d%H", time.gmtime(ts))
+
+
+def count(name: str, user: str = "", session: str = ""):
+    """Add one to a counter for this hour and note the user/session refs (never blocks on I/O)."""
+    if not ENABLED:
+        return
+    bucket = hour()
+    with _lock:
+        _counts[bucket][name] += 1
+        if user:
+            _users[bucket].add(user)
+        if session:
+            _sessions[bucket].add(session)
+        batch_ready = len(_users[bucket]) + len(_sessions[bucket]) >= USAGE_BATCH_SIZE
+    _ensure_worker()
+    if batch_ready:
+        _wakeup.set()
+
+
+def _ensure_worker():
+    global _thread
+    if _thread is None:
+        with _lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_worker, name="usage-flush", daemon=True)
+                _thread.start()
+
+
+def _worker():
+    while True:
+        _wakeup.wait(USAGE_FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush()
+
+
+def flush():
+    """Add everything buffered to the per-hour keys (called by the background thread)."""
+    with _lock:
+        counts = {bucket: dict(names) for bucket, names in _counts.items()}
+        users = dict(_users)
+        sessions = dict(_sessions)
+        _counts.clear()
+        _users.clear()
+        _sessions.clear()
+    if not counts:
+        return
+
+    import session_store
+    pipe = session_store.get_client().pipeline(transaction=False)
+    ttl = USAGE_RETENTION_HOURS * 3600
+    for bucket, names in counts.items():
+        counts_key, users_key, sessions_key = session_store.usage_keys(bucket)
+        for name, increment in names.items():
+            pipe.hincrby(counts_key, name, increment)
+        pipe.expire(counts_key, ttl)
+        for key, refs in ((users_key, users.get(bucket)), (sessions_key, sessions.get(bucket))):
+            if refs:
+                pipe.pfadd(key, *refs)
+                pipe.expire(key, ttl)
+    try:
+        pipe.execute()
+    except Exception as e:
+        lost = sum(sum(names.values()) for names in counts.values())
+        logger.warning(f"Usage counters flush failed, {lost} count(s) lost: {str(e)}")
@@ -1,27 +1,185 @@
 """
 Health Check Function
 
-Simple health check endpoint for Load Balancer health probes.
-Returns 200 OK with status information.
+Health check endpoint for Load Balancer health probes.
+
+- GET /health              Liveness: returns 200 OK without touching any dependency.
+- GET /health?mode=ready   Readiness: probes OCI Cache (PING), OCI Vault (secret
+                           fetch) and the IdP discovery endpoint concurrently,
+                           each with a strict timeout, and returns 200 only if
+                           all configured dependencies respond. Results are
+                           cached for HEALTH_CACHE_SECONDS so frequent probes do
+                           not multiply load on the dependencies.
 """
 
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
 import io
+import os
 import json
+import time
 import logging
+import session_store
 
 from fdk import response
 from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+profiling.end_import_timing("health")
+
+# Environment variables (readiness mode only; unset dependencies are skipped)
+OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
+HEALTH_VAULT_SECRET_OCID = os.environ.get('HEALTH_VAULT_SECRET_OCID')
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PROBE_TIMEOUT_SECONDS', '2'))
+HEALTH_CACHE_SECONDS = float(os.environ.get('HEALTH_CACHE_SECONDS', '10'))
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
+# Reused while the container is warm
+_redis_client = None
+_probe_pool = None
+_ready_cache = None  # (expires_at, status_code, body)
+
+
+def get_redis_client():
+    """Get a dedicated OCI Cache client with probe-sized timeouts."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = session_store.create_client(
+            socket_connect_timeout=HEALTH_PROBE_TIMEOUT_SECONDS,
+            socket_timeout=HEALTH_PROBE_TIMEOUT_SECONDS
+        )
+    return _redis_client
+
+
+def probe_redis():
+    """PING OCI Cache (every primary in cluster mode)."""
+    if not get_redis_client().ping():
+        raise RuntimeError("PING returned false")
+
+
+def probe_vault():
+    """Fetch a secret bundle (content is discarded, never logged)."""
+    if VAULT_CLIENT == 'lite':
+        import vault_client
+        vault_client.get_secret_bundle_content(HEALTH_VAULT_SECRET_OCID, timeout=HEALTH_PROBE_TIMEOUT_SECONDS)
+        return
+    import oci
+    signer = oci.auth.signers.get_resource_principals_signer()
+    client = oci.secrets.SecretsClient(
+        {}, signer=signer, timeout=(HEALTH_PROBE_TIMEOUT_SECONDS, HEALTH_PROBE_TIMEOUT_SECONDS)
+    )
+    client.get_secret_bundle(HEALTH_VAULT_SECRET_OCID)
+
+
+def probe_idp():
+    """GET the IdP's OpenID discovery document."""
+    import urllib.request
+    config_url = f"{OCI_IAM_BASE_URL}/.well-known/openid-configuration"
+    with urllib.request.urlopen(config_url, timeout=HEALTH_PROBE_TIMEOUT_SECONDS) as resp:
+        if 'issuer' not in json.loads(resp.read()):
+            raise RuntimeError("discovery document has no issuer")
+
+
+def timed(probe):
+    """Run a probe and return (error, latency_ms)."""
+    start = time.perf_counter()
+    try:
+        probe()
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:200]
+    return error, round((time.perf_counter() - start) * 1000, 1)
+
 
+def run_readiness_checks() -> tuple:
+    """
+    Probe all configured dependencies concurrently.
+
+    Every probe has its own client-side timeout; the overall wait is also
+    bounded so that a probe stuck past its timeout is reported as such.
+
+    Returns (status_code, body).
+    """
+    global _probe_pool
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+    probes = {
+        "redis": (session_store.OCI_CACHE_ENDPOINT, probe_redis),
+        "vault": (HEALTH_VAULT_SECRET_OCID, probe_vault),
+        "idp": (OCI_IAM_BASE_URL, probe_idp),
+    }
+    if _probe_pool is None:
+        _probe_pool = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="health-probe")
+
+    futures = {name: _probe_pool.submit(timed, probe) for name, (configured, probe) in probes.items() if configured}
+    deadline = time.monotonic() + HEALTH_PROBE_TIMEOUT_SECONDS + 0.5
+
+    checks = {}
+    for name in probes:
+        if name not in futures:
+            checks[name] = {"status": "skipped"}
+            continue
+        try:
+            error, latency_ms = futures[name].result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            error, latency_ms = "timed out", round(HEALTH_PROBE_TIMEOUT_SECONDS * 1000, 1)
+        # Error details are logged only; /health is public
+        checks[name] = {"status": "ok" if error is None else "fail", "latency_ms": latency_ms}
+        if error is not None:
+            logger.warning(f"Readiness probe {name} failed after {latency_ms} ms: {error}")
+
+    ready = all(c["status"] != "fail" for c in checks.values())
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    return (200 if ready else 503), body
+
+
+def get_readiness() -> tuple:
+    """Return cached readiness results, re-probing once they are older than HEALTH_CACHE_SECONDS."""
+    global _ready_cache
+    now = time.monotonic()
+    if _ready_cache is not None and now < _ready_cache[0]:
+        status_code, body = _ready_cache[1], _ready_cache[2]
+        return status_code, dict(body, cached=True)
+    status_code, body = run_readiness_checks()
+    _ready_cache = (now + HEALTH_CACHE_SECONDS, status_code, body)
+    return status_code, dict(body, cached=False)
+
+
+def wants_readiness(ctx) -> bool:
+    """True for ?mode=ready."""
+    request_url = ctx.Headers().get("Fn-Http-Request-Url", "")
+    if isinstance(request_url, list):
+        request_url = request_url[0] if request_url else ""
+    if "mode=" not in request_url:
+        return False
+    return parse_qs(urlsplit(request_url).query).get("mode", [""])[0] == "ready"
+
+
+@profiling.profiled("health")
 def handler(ctx, data: io.BytesIO = None):
     """
     Health check endpoint.
 
-    Returns simple JSON response for LB health probes.
+    Returns simple JSON response for LB liveness probes, or per-dependency
+    readiness results with ?mode=ready (503 if any dependency fails).
     """
+    if wants_readiness(ctx):
+        status_code, body = get_readiness()
+        return response.Response(
+            ctx,
+            response_data=json.dumps(body),
+            status_code=status_code,
+            headers={"Content-Type": "application/json", "Cache-Control": "no-store"}
+        )
+
     return response.Response(
         ctx,
         response_data=json.dumps({
@@ -6,15 +6,19 @@ Generates state, code_verifier, nonce, stores them in OCI Cache,
 and redirects the user to the Identity Provider.
 """
 
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
 import io
 import os
 import json
 import base64
 import hashlib
 import secrets
+import ipaddress
+import audit
+import usage
 import logging
-import redis
-import oci
+import tracing
+import session_store
 
 from fdk import response
 from urllib.parse import urlencode
@@ -22,29 +26,94 @@ from urllib.parse import urlencode
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+profiling.end_import_timing("oidc_authn")
 
 # Environment variables
 OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
 OIDC_REDIRECT_URI = os.environ.get('OIDC_REDIRECT_URI')
 OCI_VAULT_CLIENT_CREDS_OCID = os.environ.get('OCI_VAULT_CLIENT_CREDS_OCID')
-OCI_CACHE_ENDPOINT = os.environ.get('OCI_CACHE_ENDPOINT')
 STATE_TTL_SECONDS = int(os.environ.get('STATE_TTL_SECONDS', '300'))
 DEFAULT_RETURN_TO = os.environ.get('DEFAULT_RETURN_TO', '/')
 
+# Request a refresh token (offline_access) for silent session renewal
+SESSION_REFRESH_ENABLED = os.environ.get('SESSION_REFRESH_ENABLED', 'false').lower() == 'true'
+OIDC_SCOPE = 'openid profile email groups' + (' offline_access' if SESSION_REFRESH_ENABLED else '')
+
+# Session cookie, to spot a browser the authorizer is throttling (see check_authz_throttle)
+SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'session_id')
+SESSION_COOKIE_PREFIX = SESSION_COOKIE_NAME + '='
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
+# Login rate limiting (token bucket in OCI Cache, rate 0 disables a bucket)
+LOGIN_RATE_GLOBAL_PER_SEC = float(os.environ.get('LOGIN_RATE_GLOBAL_PER_SEC', '0'))
+LOGIN_RATE_GLOBAL_BURST = int(os.environ.get('LOGIN_RATE_GLOBAL_BURST', '100'))
+LOGIN_RATE_IP_PER_SEC = float(os.environ.get('LOGIN_RATE_IP_PER_SEC', '0'))
+LOGIN_RATE_IP_BURST = int(os.environ.get('LOGIN_RATE_IP_BURST', '10'))
+
+# Atomic two-level token bucket (global + per client IP).
+# KEYS[1] = global bucket, KEYS[2] = client IP bucket
+# ARGV = global rate, global burst, ip rate, ip burst
+# Returns {allowed (1/0), retry_after_ms}. Tokens are only taken when both
+# buckets allow the request, so a rejected client does not drain the global bucket.
+RATE_LIMIT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = {}
+local retry = 0
+for i = 1, 2 do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    if rate > 0 then
+        local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+        local tokens = tonumber(b[1]) or burst
+        local ts = tonumber(b[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+        if tokens < 1 then
+            retry = math.max(retry, math.ceil((1 - tokens) * 1000 / rate))
+        end
+        state[i] = {tokens, math.ceil(burst * 1000 / rate)}
+    end
+end
+if retry > 0 then
+    return {0, retry}
+end
+for i = 1, 2 do
+    if state[i] then
+        redis.call('HSET', KEYS[i], 'tokens', tostring(state[i][1] - 1), 'ts', now)
+        redis.call('PEXPIRE', KEYS[i], state[i][2])
+    end
+end
+return {1, 0}
+"""
+
 # In-memory cache for secrets (never written to disk)
 _secrets_cache = {}
 
+# Registered rate-limit script, reused across warm invocations (EVALSHA only)
+_login_limiter = None
+
+
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
+
 
 def get_vault_secret(secret_ocid: str) -> str:
     """Retrieve and decode a secret from OCI Vault."""
     if secret_ocid in _secrets_cache:
         return _secrets_cache[secret_ocid]
 
-    signer = oci.auth.signers.get_resource_principals_signer()
-    client = oci.secrets.SecretsClient({}, signer=signer)
-
-    response_data = client.get_secret_bundle(secret_ocid)
-    content = response_data.data.secret_bundle_content.content
+    content = fetch_secret_bundle_content(secret_ocid)
     decoded = base64.b64decode(content).decode('utf-8')
 
     _secrets_cache[secret_ocid] = decoded
@@ -59,13 +128,116 @@ def get_client_id() -> str:
 
 
 def get_redis_client():
-    """Get Redis client with TLS (OCI Cache requires TLS)."""
-    return redis.Redis(
-        host=OCI_CACHE_ENDPOINT,
-        port=6379,
-        ssl=True,
-        ssl_cert_reqs="required",
-        decode_responses=False
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
+
+
+def get_client_ip(ctx) -> str:
+    """
+    Client IP for the per-IP login bucket.
+
+    API Gateway appends the peer it accepted the connection from to
+    X-Forwarded-For, so only the rightmost entry is trusted; anything to its
+    left is whatever the client sent. Values that are not an IP address
+    share the 'unknown' bucket, so a forged header can neither pick a fresh
+    bucket nor create arbitrary keys.
+    """
+    headers = ctx.Headers()
+    forwarded = headers.get("X-Forwarded-For", headers.get("x-forwarded-for", ""))
+    if isinstance(forwarded, list):
+        forwarded = ",".join(forwarded)
+    candidate = forwarded.split(",")[-1].strip() if forwarded else ""
+    if not candidate:
+        candidate = headers.get("X-Real-IP", headers.get("x-real-ip", ""))
+        if isinstance(candidate, list):
+            candidate = candidate[-1] if candidate else ""
+    try:
+        return str(ipaddress.ip_address(candidate.strip()))
+    except ValueError:
+        return "unknown"
+
+
+def check_login_rate(r, client_ip: str) -> int:
+    """
+    Apply the login token buckets.
+
+    Returns 0 when the request may proceed, otherwise the number of seconds
+    the client should wait before retrying. Fails open on cache errors so a
+    limiter problem never blocks logins outright.
+    """
+    global _login_limiter
+    if LOGIN_RATE_GLOBAL_PER_SEC <= 0 and LOGIN_RATE_IP_PER_SEC <= 0:
+        return 0
+    try:
+        if _login_limiter is None:
+            _login_limiter = r.register_script(RATE_LIMIT_SCRIPT)
+        with tracing.span("redis.login_rate_limit"):
+            allowed, retry_after_ms = _login_limiter(
+                keys=session_store.login_rate_keys(client_ip),
+                args=[LOGIN_RATE_GLOBAL_PER_SEC, LOGIN_RATE_GLOBAL_BURST,
+                      LOGIN_RATE_IP_PER_SEC, LOGIN_RATE_IP_BURST]
+            )
+    except Exception as e:
+        logger.warning(f"Login rate limiter unavailable, allowing request: {str(e)}")
+        return 0
+    if int(allowed):
+        return 0
+    return max(1, -(-int(retry_after_ms) // 1000))
+
+
+def find_cookie(cookie_header: str, prefix: str = SESSION_COOKIE_PREFIX):
+    """Return the value of one cookie ('name='), or None (as in apigw_authzr)."""
+    start = 0
+    while True:
+        i = cookie_header.find(prefix, start)
+        if i < 0:
+            return None
+        j = i - 1
+        while j >= 0 and cookie_header[j] == ' ':
+            j -= 1
+        if j < 0 or cookie_header[j] == ';':
+            i += len(prefix)
+            end = cookie_header.find(';', i)
+            return (cookie_header[i:end] if end >= 0 else cookie_header[i:]).strip()
+        start = i + 1
+
+
+def check_authz_throttle(r, ctx) -> int:
+    """
+    Seconds left on the authorizer's throttle of this browser's session, or 0.
+
+    API Gateway turns every authorizer denial, rate_limited included, into a
+    redirect here. A new login would not help (the authorizer's bucket is per
+    user) and would only load the IdP, so the authorizer marks the throttled
+    cookie and the login answers 429 until the marker expires. Fails open.
+    """
+    headers = ctx.Headers()
+    cookie_header = headers.get("Cookie", headers.get("cookie", ""))
+    if isinstance(cookie_header, list):
+        cookie_header = "; ".join(cookie_header)
+    cookie_value = find_cookie(cookie_header) if cookie_header else None
+    if not cookie_value:
+        return 0
+    try:
+        with tracing.span("redis.authz_throttle"):
+            ttl = r.ttl(session_store.authz_throttled_key(session_store.revocation_ref(cookie_value)))
+    except Exception as e:
+        logger.warning(f"Cannot check authorizer throttle, allowing request: {str(e)}")
+        return 0
+    return max(0, int(ttl))
+
+
+def rate_limited_response(ctx, retry_after: int):
+    """429 telling the browser when to retry, instead of redirecting to the IdP."""
+    return response.Response(
+        ctx,
+        response_data=json.dumps({"error": "rate_limited", "retry_after": retry_after}),
+        status_code=429,
+        headers={
+            "Content-Type": "application/json",
+            "Retry-After": str(retry_after),
+            "Cache-Control": f"private, max-age={retry_after}"
+        }
     )
 
 
@@ -77,6 +249,8 @@ def generate_pkce():
     return code_verifier, code_challenge
 
 
+@profiling.profiled("oidc_authn")
+@tracing.traced("oidc_authn")
 def handler(ctx, data: io.BytesIO = None):
     """Handle OIDC login initiation."""
     try:
@@ -88,6 +262,22 @@ def handler(ctx, data: io.BytesIO = None):
 
         return_to = body.get('return_to', DEFAULT_RETURN_TO)
 
+        # Rate limit before doing any work for this login
+        r = get_redis_client()
+        client_ip = get_client_ip(ctx)
+        retry_after = check_authz_throttle(r, ctx)
+        if retry_after:
+            logger.info(f"Session throttled by the authorizer, retry after {retry_after}s")
+            audit.emit("oidc_authn", "login.failure", reason="authz_rate_limited", ip=client_ip)
+            usage.count("login.failure.authz_rate_limited")
+            return rate_limited_response(ctx, retry_after)
+        retry_after = check_login_rate(r, client_ip)
+        if retry_after:
+            logger.warning(f"Login rate limited for {client_ip}, retry after {retry_after}s")
+            audit.emit("oidc_authn", "login.failure", reason="rate_limited", ip=client_ip)
+            usage.count("login.failure.rate_limited")
+            return rate_limited_response(ctx, retry_after)
+
         # Generate PKCE
         code_verifier, code_challenge = generate_pkce()
 
@@ -96,14 +286,14 @@ def handler(ctx, data: io.BytesIO = None):
         nonce = secrets.token_urlsafe(32)
 
         # Store state data in OCI Cache
-        r = get_redis_client()
         state_data = json.dumps({
             'code_verifier': code_verifier,
             'nonce': nonce,
-            'return_to': return_to
+            'return_to': return_to,
+            'traceparent': tracing.current_traceparent()
         })
-        r.set(f"state:{state}", state_data.encode('utf-8'), ex=STATE_TTL_SECONDS)
-        r.close()
+        with tracing.span("redis.store_state"):
+            r.set(session_store.state_key(state), state_data.encode('utf-8'), ex=STATE_TTL_SECONDS)
 
         # Get client_id from Vault
         client_id = get_client_id()
@@ -114,7 +304,7 @@ def handler(ctx, data: io.BytesIO = None):
             'response_type': 'code',
             'client_id': client_id,
             'redirect_uri': OIDC_REDIRECT_URI,
-            'scope': 'openid profile email groups',
+            'scope': OIDC_SCOPE,
             'state': state,
             'nonce': nonce,
             'code_challenge': code_challenge,
@@ -123,6 +313,7 @@ def handler(ctx, data: io.BytesIO = None):
         redirect_url = f"{authorize_url}?{urlencode(params)}"
 
         logger.info(f"Redirecting to IdP for authentication, state={state[:8]}...")
+        usage.count("login.start")
 
         return response.Response(
             ctx,
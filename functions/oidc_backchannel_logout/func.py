@@ -0,0 +1,345 @@
+"""
+OIDC Back-Channel Logout Function
+
+Receives logout tokens posted by the Identity Provider when it ends a user's
+session (admin action, password reset, IdP logout) and removes the matching
+gateway sessions from OCI Cache, so they stop working before
+SESSION_TTL_SECONDS runs out.
+
+Implements OpenID Connect Back-Channel Logout 1.0: the logout token is a
+signed JWT identifying the user (sub) and/or the IdP session (sid).
+"""
+
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import audit
+import usage
+import logging
+import requests
+import jwt
+import tracing
+import session_store
+
+from fdk import response
+from urllib.parse import parse_qs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+profiling.end_import_timing("oidc_backchannel_logout")
+
+# Environment variables
+OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
+OCI_VAULT_CLIENT_CREDS_OCID = os.environ.get('OCI_VAULT_CLIENT_CREDS_OCID')
+LOGOUT_TOKEN_JTI_TTL_SECONDS = int(os.environ.get('LOGOUT_TOKEN_JTI_TTL_SECONDS', '600'))
+LOGOUT_TOKEN_LEEWAY_SECONDS = int(os.environ.get('LOGOUT_TOKEN_LEEWAY_SECONDS', '60'))
+JWKS_CACHE_SECONDS = int(os.environ.get('JWKS_CACHE_SECONDS', '3600'))
+REVOKE_BATCH_SIZE = int(os.environ.get('REVOKE_BATCH_SIZE', '500'))
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
+BACKCHANNEL_LOGOUT_EVENT = "http://schemas.openid.net/event/backchannel-logout"
+
+# In-memory caches, reused while the container is warm
+_secrets_cache = {}
+_openid_config = None
+_signing_keys = {}
+_signing_keys_fetched = 0
+_http = requests.Session()
+
+
+class LogoutTokenError(Exception):
+    """Raised when a logout token fails validation."""
+    pass
+
+
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
+
+
+def get_vault_secret(secret_ocid: str) -> str:
+    """Retrieve and decode a secret from OCI Vault."""
+    if secret_ocid in _secrets_cache:
+        return _secrets_cache[secret_ocid]
+
+    content = fetch_secret_bundle_content(secret_ocid)
+    decoded = base64.b64decode(content).decode('utf-8')
+
+    _secrets_cache[secret_ocid] = decoded
+    return decoded
+
+
+def get_client_credentials() -> tuple:
+    """Retrieve OAuth2 client_id and client_secret from Vault."""
+    secret_json = get_vault_secret(OCI_VAULT_CLIENT_CREDS_OCID)
+    creds = json.loads(secret_json)
+    return creds['client_id'], creds['client_secret']
+
+
+def get_redis_client():
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
+
+
+def get_openid_config() -> dict:
+    """Get (and cache) the IdP's OpenID configuration."""
+    global _openid_config
+    if _openid_config is None:
+        config_url = f"{OCI_IAM_BASE_URL}/.well-known/openid-configuration"
+        with tracing.span("idp.discovery", **{"http.url": config_url}):
+            config_resp = _http.get(config_url, timeout=10)
+        config_resp.raise_for_status()
+        _openid_config = config_resp.json()
+    return _openid_config
+
+
+def get_client_access_token() -> str:
+    """Get an access token for the confidential app (client credentials grant)."""
+    client_id, client_secret = get_client_credentials()
+    with tracing.span("idp.client_credentials"):
+        token_resp = _http.post(
+            get_openid_config()['token_endpoint'],
+            data={'grant_type': 'client_credentials', 'scope': 'urn:opc:idm:__myscopes__'},
+            auth=(client_id, client_secret),
+            timeout=10
+        )
+    token_resp.raise_for_status()
+    return token_resp.json()['access_token']
+
+
+def get_signing_keys(force: bool = False) -> dict:
+    """
+    Get the IdP's token signing keys by kid.
+
+    OCI Identity Domains may require authentication for the JWKS endpoint
+    unless signing certificate access is enabled, so a 401 is retried with a
+    client credentials access token.
+    """
+    global _signing_keys, _signing_keys_fetched
+    if _signing_keys and not force and time.time() - _signing_keys_fetched < JWKS_CACHE_SECONDS:
+        return _signing_keys
+
+    jwks_uri = get_openid_config()['jwks_uri']
+    with tracing.span("idp.jwks", **{"http.url": jwks_uri}):
+        jwks_resp = _http.get(jwks_uri, timeout=10)
+        if jwks_resp.status_code == 401:
+            jwks_resp = _http.get(
+                jwks_uri,
+                headers={'Authorization': f"Bearer {get_client_access_token()}"},
+                timeout=10
+            )
+    jwks_resp.raise_for_status()
+
+    keys = {}
+    for jwk in jwt.PyJWKSet.from_dict(jwks_resp.json()).keys:
+        keys[jwk.key_id] = jwk.key
+    _signing_keys = keys
+    _signing_keys_fetched = time.time()
+    return keys
+
+
+def validate_logout_token(logout_token: str) -> dict:
+    """Validate a logout token per OIDC Back-Channel Logout 1.0, section 2.6."""
+    try:
+        header = jwt.get_unverified_header(logout_token)
+    except jwt.DecodeError as e:
+        raise LogoutTokenError(f"malformed logout token: {e}")
+
+    kid = header.get('kid')
+    keys = get_signing_keys()
+    if kid not in keys:
+        keys = get_signing_keys(force=True)
+    if kid in keys:
+        key = keys[kid]
+    elif kid is None and len(keys) == 1:
+        key = next(iter(keys.values()))
+    else:
+        raise LogoutTokenError("unknown signing key")
+
+    client_id, _ = get_client_credentials()
+    try:
+        claims = jwt.decode(
+            logout_token,
+            key,
+            algorithms=["RS256"],
+            audience=client_id,
+            issuer=get_openid_config()['issuer'],
+            leeway=LOGOUT_TOKEN_LEEWAY_SECONDS,
+            options={"require": ["iat", "jti"]}
+        )
+    except jwt.InvalidTokenError as e:
+        raise LogoutTokenError(str(e))
+
+    events = claims.get('events')
+    if not isinstance(events, dict) or BACKCHANNEL_LOGOUT_EVENT not in events:
+        raise LogoutTokenError("missing back-channel logout event")
+    if 'nonce' in claims:
+        raise LogoutTokenError("logout token must not contain nonce")
+    if not claims.get('sub') and not claims.get('sid'):
+        raise LogoutTokenError("logout token must contain sub or sid")
+    return claims
+
+
+def key_ref(value: str) -> str:
+    """Stable, non-reversible key component (matches oidc_callback.user_ref)."""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+
+def remove_sessions(r, claims: dict) -> tuple:
+    """
+    Remove the gateway sessions named by a validated logout token.
+
+    With sid, only sessions created from that IdP session are removed;
+    otherwise all of the user's sessions are removed and the user's
+    revocation epoch is bumped. Uses two pipelined round trips however
+    many sessions match (three with sid, which also reads the sessions'
+    owners to drop them from user_sessions:<owner>), plus one PUBLISH to
+    warm authorizers, and deletes in batches of REVOKE_BATCH_SIZE. The jti is claimed first (SET NX) so
+    concurrent deliveries do the work once, and released again if the
+    removal fails so the IdP's retry is not mistaken for a duplicate.
+
+    Returns (duplicate, sessions_removed).
+    """
+    sid = claims.get('sid')
+    sub = claims.get('sub')
+
+    jti_key = session_store.logout_jti_key(key_ref(claims['jti']))
+    pipe = r.pipeline(transaction=False)
+    pipe.set(jti_key, b"1", nx=True, ex=LOGOUT_TOKEN_JTI_TTL_SECONDS)
+    if sid:
+        index_key = session_store.idp_sessions_key(key_ref(sid))
+        pipe.smembers(index_key)
+    else:
+        index_key = session_store.user_sessions_key(key_ref(sub))
+        pipe.zrange(index_key, 0, -1)
+    results = pipe.execute()
+
+    if not results[0]:
+        return True, 0
+
+    session_ids = [m.decode('utf-8') for m in results[1]]
+    try:
+        owners = {}
+        if sid and session_ids:
+            # The sessions also sit in their owners' user_sessions index
+            pipe = r.pipeline(transaction=False)
+            for s in session_ids:
+                pipe.get(session_store.owner_key(s))
+            for s, owner in zip(session_ids, pipe.execute()):
+                if owner:
+                    owners.setdefault(owner.decode('utf-8'), []).append(s)
+        pipe = r.pipeline(transaction=False)
+        for owner, ids in owners.items():
+            pipe.zrem(session_store.user_sessions_key(owner), *ids)
+        if not sid:
+            # Only once the jti is claimed: a redelivered token must not revoke
+            # sessions opened since the first one (a retry after a failure may)
+            pipe.incr(session_store.user_epoch_key(key_ref(sub)))
+        for i in range(0, len(session_ids), REVOKE_BATCH_SIZE):
+            chunk = session_ids[i:i + REVOKE_BATCH_SIZE]
+            session_store.delete(pipe, *[key for s in chunk
+                                         for key in (session_store.session_key(s), session_store.owner_key(s))])
+        pipe.delete(index_key)
+        session_store.mark_revoked(pipe, session_ids)
+        pipe.execute()
+        session_store.publish_invalidation(r, session_ids, [] if sid else [key_ref(sub)])
+    except Exception:
+        # Forget the jti so the IdP's retry is processed, not acknowledged as a duplicate
+        try:
+            r.delete(jti_key)
+        except Exception as e:
+            logger.warning(f"Failed to release logout token jti: {str(e)}")
+        raise
+    return False, len(session_ids)
+
+
+def parse_logout_token(ctx, data) -> str:
+    """Extract logout_token from a form-encoded (or JSON) POST body."""
+    raw = data.getvalue() if data else b""
+    if not raw:
+        return ""
+    content_type = ctx.Headers().get("Content-Type", ctx.Headers().get("content-type", ""))
+    if isinstance(content_type, list):
+        content_type = content_type[0] if content_type else ""
+    if "json" in content_type:
+        try:
+            return str(json.loads(raw).get("logout_token", ""))
+        except (ValueError, AttributeError):
+            return ""
+    return parse_qs(raw.decode('utf-8', 'replace')).get("logout_token", [""])[0]
+
+
+def error_response(ctx, description: str):
+    return response.Response(
+        ctx,
+        response_data=json.dumps({"error": "invalid_request", "error_description": description}),
+        status_code=400,
+        headers={"Content-Type": "application/json", "Cache-Control": "no-store"}
+    )
+
+
+@profiling.profiled("oidc_backchannel_logout")
+@tracing.traced("oidc_backchannel_logout")
+def handler(ctx, data: io.BytesIO = None):
+    """
+    Handle a back-channel logout request from the IdP.
+
+    1. Extract logout_token from the POST body
+    2. Validate signature, issuer, audience, events claim and sub/sid
+    3. Reject replays by jti (duplicates are acknowledged without rework)
+    4. Delete matching sessions from OCI Cache in batches
+    5. Return 200 with Cache-Control: no-store
+    """
+    try:
+        logout_token = parse_logout_token(ctx, data)
+        if not logout_token:
+            return error_response(ctx, "missing logout_token")
+
+        try:
+            claims = validate_logout_token(logout_token)
+        except LogoutTokenError as e:
+            logger.warning(f"Rejected logout token: {str(e)}")
+            audit.emit("oidc_backchannel_logout", "logout.rejected", reason=str(e))
+            return error_response(ctx, str(e))
+
+        with tracing.span("redis.remove_sessions"):
+            duplicate, removed = remove_sessions(get_redis_client(), claims)
+        if duplicate:
+            logger.info("Logout token already processed (duplicate jti)")
+        else:
+            target = "sid" if claims.get('sid') else "sub"
+            logger.info(f"Back-channel logout by {target}: {removed} session(s) removed")
+            audit.emit("oidc_backchannel_logout", "logout", scope=target, revoked=removed)
+            usage.count(f"logout.backchannel.{target}")
+
+        return response.Response(
+            ctx,
+            response_data="",
+            status_code=200,
+            headers={"Cache-Control": "no-store"}
+        )
+
+    except Exception as e:
+        # 5xx tells the IdP to retry later
+        logger.error(f"Error in backchannel_logout: {str(e)}")
+        return response.Response(
+            ctx,
+            response_data=json.dumps({"error": "internal_error"}),
+            status_code=500,
+            headers={"Content-Type": "application/json", "Cache-Control": "no-store"}
+        )
@@ -5,19 +5,25 @@ Handles the OAuth2 authorization code exchange after user authenticates at the I
 Creates encrypted session and stores in OCI Cache.
 """
 
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
 import io
 import os
 import json
+import time
 import base64
+import hmac
 import hashlib
 import secrets
+import audit
+import usage
 import logging
-import redis
-import oci
 import requests
 import jwt
+import tracing
+import session_store
 
 from fdk import response
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -27,31 +33,78 @@ from urllib.parse import parse_qs
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+profiling.end_import_timing("oidc_callback")
 
 # Environment variables
 OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
 OIDC_REDIRECT_URI = os.environ.get('OIDC_REDIRECT_URI')
 OCI_VAULT_CLIENT_CREDS_OCID = os.environ.get('OCI_VAULT_CLIENT_CREDS_OCID')
 OCI_VAULT_PEPPER_OCID = os.environ.get('OCI_VAULT_PEPPER_OCID')
-OCI_CACHE_ENDPOINT = os.environ.get('OCI_CACHE_ENDPOINT')
 COOKIE_DOMAIN = os.environ.get('COOKIE_DOMAIN', '')
 SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '28800'))  # 8 hours
 SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'session_id')
 DEFAULT_RETURN_TO = os.environ.get('DEFAULT_RETURN_TO', '/')
 
+# Silent renewal: keep the refresh token in the (encrypted) session so the
+# authorizer can extend it, up to SESSION_MAX_LIFETIME_SECONDS after login
+SESSION_REFRESH_ENABLED = os.environ.get('SESSION_REFRESH_ENABLED', 'false').lower() == 'true'
+SESSION_MAX_LIFETIME_SECONDS = int(os.environ.get('SESSION_MAX_LIFETIME_SECONDS', '604800'))  # 7 days
+
+# Store profile claims once per user (user_claims:<ref>:<version>) instead of
+# in every session; the authorizer reads both layouts
+CLAIMS_DEDUP_ENABLED = os.environ.get('CLAIMS_DEDUP_ENABLED', 'false').lower() == 'true'
+CLAIM_FIELDS = ('email', 'name', 'preferred_username', 'given_name', 'family_name', 'groups', 'raw_claims')
+
+# Session cookie: 'server' (default) carries only the session ID; 'stateless'
+# carries the hot claims and expiry sealed with AES-GCM, so the authorizer
+# verifies it without reading the session (see apigw_authzr). The session is
+# still stored for logout and revocation. Cookies that would exceed
+# STATELESS_COOKIE_MAX_BYTES (many groups) fall back to the session ID.
+SESSION_MODE = os.environ.get('SESSION_MODE', 'server').lower()
+STATELESS_COOKIE_MAX_BYTES = int(os.environ.get('STATELESS_COOKIE_MAX_BYTES', '3800'))
+COOKIE_FORMAT = "v1"
+# Sealed cookie field -> session field (short names keep the cookie small)
+COOKIE_FIELDS = (('i', 'sid'), ('s', 'sub'), ('e', 'email'), ('n', 'name'), ('u', 'preferred_username'),
+                 ('gn', 'given_name'), ('fn', 'family_name'), ('g', 'groups'), ('t', 'iat_ts'), ('x', 'exp_ts'))
+
+# Group membership from the Identity Domain's SCIM API instead of the
+# user_groups claim, which is truncated for users in many groups. Results are
+# cached per user (encrypted, user_groups:<ref>) for GROUPS_CACHE_SECONDS and
+# shared by all of that user's logins; failures fall back to the claim.
+GROUPS_SCIM_ENABLED = os.environ.get('GROUPS_SCIM_ENABLED', 'false').lower() == 'true'
+GROUPS_CACHE_SECONDS = int(os.environ.get('GROUPS_CACHE_SECONDS', '3600'))
+GROUPS_SCIM_PAGE_SIZE = int(os.environ.get('GROUPS_SCIM_PAGE_SIZE', '500'))
+GROUPS_SCIM_MAX_PAGES = int(os.environ.get('GROUPS_SCIM_MAX_PAGES', '20'))
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
 # In-memory cache for secrets
 _secrets_cache = {}
 
+# Kept across invocations: pooled IdP connections for SCIM, and the app
+# token (client_credentials) with its expiry
+_http_session = None
+_scim_token = None
+
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
+
 def get_vault_secret(secret_ocid: str) -> str:
     """Retrieve and decode a secret from OCI Vault."""
     if secret_ocid in _secrets_cache:
         return _secrets_cache[secret_ocid]
 
-    signer = oci.auth.signers.get_resource_principals_signer()
-    client = oci.secrets.SecretsClient({}, signer=signer)
-
-    response_data = client.get_secret_bundle(secret_ocid)
-    content = response_data.data.secret_bundle_content.content
+    content = fetch_secret_bundle_content(secret_ocid)
     decoded = base64.b64decode(content).decode('utf-8')
 
     _secrets_cache[secret_ocid] = decoded
@@ -69,14 +122,8 @@ def get_pepper() -> bytes:
     return base64.b64decode(pepper_b64)
 
 def get_redis_client():
-    """Get Redis client with TLS."""
-    return redis.Redis(
-        host=OCI_CACHE_ENDPOINT,
-        port=6379,
-        ssl=True,
-        ssl_cert_reqs="required",
-        decode_responses=False
-    )
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
 
 def derive_key(session_id: str, pepper: bytes) -> bytes:
     """Derive encryption key from session_id and pepper using HKDF."""
@@ -99,6 +146,136 @@ def encrypt_session(session_data: dict, session_id: str, pepper: bytes) -> bytes
 
     return nonce + ciphertext
 
+def seal_claims(claims: dict, owner: str, pepper: bytes) -> tuple:
+    """
+    Encrypt a user's shared claims with a per-user key (HKDF of the pepper).
+
+    Returns (version, blob). The version is an HMAC of the content, so every
+    login with unchanged claims maps to the same user_claims key.
+    """
+    key_material = HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=pepper,
+        info=b"user_claims"
+    ).derive(owner.encode('utf-8'))
+    plaintext = json.dumps(claims, sort_keys=True).encode('utf-8')
+    version = hmac.new(key_material[32:], plaintext, hashlib.sha256).hexdigest()[:16]
+    nonce = secrets.token_bytes(12)
+    return version, nonce + AESGCM(key_material[:32]).encrypt(nonce, plaintext, version.encode('utf-8'))
+
+def seal_session_cookie(session_data: dict, session_id: str, pepper: bytes) -> str:
+    """Sealed cookie value "<format>.<base64url(nonce || AES-GCM ciphertext)>" (format is the AAD)."""
+    fields = dict(session_data, sid=session_id)
+    payload = {short: fields[name] for short, name in COOKIE_FIELDS if fields.get(name) not in (None, '', [])}
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=pepper,
+        info=b"cookie_seal"
+    ).derive(b"session_cookie")
+    nonce = secrets.token_bytes(12)
+    plaintext = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    sealed = nonce + AESGCM(key).encrypt(nonce, plaintext, COOKIE_FORMAT.encode('utf-8'))
+    return f"{COOKIE_FORMAT}.{base64.urlsafe_b64encode(sealed).rstrip(b'=').decode('ascii')}"
+
+def user_ref(sub: str) -> str:
+    """Stable, non-reversible per-user key component derived from sub."""
+    return hashlib.sha256(sub.encode('utf-8')).hexdigest()[:32]
+
+def derive_groups_key(owner: str, pepper: bytes) -> bytes:
+    """Per-user key for the cached group membership."""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=pepper,
+        info=b"user_groups"
+    )
+    return hkdf.derive(owner.encode('utf-8'))
+
+def get_http_session() -> requests.Session:
+    """HTTP session reused across invocations, so SCIM pages share pooled connections."""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
+def get_scim_token(token_endpoint: str, client_id: str, client_secret: str) -> str:
+    """App access token for the SCIM API, reused until a minute before it expires."""
+    global _scim_token
+    if _scim_token and _scim_token[1] > time.time() + 60:
+        return _scim_token[0]
+    token_data = {
+        'grant_type': 'client_credentials',
+        'scope': 'urn:opc:idm:__myscopes__'
+    }
+    with tracing.span("idp.scim_token", **{"http.url": token_endpoint}):
+        token_resp = get_http_session().post(token_endpoint, data=token_data, auth=(client_id, client_secret),
+                                             timeout=10)
+    token_resp.raise_for_status()
+    tokens = token_resp.json()
+    _scim_token = (tokens['access_token'], time.time() + int(tokens.get('expires_in', 3600)))
+    return _scim_token[0]
+
+def scim_get(path: str, params: dict, token: str) -> dict:
+    """GET one SCIM resource list from the Identity Domain."""
+    global _scim_token
+    url = f"{OCI_IAM_BASE_URL}/admin/v1/{path}"
+    with tracing.span("idp.scim", **{"http.url": url}) as s:
+        resp = get_http_session().get(url, params=params, headers={"Authorization": f"Bearer {token}"}, timeout=10)
+        if s is not None:
+            s.set("http.status_code", resp.status_code)
+    if resp.status_code == 401:
+        # Revoked or rotated app token: request a new one next time
+        _scim_token = None
+    resp.raise_for_status()
+    return resp.json()
+
+def fetch_scim_groups(sub: str, token: str) -> list:
+    """All groups of the user named by sub (the Identity Domain user name), one page at a time."""
+    quoted = sub.replace('\\', '\\\\').replace('"', '\\"')
+    users = scim_get("Users", {'filter': f'userName eq "{quoted}"', 'attributes': 'id', 'count': 1}, token)
+    if not users.get('Resources'):
+        raise LookupError("user not found in SCIM")
+    user_id = users['Resources'][0]['id']
+
+    groups = []
+    start_index = 1
+    for _ in range(GROUPS_SCIM_MAX_PAGES):
+        page = scim_get("Groups", {
+            'filter': f'members.value eq "{user_id}"',
+            'attributes': 'displayName',
+            'count': GROUPS_SCIM_PAGE_SIZE,
+            'startIndex': start_index
+        }, token)
+        resources = page.get('Resources') or []
+        groups.extend(group['displayName'] for group in resources if group.get('displayName'))
+        start_index += len(resources)
+        if not resources or start_index > int(page.get('totalResults', 0)):
+            return sorted(groups)
+    raise RuntimeError(f"more than {GROUPS_SCIM_MAX_PAGES} pages of groups")
+
+def resolve_groups(r, owner: str, sub: str, pepper: bytes, token_endpoint: str, client_id: str,
+                   client_secret: str) -> list:
+    """The user's groups from the shared membership cache, fetched through SCIM on a miss."""
+    key = session_store.user_groups_key(owner)
+    aesgcm = AESGCM(derive_groups_key(owner, pepper))
+    with tracing.span("redis.get_user_groups"):
+        blob = r.get(key)
+    if blob:
+        try:
+            return json.loads(aesgcm.decrypt(blob[:12], blob[12:], None))
+        except InvalidTag:
+            # Sealed with a pepper that was rotated out; fetch again
+            pass
+
+    groups = fetch_scim_groups(sub, get_scim_token(token_endpoint, client_id, client_secret))
+    nonce = secrets.token_bytes(12)
+    with tracing.span("redis.set_user_groups"):
+        r.set(key, nonce + aesgcm.encrypt(nonce, json.dumps(groups).encode('utf-8'), None), ex=GROUPS_CACHE_SECONDS)
+    logger.info(f"Resolved {len(groups)} groups through SCIM for {owner[:8]}...")
+    return groups
+
 def hash_user_agent(user_agent: str) -> str:
     """Hash User-Agent for session binding."""
     if not user_agent:
@@ -154,6 +331,8 @@ def validate_id_token(id_token: str, issuer: str, client_id: str, nonce: str) ->
         logger.error(f"Failed to decode ID Token: {e}")
         return None
 
+@profiling.profiled("oidc_callback")
+@tracing.traced("oidc_callback")
 def handler(ctx, data: io.BytesIO = None):
     """
     Handle OIDC callback.
@@ -207,6 +386,8 @@ def handler(ctx, data: io.BytesIO = None):
 
         if error:
             logger.error(f"OIDC error: {error} - {error_description}")
+            audit.emit("oidc_callback", "login.failure", reason="idp_error", error=error)
+            usage.count("login.failure.idp_error")
             return response.Response(
                 ctx,
                 response_data=json.dumps({"error": error, "description": error_description}),
@@ -216,6 +397,8 @@ def handler(ctx, data: io.BytesIO = None):
 
         if not code or not state:
             logger.error("Missing code or state parameter")
+            audit.emit("oidc_callback", "login.failure", reason="missing_parameters")
+            usage.count("login.failure.missing_parameters")
             return response.Response(
                 ctx,
                 response_data=json.dumps({"error": "missing_parameters"}),
@@ -225,11 +408,13 @@ def handler(ctx, data: io.BytesIO = None):
 
         # Retrieve state data from cache (atomic GETDEL to prevent replay)
         r = get_redis_client()
-        state_data_raw = r.execute_command('GETDEL', f"state:{state}")
+        with tracing.span("redis.consume_state"):
+            state_data_raw = r.execute_command('GETDEL', session_store.state_key(state))
 
         if not state_data_raw:
             logger.error(f"State not found or already used: {state[:8]}...")
-            r.close()
+            audit.emit("oidc_callback", "login.failure", reason="invalid_state")
+            usage.count("login.failure.invalid_state")
             return response.Response(
                 ctx,
                 response_data=json.dumps({"error": "invalid_state"}),
@@ -238,6 +423,8 @@ def handler(ctx, data: io.BytesIO = None):
             )
 
         state_data = json.loads(state_data_raw.decode('utf-8'))
+        # Join the trace started by oidc_authn for this login
+        tracing.continue_from(state_data.get('traceparent'))
         code_verifier = state_data.get('code_verifier')
         nonce = state_data.get('nonce')
         return_to = state_data.get('return_to', DEFAULT_RETURN_TO)
@@ -247,7 +434,8 @@ def handler(ctx, data: io.BytesIO = None):
 
         # Get OpenID configuration
         config_url = f"{OCI_IAM_BASE_URL}/.well-known/openid-configuration"
-        config_resp = requests.get(config_url, timeout=10)
+        with tracing.span("idp.discovery", **{"http.url": config_url}):
+            config_resp = requests.get(config_url, timeout=10)
         config_resp.raise_for_status()
         openid_config = config_resp.json()
 
@@ -264,7 +452,10 @@ def handler(ctx, data: io.BytesIO = None):
             'code_verifier': code_verifier
         }
 
-        token_resp = requests.post(token_endpoint, data=token_data, timeout=30)
+        with tracing.span("idp.token_exchange", **{"http.url": token_endpoint}) as s:
+            token_resp = requests.post(token_endpoint, data=token_data, timeout=30)
+            if s is not None:
+                s.set("http.status_code", token_resp.status_code)
         token_resp.raise_for_status()
         tokens = token_resp.json()
 
@@ -272,7 +463,8 @@ def handler(ctx, data: io.BytesIO = None):
         access_token = tokens.get('access_token')
         if not id_token:
             logger.error("No id_token in token response")
-            r.close()
+            audit.emit("oidc_callback", "login.failure", reason="no_id_token")
+            usage.count("login.failure.no_id_token")
             return response.Response(
                 ctx,
                 response_data=json.dumps({"error": "no_id_token"}),
@@ -284,7 +476,8 @@ def handler(ctx, data: io.BytesIO = None):
         validated_claims = validate_id_token(id_token, issuer, client_id, nonce)
 
         if not validated_claims:
-            r.close()
+            audit.emit("oidc_callback", "login.failure", reason="invalid_id_token")
+            usage.count("login.failure.invalid_id_token")
             return response.Response(
                 ctx,
                 response_data=json.dumps({"error": "invalid_id_token"}),
@@ -292,9 +485,13 @@ def handler(ctx, data: io.BytesIO = None):
                 headers={"Content-Type": "application/json"}
             )
 
-        # Create session
+        # Create session under the user's current revocation epoch
+        owner = user_ref(validated_claims.get('sub'))
+        with tracing.span("redis.get_user_epoch"):
+            current_epoch = int(r.get(session_store.user_epoch_key(owner)) or 0)
         session_id = secrets.token_urlsafe(32)
-        session_exp = datetime.now(timezone.utc) + timedelta(seconds=SESSION_TTL_SECONDS)
+        session_iat = datetime.now(timezone.utc)
+        session_exp = session_iat + timedelta(seconds=SESSION_TTL_SECONDS)
 
         # Read claims from ID token (including custom claims: user_email, user_given_name, user_family_name, user_groups)
         session_data = {
@@ -307,23 +504,69 @@ def handler(ctx, data: io.BytesIO = None):
             'groups': validated_claims.get('user_groups') or validated_claims.get('groups') or [],
             'ua_hash': hash_user_agent(user_agent),
             'exp': session_exp.isoformat(),
-            'iat': datetime.now(timezone.utc).isoformat(),
+            'exp_ts': int(session_exp.timestamp()),
+            'iat': session_iat.isoformat(),
+            'epoch': current_epoch,
             'id_token': id_token,
             'raw_claims': list(validated_claims.keys())
         }
+        # A sealed cookie cannot be extended by the authorizer, so stateless
+        # sessions are not renewable
+        refresh_token = tokens.get('refresh_token') if SESSION_REFRESH_ENABLED and SESSION_MODE != 'stateless' else None
+        if refresh_token:
+            session_data['refresh_token'] = refresh_token
 
-        # Encrypt and store session
         pepper = get_pepper()
-        encrypted_session = encrypt_session(session_data, session_id, pepper)
-        r.set(f"session:{session_id}", encrypted_session, ex=SESSION_TTL_SECONDS)
-        r.close()
+        if GROUPS_SCIM_ENABLED:
+            try:
+                session_data['groups'] = resolve_groups(r, owner, session_data['sub'], pepper, token_endpoint,
+                                                        client_id, client_secret)
+            except Exception as e:
+                logger.warning(f"SCIM group lookup failed, using the user_groups claim: {str(e)}")
 
-        # Build Set-Cookie header
-        cookie_expires = session_exp.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        # Encrypt and store session
+        cookie_value = session_id
+        if SESSION_MODE == 'stateless':
+            sealed = seal_session_cookie(dict(session_data, iat_ts=int(session_iat.timestamp())), session_id, pepper)
+            if len(sealed) <= STATELESS_COOKIE_MAX_BYTES:
+                cookie_value = sealed
+            else:
+                logger.warning(f"Sealed cookie too large ({len(sealed)} bytes), using a session ID cookie")
+        pipe = r.pipeline(transaction=False)
+        if CLAIMS_DEDUP_ENABLED:
+            # One copy of the claims per user; the session keeps only the
+            # version, and the current pointer moves all sessions to new claims
+            claims = {field: session_data.pop(field) for field in CLAIM_FIELDS}
+            version, claims_blob = seal_claims(claims, owner, pepper)
+            session_data['claims_version'] = version
+            pipe.set(session_store.user_claims_key(owner, version), claims_blob, ex=SESSION_TTL_SECONDS)
+            pipe.set(session_store.user_claims_current_key(owner), version, ex=SESSION_TTL_SECONDS)
+        encrypted_session = encrypt_session(session_data, session_id, pepper)
+        pipe.set(session_store.session_key(session_id), encrypted_session, ex=SESSION_TTL_SECONDS)
+        pipe.set(session_store.owner_key(session_id), owner, ex=SESSION_TTL_SECONDS)
+        # Per-user index of live sessions (score = expiry), pruned and
+        # re-expired on every login so its lifetime tracks the newest session
+        index_key = session_store.user_sessions_key(owner)
+        pipe.zadd(index_key, {session_id: int(session_exp.timestamp())})
+        pipe.zremrangebyscore(index_key, '-inf', int(datetime.now(timezone.utc).timestamp()))
+        pipe.expire(index_key, SESSION_TTL_SECONDS)
+        # Index by IdP session (sid) so back-channel logout can target it
+        if validated_claims.get('sid'):
+            sid_ref = hashlib.sha256(validated_claims['sid'].encode('utf-8')).hexdigest()[:32]
+            sid_key = session_store.idp_sessions_key(sid_ref)
+            pipe.sadd(sid_key, session_id)
+            pipe.expire(sid_key, SESSION_TTL_SECONDS)
+        with tracing.span("redis.store_session"):
+            pipe.execute()
+
+        # Build Set-Cookie header (a renewable session outlives its first TTL,
+        # so its cookie lasts for the maximum lifetime instead)
+        cookie_max_age = SESSION_MAX_LIFETIME_SECONDS if refresh_token else SESSION_TTL_SECONDS
+        cookie_expires = (datetime.now(timezone.utc) + timedelta(seconds=cookie_max_age)).strftime("%a, %d %b %Y %H:%M:%S GMT")
         cookie_parts = [
-            f"{SESSION_COOKIE_NAME}={session_id}",
+            f"{SESSION_COOKIE_NAME}={cookie_value}",
             f"Expires={cookie_expires}",
-            f"Max-Age={SESSION_TTL_SECONDS}",
+            f"Max-Age={cookie_max_age}",
             "Path=/",
             "HttpOnly",
             "Secure",
@@ -335,6 +578,10 @@ def handler(ctx, data: io.BytesIO = None):
         set_cookie_header = "; ".join(cookie_parts)
 
         logger.info(f"Session created for user: {validated_claims.get('sub')}")
+        audit.emit("oidc_callback", "login.success", user=owner)
+        usage.count("login.success", user=owner, session=session_store.revocation_ref(session_id))
+        audit.emit("oidc_callback", "session.created", user=owner, session=audit.ref(session_id),
+                   exp=session_data['exp'], renewable=bool(refresh_token))
 
         # Redirect to original URL
         return response.Response(
@@ -350,6 +597,8 @@ def handler(ctx, data: io.BytesIO = None):
 
     except Exception as e:
         logger.error(f"Error in oidc_callback: {str(e)}")
+        audit.emit("oidc_callback", "login.failure", reason="internal_error")
+        usage.count("login.failure.internal_error")
         return response.Response(
             ctx,
             response_data=json.dumps({"error": "internal_error", "message": str(e)}),
@@ -5,17 +5,21 @@ Handles user-initiated logout with proper session cleanup.
 Clears session from OCI Cache and redirects to IdP logout with id_token_hint.
 """
 
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
 import io
 import os
 import json
 import base64
+import audit
+import usage
 import logging
-import redis
-import oci
 import requests
+import tracing
+import session_store
 
 from fdk import response
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit, parse_qs
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -23,41 +27,49 @@ from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+profiling.end_import_timing("oidc_logout")
 
 # Environment variables
 OCI_IAM_BASE_URL = os.environ.get('OCI_IAM_BASE_URL')
-OCI_CACHE_ENDPOINT = os.environ.get('OCI_CACHE_ENDPOINT')
 OCI_VAULT_PEPPER_OCID = os.environ.get('OCI_VAULT_PEPPER_OCID')
+OCI_VAULT_PEPPER_PREVIOUS_OCID = os.environ.get('OCI_VAULT_PEPPER_PREVIOUS_OCID')
 POST_LOGOUT_REDIRECT_URI = os.environ.get('POST_LOGOUT_REDIRECT_URI', '/')
 SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'session_id')
 COOKIE_DOMAIN = os.environ.get('COOKIE_DOMAIN', '')
+REVOKE_BATCH_SIZE = int(os.environ.get('REVOKE_BATCH_SIZE', '500'))
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
 
 # In-memory cache for secrets
 _secrets_cache = {}
 
 def get_redis_client():
-    """Get Redis client with TLS."""
-    return redis.Redis(
-        host=OCI_CACHE_ENDPOINT,
-        port=6379,
-        ssl=True,
-        ssl_cert_reqs="required",
-        decode_responses=False
-    )
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
 
-def get_pepper() -> bytes:
-    """Retrieve HKDF pepper from Vault."""
-    if OCI_VAULT_PEPPER_OCID in _secrets_cache:
-        return base64.b64decode(_secrets_cache[OCI_VAULT_PEPPER_OCID])
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
 
-    signer = oci.auth.signers.get_resource_principals_signer()
-    client = oci.secrets.SecretsClient({}, signer=signer)
+def get_pepper(secret_ocid: str = None) -> bytes:
+    """Retrieve HKDF pepper from Vault (the current one unless another secret is given)."""
+    secret_ocid = secret_ocid or OCI_VAULT_PEPPER_OCID
+    if secret_ocid in _secrets_cache:
+        return base64.b64decode(_secrets_cache[secret_ocid])
 
-    resp = client.get_secret_bundle(OCI_VAULT_PEPPER_OCID)
-    content = resp.data.secret_bundle_content.content
+    content = fetch_secret_bundle_content(secret_ocid)
     decoded = base64.b64decode(content).decode('utf-8')
 
-    _secrets_cache[OCI_VAULT_PEPPER_OCID] = decoded
+    _secrets_cache[secret_ocid] = decoded
     return base64.b64decode(decoded)
 
 def decrypt_session(encrypted_data: bytes, session_id: str, pepper: bytes) -> dict:
@@ -79,6 +91,66 @@ def decrypt_session(encrypted_data: bytes, session_id: str, pepper: bytes) -> di
 
     return json.loads(plaintext.decode('utf-8'))
 
+def session_id_from_cookie(cookie_value: str) -> str:
+    """
+    Session ID from the cookie value: the value itself, or the sid inside a
+    sealed cookie (oidc_callback SESSION_MODE=stateless, "<format>.<base64url>").
+    """
+    if '.' not in cookie_value:
+        return cookie_value
+    cookie_format, sealed = cookie_value.split('.', 1)
+    blob = base64.urlsafe_b64decode(sealed + '=' * (-len(sealed) % 4))
+    peppers = [get_pepper()]
+    if OCI_VAULT_PEPPER_PREVIOUS_OCID:
+        peppers.append(get_pepper(OCI_VAULT_PEPPER_PREVIOUS_OCID))
+    for pepper in peppers:
+        key = HKDF(algorithm=hashes.SHA256(), length=32, salt=pepper, info=b"cookie_seal").derive(b"session_cookie")
+        try:
+            return json.loads(AESGCM(key).decrypt(blob[:12], blob[12:], cookie_format.encode('utf-8')))['i']
+        except InvalidTag:
+            continue
+    raise ValueError("sealed session cookie does not verify")
+
+def get_header(ctx, name: str) -> str:
+    """Request header value ('' if absent)."""
+    headers = ctx.Headers()
+    value = headers.get(name, headers.get(name.lower(), ""))
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    return value
+
+def is_same_origin(ctx) -> bool:
+    """True when Origin (else Referer) names the host the request was sent to."""
+    source = get_header(ctx, "Origin") or get_header(ctx, "Referer")
+    if not source or source == "null":
+        return False
+    host = urlsplit(get_header(ctx, "Fn-Http-Request-Url")).netloc or get_header(ctx, "Host")
+    return bool(host) and urlsplit(source).netloc.lower() == host.lower()
+
+def wants_logout_everywhere(ctx, data) -> bool:
+    """
+    True when the request asks to end all of the user's sessions (scope=all).
+
+    The scope is read from the query string, else from a JSON or form body.
+    Only a same-origin POST may use it: a link or image on another site
+    would otherwise log the user out of every device. Anything else falls
+    back to ending the current session.
+    """
+    request_url = get_header(ctx, "Fn-Http-Request-Url")
+    scope = parse_qs(urlsplit(request_url).query).get("scope", [""])[0]
+    if not scope and data:
+        raw = data.getvalue() or b""
+        try:
+            scope = str(json.loads(raw or b"{}").get("scope", ""))
+        except Exception:
+            scope = parse_qs(raw.decode('utf-8', 'replace')).get("scope", [""])[0]
+    if scope != "all":
+        return False
+    if ctx.Method().upper() != "POST" or not is_same_origin(ctx):
+        logger.warning("Ignoring scope=all: only a same-origin POST may log out everywhere")
+        return False
+    return True
+
 def parse_cookies(cookie_header: str) -> dict:
     """Parse Cookie header into dict."""
     cookies = {}
@@ -105,13 +177,15 @@ def build_clear_cookie() -> str:
         clear_cookie_parts.append(f"Domain={COOKIE_DOMAIN}")
     return "; ".join(clear_cookie_parts)
 
+@profiling.profiled("oidc_logout")
+@tracing.traced("oidc_logout")
 def handler(ctx, data: io.BytesIO = None):
     """
     Handle logout request.
 
     1. Extract session_id from cookie
     2. Retrieve and decrypt session to get id_token
-    3. Delete session from OCI Cache
+    3. Delete session from OCI Cache (or all of the user's sessions with a same-origin POST of scope=all)
     4. Clear session cookie
     5. Redirect to IdP logout endpoint with id_token_hint
     """
@@ -128,27 +202,54 @@ def handler(ctx, data: io.BytesIO = None):
         # Try to get id_token from session before deleting
         if session_id:
             try:
+                session_id = session_id_from_cookie(session_id)
                 r = get_redis_client()
-                encrypted_session = r.get(f"session:{session_id}")
+                with tracing.span("redis.get_session"):
+                    encrypted_session, owner = r.mget(session_store.session_key(session_id), session_store.owner_key(session_id))
 
                 if encrypted_session:
                     # Decrypt to get id_token
                     try:
-                        pepper = get_pepper()
-                        session_data = decrypt_session(encrypted_session, session_id, pepper)
+                        try:
+                            session_data = decrypt_session(encrypted_session, session_id, get_pepper())
+                        except InvalidTag:
+                            if not OCI_VAULT_PEPPER_PREVIOUS_OCID:
+                                raise
+                            # Sealed before a pepper rotation and not migrated yet
+                            session_data = decrypt_session(encrypted_session, session_id,
+                                                           get_pepper(OCI_VAULT_PEPPER_PREVIOUS_OCID))
                         id_token = session_data.get('id_token')
                         logger.info(f"Retrieved id_token for logout: {id_token[:20] if id_token else 'None'}...")
                     except Exception as e:
                         logger.warning(f"Failed to decrypt session for id_token: {str(e)}")
 
-                    # Delete session from cache
-                    deleted = r.delete(f"session:{session_id}")
+                    everywhere = bool(owner) and wants_logout_everywhere(ctx, data)
+                    if everywhere:
+                        with tracing.span("redis.revoke_user_sessions"):
+                            revoked = session_store.revoke_user_sessions(r, [owner.decode('utf-8')], REVOKE_BATCH_SIZE)
+                        logger.info(f"Logged out everywhere: {revoked} session(s) revoked")
+                        audit.emit("oidc_logout", "logout", scope="all", user=owner.decode('utf-8'),
+                                   session=audit.ref(session_id), revoked=revoked)
+                        usage.count("logout.all")
+
+                    # Delete session (and its owner and index entries) from cache
+                    with tracing.span("redis.delete_session"):
+                        pipe = r.pipeline(transaction=False)
+                        pipe.delete(session_store.session_key(session_id), session_store.owner_key(session_id))
+                        if owner:
+                            pipe.zrem(session_store.user_sessions_key(owner.decode('utf-8')), session_id)
+                        session_store.mark_revoked(pipe, [session_id])
+                        deleted = pipe.execute()[0]
+                        session_store.publish_invalidation(r, [session_id])
                     if deleted:
                         logger.info(f"Session deleted: {session_id[:8]}...")
+                        if not everywhere:
+                            audit.emit("oidc_logout", "logout", scope="session",
+                                       user=owner.decode('utf-8') if owner else "", session=audit.ref(session_id))
+                            usage.count("logout.session")
                     else:
                         logger.info(f"Session not found in cache: {session_id[:8]}...")
 
-                r.close()
             except Exception as e:
                 logger.warning(f"Failed to process session from cache: {str(e)}")
                 # Continue with logout even if cache operations fail
@@ -157,7 +258,8 @@ def handler(ctx, data: io.BytesIO = None):
         redirect_url = POST_LOGOUT_REDIRECT_URI
         try:
             config_url = f"{OCI_IAM_BASE_URL}/.well-known/openid-configuration"
-            config_resp = requests.get(config_url, timeout=10)
+            with tracing.span("idp.discovery", **{"http.url": config_url}):
+                config_resp = requests.get(config_url, timeout=10)
             config_resp.raise_for_status()
             openid_config = config_resp.json()
 
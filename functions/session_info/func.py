@@ -0,0 +1,267 @@
+"""
+Session Info Function
+
+GET /auth/session returns the signed-in user's profile as JSON, read
+directly from the decrypted session, so single-page apps do not need a
+backend route (and an authorizer invocation) to echo the X-User-* headers.
+
+Responses carry a strong ETag that changes whenever the session or the
+user's claims change. A poll with a matching If-None-Match gets 304 with
+no body. Cache-Control is private, and Vary: Cookie keeps responses for
+different sessions apart.
+
+Session checks match apigw_authzr: expiry, the user's revocation epoch,
+shared claims (CLAIMS_DEDUP_ENABLED) and sealed cookies (SESSION_MODE=stateless,
+whose server-side session is read here so a logout applies immediately).
+"""
+
+import profiling  # must stay first: times the imports below when PROFILE_MODE=imports
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import tracing
+import session_store
+
+from fdk import response
+from datetime import datetime
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+profiling.end_import_timing("session_info")
+
+# Environment variables
+OCI_VAULT_PEPPER_OCID = os.environ.get('OCI_VAULT_PEPPER_OCID')
+OCI_VAULT_PEPPER_PREVIOUS_OCID = os.environ.get('OCI_VAULT_PEPPER_PREVIOUS_OCID')
+SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'session_id')
+SESSION_COOKIE_PREFIX = SESSION_COOKIE_NAME + '='
+# 0 (default): browsers keep the response but revalidate every time (a
+# matching ETag costs a 304 with no body); > 0: reuse it for that many
+# seconds without asking, at the cost of showing a logout that late
+SESSION_INFO_MAX_AGE_SECONDS = int(os.environ.get('SESSION_INFO_MAX_AGE_SECONDS', '0'))
+
+# Vault client: 'sdk' (OCI SDK) or 'lite' (built-in signer, no SDK import)
+VAULT_CLIENT = os.environ.get('VAULT_CLIENT', 'sdk').lower()
+
+# Session fields returned to the browser (never tokens or the session ID)
+PROFILE_FIELDS = ('sub', 'email', 'name', 'preferred_username', 'given_name', 'family_name')
+
+# In-memory cache for secrets
+_secrets_cache = {}
+
+
+def get_redis_client():
+    """Get the shared OCI Cache client (standalone or cluster, see session_store)."""
+    return session_store.get_client()
+
+
+def fetch_secret_bundle_content(secret_ocid: str) -> str:
+    """Fetch base64 secret bundle content with the configured Vault client."""
+    with tracing.span("vault.get_secret_bundle", **{"vault.client": VAULT_CLIENT}):
+        if VAULT_CLIENT == 'lite':
+            import vault_client
+            return vault_client.get_secret_bundle_content(secret_ocid)
+        import oci
+        signer = oci.auth.signers.get_resource_principals_signer()
+        client = oci.secrets.SecretsClient({}, signer=signer)
+        response_data = client.get_secret_bundle(secret_ocid)
+        return response_data.data.secret_bundle_content.content
+
+
+def get_peppers() -> list:
+    """Current pepper, then the one being rotated out (if configured)."""
+    peppers = []
+    for secret_ocid in (OCI_VAULT_PEPPER_OCID, OCI_VAULT_PEPPER_PREVIOUS_OCID):
+        if not secret_ocid:
+            continue
+        if secret_ocid not in _secrets_cache:
+            content = fetch_secret_bundle_content(secret_ocid)
+            _secrets_cache[secret_ocid] = base64.b64decode(content).decode('utf-8')
+        peppers.append(base64.b64decode(_secrets_cache[secret_ocid]))
+    return peppers
+
+
+def open_with_peppers(blob: bytes, peppers: list, salt_input: bytes, info: bytes, aad: bytes = None,
+                      length: int = 32) -> dict:
+    """AES-GCM decrypt nonce || ciphertext with an HKDF key, trying each pepper in turn."""
+    for pepper in peppers:
+        key = HKDF(algorithm=hashes.SHA256(), length=length, salt=pepper, info=info).derive(salt_input)
+        try:
+            return json.loads(AESGCM(key[:32]).decrypt(blob[:12], blob[12:], aad))
+        except InvalidTag:
+            continue
+    raise InvalidTag()
+
+
+def session_id_from_cookie(cookie_value: str, peppers: list) -> str:
+    """Session ID from the cookie value, or from inside a sealed cookie ("<format>.<base64url>")."""
+    if '.' not in cookie_value:
+        return cookie_value
+    cookie_format, sealed = cookie_value.split('.', 1)
+    blob = base64.urlsafe_b64decode(sealed + '=' * (-len(sealed) % 4))
+    return open_with_peppers(blob, peppers, b"session_cookie", b"cookie_seal", cookie_format.encode('utf-8'))['i']
+
+
+def find_cookie(cookie_header: str, prefix: str = SESSION_COOKIE_PREFIX):
+    """Return the value of one cookie ('name='), or None (as in apigw_authzr)."""
+    start = 0
+    while True:
+        i = cookie_header.find(prefix, start)
+        if i < 0:
+            return None
+        j = i - 1
+        while j >= 0 and cookie_header[j] == ' ':
+            j -= 1
+        if j < 0 or cookie_header[j] == ';':
+            i += len(prefix)
+            end = cookie_header.find(';', i)
+            return (cookie_header[i:end] if end >= 0 else cookie_header[i:]).strip()
+        start = i + 1
+
+
+def get_header(ctx, name: str) -> str:
+    """Request header value ('' if absent)."""
+    headers = ctx.Headers()
+    value = headers.get(name, headers.get(name.lower(), ""))
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    return value
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def load_session(session_id: str, peppers: list):
+    """
+    Read, decrypt and check a session, merging the user's shared claims.
+
+    Returns (session_data, reason): reason is '' for a valid session, or why
+    it is not ('session_not_found', 'session_expired', 'session_revoked').
+    """
+    r = get_redis_client()
+    with tracing.span("redis.get_session"):
+        encrypted_session, owner = r.mget(session_store.session_key(session_id), session_store.owner_key(session_id))
+    if not encrypted_session:
+        return None, "session_not_found"
+    session_data = open_with_peppers(encrypted_session, peppers, session_id.encode('utf-8'), b"session_encryption")
+
+    exp_ts = session_data.get('exp_ts')
+    if exp_ts is None and session_data.get('exp'):
+        exp_ts = datetime.fromisoformat(session_data['exp'].replace('Z', '+00:00')).timestamp()
+    if exp_ts is not None and time.time() > exp_ts:
+        return None, "session_expired"
+
+    if not owner:
+        return session_data, ""
+    owner = owner.decode('utf-8')
+    with tracing.span("redis.get_user_state"):
+        epoch, claims_version = r.mget(session_store.user_epoch_key(owner),
+                                       session_store.user_claims_current_key(owner))
+    if int(session_data.get('epoch', 0)) < int(epoch or 0):
+        return None, "session_revoked"
+
+    # Deduplicated sessions carry only a version; the current pointer wins
+    if session_data.get('claims_version'):
+        version = claims_version.decode('utf-8') if claims_version else session_data['claims_version']
+        with tracing.span("redis.get_claims"):
+            blob = r.get(session_store.user_claims_key(owner, version))
+        if blob is None:
+            raise KeyError(f"claims version {version} not found")
+        session_data.update(open_with_peppers(blob, peppers, owner.encode('utf-8'), b"user_claims",
+                                              version.encode('utf-8'), length=64))
+    return session_data, ""
+
+
+def build_profile(session_data: dict) -> dict:
+    """The JSON body: profile claims, groups and session times."""
+    profile = {field: session_data.get(field) or "" for field in PROFILE_FIELDS}
+    groups = session_data.get('groups') or []
+    profile['groups'] = groups if isinstance(groups, list) else [g for g in str(groups).split(',') if g]
+    profile['session'] = {
+        "iat": session_data.get('iat') or "",
+        "exp": session_data.get('exp') or "",
+    }
+    return profile
+
+
+def session_etag(session_id: str, body: str) -> str:
+    """Strong ETag: identical for byte-identical bodies of the same session."""
+    digest = hashlib.sha256(session_store.revocation_ref(session_id).encode('utf-8') + body.encode('utf-8'))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def error_response(ctx, status_code: int, error: str):
+    """JSON error response that browsers never store."""
+    return response.Response(
+        ctx,
+        response_data=json.dumps({"error": error}),
+        status_code=status_code,
+        headers={"Content-Type": "application/json", "Cache-Control": "no-store", "Vary": "Cookie"}
+    )
+
+
+@profiling.profiled("session_info")
+@tracing.traced("session_info")
+def handler(ctx, data: io.BytesIO = None):
+    """
+    Return the current session's profile.
+
+    200 with the profile and an ETag; 304 when If-None-Match matches; 401
+    with {"error": reason} without a valid session; 503 when the cache or
+    Vault cannot be reached.
+    """
+    cookie_header = get_header(ctx, "Cookie")
+    cookie_value = find_cookie(cookie_header) if cookie_header else None
+    if not cookie_value:
+        return error_response(ctx, 401, "no_session")
+
+    try:
+        peppers = get_peppers()
+    except Exception as e:
+        logger.error(f"Failed to get pepper from Vault: {str(e)}")
+        return error_response(ctx, 503, "vault_error")
+
+    try:
+        session_id = session_id_from_cookie(cookie_value, peppers)
+    except Exception as e:
+        logger.info(f"Invalid sealed session cookie: {str(e)}")
+        return error_response(ctx, 401, "invalid_session")
+
+    try:
+        session_data, reason = load_session(session_id, peppers)
+    except InvalidTag:
+        logger.info(f"Session does not decrypt: {session_id[:8]}...")
+        return error_response(ctx, 401, "invalid_session")
+    except Exception as e:
+        logger.error(f"Failed to load session: {str(e)}")
+        return error_response(ctx, 503, "cache_error")
+    if reason:
+        logger.info(f"No valid session ({reason}): {session_id[:8]}...")
+        return error_response(ctx, 401, reason)
+
+    body = json.dumps(build_profile(session_data), sort_keys=True, separators=(',', ':'))
+    etag = session_etag(session_id, body)
+    if SESSION_INFO_MAX_AGE_SECONDS > 0:
+        cache_control = f"private, max-age={SESSION_INFO_MAX_AGE_SECONDS}"
+    else:
+        cache_control = "private, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Cookie"}
+
+    if etag_matches(get_header(ctx, "If-None-Match"), etag):
+        return response.Response(ctx, response_data="", status_code=304, headers=headers)
+    headers["Content-Type"] = "application/json"
+    return response.Response(ctx, response_data=body, status_code=200, headers=headers)
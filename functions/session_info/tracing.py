@@ -0,0 +1,283 @@
+"""
+Trace Context Propagation
+
+Minimal W3C Trace Context (traceparent) support and span recording for the
+OIDC functions. Spans are exported in OTLP/JSON so any OpenTelemetry
+collector can ingest them; scripts/trace_collector.py is a local stand-in.
+
+This module is copied verbatim into every function directory (each function
+is built as its own image). Keep the copies identical.
+
+Configuration (environment):
+    TRACE_EXPORTER       none (default) | log | otlp
+    TRACE_OTLP_ENDPOINT  OTLP/HTTP traces URL (default http://localhost:4318/v1/traces)
+    TRACE_EXPORT_TIMEOUT Seconds to wait on the collector (default 2)
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import secrets
+import functools
+import threading
+import contextvars
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'none').lower()
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_EXPORT_TIMEOUT = float(os.environ.get('TRACE_EXPORT_TIMEOUT', '2'))
+
+ENABLED = TRACE_EXPORTER not in ('', 'none', 'off')
+
+# Span kinds (OTLP enum values)
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """A single timed operation belonging to a trace."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind',
+                 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace, name: str, parent_id: str = '', kind: int = KIND_CLIENT):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = {}
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+
+class Trace:
+    """Spans recorded during one function invocation."""
+
+    def __init__(self, service_name: str, trace_id: str = None):
+        self.service_name = service_name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+
+
+def parse_traceparent(value) -> tuple:
+    """Parse a traceparent header into (trace_id, parent_span_id), or (None, None)."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value or not isinstance(value, str):
+        return None, None
+    parts = value.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    trace_id, span_id = parts[1].lower(), parts[2].lower()
+    try:
+        int(trace_id, 16)
+        int(span_id, 16)
+    except ValueError:
+        return None, None
+    if trace_id == '0' * 32 or span_id == '0' * 16:
+        return None, None
+    return trace_id, span_id
+
+
+def continue_from(traceparent) -> bool:
+    """
+    Re-parent the current invocation under an upstream traceparent.
+
+    Used when the trace context is only known after parsing the request
+    (authorizer arguments, PKCE state). Spans already recorded move to the
+    upstream trace and the server span is parented to the upstream span.
+    Returns True if the context was adopted.
+    """
+    active = _current.get()
+    if active is None:
+        return False
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if not trace_id:
+        return False
+    trace = active.trace
+    trace.trace_id = trace_id
+    root = trace.spans[0]
+    root.parent_id = parent_id
+    return True
+
+
+def current_traceparent() -> str:
+    """traceparent for the active span, or empty string when tracing is off."""
+    active = _current.get()
+    return active.traceparent() if active is not None else ''
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the active span. No-op when tracing is disabled."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(parent.trace, name, parent_id=parent.span_id)
+    s.attributes.update(attributes)
+    parent.trace.spans.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = str(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+
+
+def traced(service_name: str):
+    """
+    Decorator for fdk handlers.
+
+    Starts a server span per invocation, continuing any traceparent header
+    on the request, and exports all spans when the handler returns.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(ctx, data=None):
+            headers = {}
+            try:
+                headers = ctx.Headers() or {}
+            except Exception:
+                pass
+            trace_id, parent_id = parse_traceparent(
+                headers.get('traceparent', headers.get('Traceparent')))
+            trace = Trace(service_name, trace_id)
+            root = Span(trace, f"{service_name}.handler", parent_id=parent_id or '', kind=KIND_SERVER)
+            trace.spans.append(root)
+            token = _current.set(root)
+            try:
+                result = fn(ctx, data)
+                status = getattr(result, 'status', None)
+                if callable(status):
+                    try:
+                        root.set('http.status_code', int(status()))
+                    except Exception:
+                        pass
+                return result
+            except Exception as e:
+                root.error = str(e)
+                raise
+            finally:
+                root.end_ns = time.time_ns()
+                _current.reset(token)
+                export(trace)
+
+        return wrapper
+    return decorator
+
+
+def _attr_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """Convert a trace to an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        item = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+            "attributes": [{"key": k, "value": _attr_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            item["parentSpanId"] = s.parent_id
+        spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": trace.service_name}}
+            ]},
+            "scopeSpans": [{"scope": {"name": "apigw-oidc"}, "spans": spans}]
+        }]
+    }
+
+
+def log_exporter(payload: dict):
+    """Write the OTLP/JSON payload as a single log line."""
+    logger.info(f"TRACE {json.dumps(payload, separators=(',', ':'))}")
+
+
+_otlp_queue = queue.Queue(maxsize=256)
+_otlp_thread = None
+
+
+def _otlp_worker():
+    import urllib.request
+    while True:
+        payload = _otlp_queue.get()
+        try:
+            req = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=json.dumps(payload).encode('utf-8'),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            urllib.request.urlopen(req, timeout=TRACE_EXPORT_TIMEOUT).close()
+        except Exception as e:
+            logger.warning(f"Trace export failed: {str(e)}")
+
+
+def otlp_exporter(payload: dict):
+    """Queue the payload for a background OTLP/HTTP POST (never blocks the handler)."""
+    global _otlp_thread
+    if _otlp_thread is None:
+        _otlp_thread = threading.Thread(target=_otlp_worker, name="trace-export", daemon=True)
+        _otlp_thread.start()
+    try:
+        _otlp_queue.put_nowait(payload)
+    except queue.Full:
+        logger.warning("Trace export queue full, dropping trace")
+
+
+EXPORTERS = {
+    'log': log_exporter,
+    'otlp': otlp_exporter,
+}
+
+_exporter = EXPORTERS.get(TRACE_EXPORTER, log_exporter)
+
+
+def set_exporter(exporter):
+    """Install a custom exporter: a callable taking an OTLP/JSON payload dict."""
+    global _exporter
+    _exporter = exporter
+
+
+def export(trace: Trace):
+    try:
+        _exporter(to_otlp(trace))
+    except Exception as e:
+        logger.warning(f"Trace export failed: {str(e)}")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the authorizer's per-request work outside crypto and I/O.
+
+Compares the previous request path (full cookie split into a dict, doubled
+header lookups, eager INFO logging, ISO-8601 expiry parsing, pepper decoded
+per request) with the current one in functions/apigw_authzr/func.py
+(find_cookie, one header lookup, lazy DEBUG logging, integer exp_ts).
+
+Redis, Vault, HKDF and AES-GCM are the same in both paths and are left out,
+so the numbers isolate the part this path controls. Logging goes to
+/dev/null at INFO, as in a deployed function (Fn captures stdout/stderr).
+
+Usage:
+    python scripts/bench_authorizer.py
+    python scripts/bench_authorizer.py --iterations 200000 --cookies 20
+
+Reports CPU time per request (time.process_time) and the peak memory
+traced by tracemalloc while handling one request.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import secrets
+import argparse
+import tracemalloc
+
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fn_local  # noqa: E402
+
+COOKIE_NAME = "session_id"
+logger = logging.getLogger("bench_authorizer")
+
+
+def parse_cookies(cookie_header: str) -> dict:
+    """Previous parser: splits every cookie into a dict."""
+    cookies = {}
+    if cookie_header:
+        for item in cookie_header.split(';'):
+            item = item.strip()
+            if '=' in item:
+                key, value = item.split('=', 1)
+                cookies[key.strip()] = value.strip()
+    return cookies
+
+
+def legacy_path(raw: bytes, plaintext: bytes, pepper_b64: str) -> dict:
+    """The previous handler's steps around lookup and decryption."""
+    logger.info("=== AUTHORIZER INVOKED ===")
+    body = {}
+    logger.info(f"Raw input length: {len(raw) if raw else 0}")
+    if raw:
+        body = json.loads(raw)
+        logger.info(f"Parsed body keys: {list(body.keys())}")
+    auth_data = body.get('data', body)
+    logger.info(f"auth_data keys: {list(auth_data.keys()) if isinstance(auth_data, dict) else 'not a dict'}")
+    cookie_header = auth_data.get('Cookie', auth_data.get('cookie', ''))
+    user_agent = auth_data.get('User-Agent', auth_data.get('userAgent', ''))  # noqa: F841
+    session_id = parse_cookies(cookie_header).get(COOKIE_NAME)
+    logger.info(f"Session FOUND in cache, length: {len(plaintext) + 28} bytes")
+    logger.info(f"Getting pepper, cached: {True}")
+    pepper = base64.b64decode(pepper_b64)
+    logger.info(f"Pepper ready, length: {len(pepper)} bytes")
+    logger.info("Starting session decryption...")
+    logger.info("Key derived successfully")
+    session_data = json.loads(plaintext.decode('utf-8'))
+    logger.info(f"Session decrypted successfully, sub: {session_data.get('sub', 'N/A')}")
+    exp_dt = datetime.fromisoformat(session_data['exp'].replace('Z', '+00:00'))
+    if datetime.now(timezone.utc) > exp_dt:
+        raise AssertionError("expired")
+    logger.info(f"Building success response for user: {session_data.get('sub', 'unknown')}")
+    logger.info(f"Success response principal: {session_data['sub']}")
+    logger.info(f"Success response expiresAt: {session_data['exp']}")
+    response_json = json.dumps({"active": True, "principal": session_data['sub'], "sid": session_id})
+    logger.info(f"Response JSON length: {len(response_json)}")
+    logger.info("=== RETURNING SUCCESS ===")
+    return session_data
+
+
+def current_path(authzr, raw: bytes, plaintext: bytes) -> dict:
+    """The current handler's steps around lookup and decryption."""
+    if len(raw) > authzr.AUTHZ_MAX_BODY_BYTES:
+        raise AssertionError("too large")
+    body = json.loads(raw) if raw else {}
+    auth_data = body.get('data', body)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Authorizer input: %d bytes, keys %s", len(raw), list(auth_data))
+    cookie_header = auth_data.get('Cookie')
+    if cookie_header is None:
+        cookie_header = auth_data.get('cookie') or ''
+    if len(cookie_header) > authzr.AUTHZ_MAX_COOKIE_BYTES:
+        raise AssertionError("too large")
+    session_id = authzr.find_cookie(cookie_header) if cookie_header else None
+    logger.debug("Session found in cache, length: %d bytes", len(plaintext) + 28)
+    session_data = json.loads(plaintext)
+    if time.time() > session_data['exp_ts']:
+        raise AssertionError("expired")
+    logger.debug("Authorized %s until %s", session_data['sub'], session_data['exp'])
+    json.dumps({"active": True, "principal": session_data['sub'], "sid": session_id})
+    return session_data
+
+
+def make_request(cookies: int) -> tuple:
+    """An authorizer input with `cookies` unrelated cookies around the session cookie."""
+    session_id = secrets.token_urlsafe(32)
+    others = [f"_ga_{i}=GA1.1.{secrets.randbelow(10**10)}.{secrets.randbelow(10**10)}" for i in range(cookies)]
+    others.insert(len(others) // 2, f"{COOKIE_NAME}={session_id}")
+    raw = json.dumps({
+        "type": "USER_DEFINED",
+        "data": {
+            "Cookie": "; ".join(others),
+            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)",
+            "traceparent": "",
+        },
+    }).encode("utf-8")
+    exp = datetime.now(timezone.utc) + timedelta(hours=1)
+    plaintext = json.dumps({
+        "sub": "user@example.com",
+        "email": "user@example.com",
+        "name": "Example User",
+        "groups": ["app-users", "app-admins"],
+        "ua_hash": "0123456789abcdef",
+        "exp": exp.isoformat(),
+        "exp_ts": int(exp.timestamp()),
+        "iat": datetime.now(timezone.utc).isoformat(),
+        "epoch": 0,
+        "id_token": "x" * 900,
+    }).encode("utf-8")
+    return raw, plaintext, session_id
+
+
+def cpu_per_call(fn, iterations: int) -> float:
+    """CPU microseconds per call."""
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) * 1e6 / iterations
+
+
+def peak_bytes(fn, samples: int = 200) -> int:
+    """Median tracemalloc peak over `samples` calls."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return peaks[len(peaks) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--cookies", type=int, default=12, help="Unrelated cookies in the Cookie header")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SESSION_COOKIE_NAME", COOKIE_NAME)
+    authzr = fn_local.load_function("apigw_authzr")
+
+    # Same setup as a deployed function: INFO and above written to a stream
+    logging.root.handlers.clear()
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"))
+
+    raw, plaintext, session_id = make_request(args.cookies)
+    pepper_b64 = base64.b64encode(secrets.token_bytes(32)).decode("ascii")
+
+    legacy = legacy_path(raw, plaintext, pepper_b64)
+    current = current_path(authzr, raw, plaintext)
+    assert legacy == current
+    assert authzr.find_cookie(json.loads(raw)["data"]["Cookie"]) == session_id
+
+    runs = {
+        "previous": lambda: legacy_path(raw, plaintext, pepper_b64),
+        "current": lambda: current_path(authzr, raw, plaintext),
+    }
+    print(f"input {len(raw)} bytes, {args.cookies + 1} cookies, {args.iterations} iterations")
+    print(f"{'path':<10} {'cpu us/req':>11} {'peak bytes/req':>15}")
+    for name, fn in runs.items():
+        cpu_per_call(fn, min(args.iterations, 1000))  # warm up
+        print(f"{name:<10} {cpu_per_call(fn, args.iterations):>11.2f} {peak_bytes(fn):>15}")
+
+
+if __name__ == "__main__":
+    main()
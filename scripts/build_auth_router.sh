@@ -0,0 +1,37 @@
+#!/bin/bash
+#
+# Vendor the individual auth functions into functions/auth_router/handlers/
+# so they can be deployed as a single function (see functions/auth_router).
+#
+# Run before building or deploying auth_router:
+#   ./scripts/build_auth_router.sh
+#   cd functions/auth_router && fn -v deploy --app <app-name>
+#
+# The handlers are copied unmodified. Shared modules (tracing.py, session_store.py, audit.py, usage.py,
+# profiling.py, vault_client.py) must match the copies in each function.
+
+set -euo pipefail
+
+REPO_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+FUNCTIONS_DIR="$REPO_DIR/functions"
+ROUTER_DIR="$FUNCTIONS_DIR/auth_router"
+HANDLERS="apigw_authzr oidc_authn oidc_callback oidc_logout oidc_backchannel_logout session_info health"
+
+for module in tracing.py profiling.py vault_client.py session_store.py audit.py usage.py; do
+    for func in $HANDLERS; do
+        if [ -f "$FUNCTIONS_DIR/$func/$module" ] && ! cmp -s "$FUNCTIONS_DIR/$func/$module" "$ROUTER_DIR/$module"; then
+            echo "ERROR: functions/$func/$module differs from functions/auth_router/$module" >&2
+            exit 1
+        fi
+    done
+done
+
+rm -rf "$ROUTER_DIR/handlers"
+mkdir -p "$ROUTER_DIR/handlers"
+touch "$ROUTER_DIR/handlers/__init__.py"
+for func in $HANDLERS; do
+    cp "$FUNCTIONS_DIR/$func/func.py" "$ROUTER_DIR/handlers/$func.py"
+    echo "  handlers/$func.py"
+done
+
+echo "auth_router handlers vendored; deploy from $ROUTER_DIR"
@@ -0,0 +1,107 @@
+"""
+Helpers shared by the OCI Cache admin scripts (revoke_user_sessions.py,
+session_capacity.py, rotate_session_keys.py, usage_stats.py).
+
+Exposes the functions' own session_store (key layout and client), so the
+scripts never re-implement either, plus pepper loading, pacing, and the
+session and shared-claims ciphers. Those must stay in step with
+oidc_callback/apigw_authzr: change them here, not in a script.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import secrets
+
+# Key layout and client shared with the functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "functions", "oidc_logout"))
+import session_store  # noqa: E402,F401
+
+
+def get_redis_client(host: str, port: int, tls: bool):
+    """Client for the cache (cluster-aware when session_store.CLUSTER_MODE is set)."""
+    return session_store.create_client(
+        host=host,
+        port=port,
+        ssl=tls,
+        ssl_cert_reqs="required" if tls else None
+    )
+
+
+def load_pepper(ocid: str, path: str = None):
+    """Pepper bytes from a file holding the Vault secret value, or from Vault via the OCI config file."""
+    if path:
+        with open(path) as f:
+            return base64.b64decode(f.read().strip())
+    if not ocid:
+        return None
+    import oci
+    client = oci.secrets.SecretsClient(oci.config.from_file())
+    content = client.get_secret_bundle(ocid).data.secret_bundle_content.content
+    # Bundle content is base64 of the secret value, which is itself base64 (as in the functions)
+    return base64.b64decode(base64.b64decode(content))
+
+
+class Pacer:
+    """Sleeps so that no more than `rate` keys per second are processed (0 = unlimited)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.start = time.monotonic()
+        self.done = 0
+
+    def wait(self, n: int):
+        self.done += n
+        if self.rate > 0:
+            ahead = self.done / self.rate - (time.monotonic() - self.start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def session_id_from_key(key: str) -> str:
+    """Inverse of session_store.session_key: session:<id> or session:{<id>} -> id."""
+    return key[len("session:"):].strip("{}")
+
+
+def session_cipher_key(session_id: str, pepper: bytes) -> bytes:
+    """AES key of one session (HKDF info "session_encryption", as in oidc_callback)."""
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives import hashes
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=pepper,
+        info=b"session_encryption"
+    ).derive(session_id.encode('utf-8'))
+
+
+def claims_cipher_key(owner: str, pepper: bytes) -> bytes:
+    """AES key of a user's shared claims (HKDF info "user_claims", as in oidc_callback)."""
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives import hashes
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=pepper,
+        info=b"user_claims"
+    ).derive(owner.encode('utf-8'))[:32]
+
+
+def seal(key: bytes, plaintext: bytes, aad=None) -> bytes:
+    """AES-GCM encrypt to nonce || ciphertext."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    nonce = secrets.token_bytes(12)
+    return nonce + AESGCM(key).encrypt(nonce, plaintext, aad)
+
+
+def unseal(key: bytes, blob: bytes, aad=None) -> bytes:
+    """Inverse of seal; raises cryptography's InvalidTag for the wrong key or AAD."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(key).decrypt(blob[:12], blob[12:], aad)
+
+
+def decrypt_session(pepper: bytes, session_id: str, blob: bytes) -> dict:
+    """Session data as stored under session:<id>."""
+    return json.loads(unseal(session_cipher_key(session_id, pepper), blob))
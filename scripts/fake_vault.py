@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OCI Vault secrets endpoint.
+
+Serves GET /20190301/secretbundles/{secretId} like the real service and
+verifies the OCI HTTP signature on every request, so the functions'
+lightweight Vault client (VAULT_CLIENT=lite) can be exercised offline.
+
+Usage:
+    # Generate a throwaway resource principal (key + RPST) and start the server
+    python scripts/fake_vault.py --rp-dir /tmp/fake-rp \\
+        --secret ocid1.vaultsecret.oc1..pepper="$(openssl rand -base64 32)" \\
+        --secret ocid1.vaultsecret.oc1..creds='{"client_id": "x", "client_secret": "y"}'
+
+    # In another shell, point a function at it (the server prints these)
+    export VAULT_CLIENT=lite
+    export VAULT_SECRETS_ENDPOINT=http://127.0.0.1:8200
+    export OCI_RESOURCE_PRINCIPAL_RPST=/tmp/fake-rp/rpst
+    export OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM=/tmp/fake-rp/private.pem
+    export OCI_RESOURCE_PRINCIPAL_REGION=us-chicago-1
+
+    # Self-check: fetch every configured secret through the lite client
+    python scripts/fake_vault.py --rp-dir /tmp/fake-rp --secret a=b --self-check
+
+Secrets can also be loaded from a JSON file mapping OCID -> plaintext value
+(--secrets-file). Values are returned base64-encoded, as Vault does.
+"""
+
+import os
+import sys
+import json
+import base64
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+PREFIX = "/20190301/secretbundles/"
+
+_secrets = {}
+_public_key = None
+_stats = {"requests": 0, "rejected": 0}
+
+
+def write_resource_principal(rp_dir: str):
+    """Create a throwaway RSA key and RPST, returning the public key."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    os.makedirs(rp_dir, exist_ok=True)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(os.path.join(rp_dir, "private.pem"), "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    header = base64.urlsafe_b64encode(b'{"alg":"none"}').rstrip(b"=").decode()
+    claims = base64.urlsafe_b64encode(b'{"sub":"fake-resource-principal"}').rstrip(b"=").decode()
+    with open(os.path.join(rp_dir, "rpst"), "w") as f:
+        f.write(f"{header}.{claims}.")
+    return key.public_key()
+
+
+def verify_signature(method: str, path: str, headers) -> str:
+    """Return an error message, or '' if the request is correctly signed."""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    auth = headers.get("Authorization", "")
+    if not auth.startswith("Signature "):
+        return "missing Signature authorization"
+    params = {}
+    for part in auth[len("Signature "):].split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            params[k.strip()] = v.strip().strip('"')
+    if not params.get("keyId", "").startswith("ST$"):
+        return "keyId is not a resource principal session token"
+    if params.get("algorithm") != "rsa-sha256":
+        return "unsupported algorithm"
+    signed = params.get("headers", "").split()
+    if not {"date", "(request-target)", "host"} <= set(signed):
+        return "date, (request-target) and host must be signed"
+    if _public_key is None:
+        return ""
+    lines = []
+    for h in signed:
+        if h == "(request-target)":
+            lines.append(f"(request-target): {method.lower()} {path}")
+        else:
+            lines.append(f"{h}: {headers.get(h, '')}")
+    try:
+        _public_key.verify(
+            base64.b64decode(params.get("signature", "")),
+            "\n".join(lines).encode("utf-8"),
+            padding.PKCS1v15(),
+            hashes.SHA256()
+        )
+    except (InvalidSignature, ValueError):
+        return "signature verification failed"
+    return ""
+
+
+class VaultHandler(BaseHTTPRequestHandler):
+    def _json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("opc-request-id", "fake-vault")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        _stats["requests"] += 1
+        if not self.path.startswith(PREFIX):
+            return self._json(404, {"code": "NotFound", "message": "Unknown path"})
+        error = verify_signature("GET", self.path, self.headers)
+        if error:
+            _stats["rejected"] += 1
+            return self._json(401, {"code": "NotAuthenticated", "message": error})
+        secret_id = unquote(self.path[len(PREFIX):].split("?")[0])
+        if secret_id not in _secrets:
+            return self._json(404, {"code": "NotAuthorizedOrNotFound", "message": "Secret not found"})
+        return self._json(200, {
+            "secretId": secret_id,
+            "versionNumber": 1,
+            "stages": ["CURRENT", "LATEST"],
+            "secretBundleContent": {
+                "contentType": "BASE64",
+                "content": base64.b64encode(_secrets[secret_id].encode("utf-8")).decode("ascii")
+            }
+        })
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_server(host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), VaultHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def self_check(endpoint: str, rp_dir: str) -> bool:
+    """Fetch every secret through the functions' lite client and compare."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "functions", "apigw_authzr"))
+    os.environ.update(export_lines_env(endpoint, rp_dir))
+    import vault_client
+    vault_client.VAULT_SECRETS_ENDPOINT = endpoint
+    ok = True
+    for ocid, value in _secrets.items():
+        content = vault_client.get_secret_bundle_content(ocid)
+        match = base64.b64decode(content).decode("utf-8") == value
+        ok = ok and match
+        print(f"  {'OK  ' if match else 'FAIL'} {ocid}")
+    try:
+        vault_client.get_secret_bundle_content("ocid1.vaultsecret.oc1..missing")
+        print("  FAIL missing secret did not raise")
+        ok = False
+    except vault_client.VaultClientError as e:
+        print(f"  OK   missing secret raises: {e}")
+    return ok
+
+
+def export_lines_env(endpoint: str, rp_dir: str) -> dict:
+    return {
+        "VAULT_CLIENT": "lite",
+        "VAULT_SECRETS_ENDPOINT": endpoint,
+        "OCI_RESOURCE_PRINCIPAL_VERSION": "2.2",
+        "OCI_RESOURCE_PRINCIPAL_RPST": os.path.join(rp_dir, "rpst"),
+        "OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM": os.path.join(rp_dir, "private.pem"),
+        "OCI_RESOURCE_PRINCIPAL_REGION": "us-chicago-1",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OCI Vault secrets endpoint stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--secret", action="append", default=[], metavar="OCID=VALUE",
+                        help="Secret plaintext value (repeatable)")
+    parser.add_argument("--secrets-file", help="JSON file mapping secret OCID to plaintext value")
+    parser.add_argument("--rp-dir", help="Write a throwaway resource principal here and verify signatures with it")
+    parser.add_argument("--self-check", action="store_true",
+                        help="Fetch all secrets through functions/*/vault_client.py and exit")
+    args = parser.parse_args()
+
+    if args.secrets_file:
+        with open(args.secrets_file) as f:
+            _secrets.update(json.load(f))
+    for item in args.secret:
+        ocid, _, value = item.partition("=")
+        _secrets[ocid] = value
+
+    if args.rp_dir:
+        _public_key = write_resource_principal(args.rp_dir)
+
+    server = start_server(args.host, args.port)
+    endpoint = f"http://{args.host}:{server.server_address[1]}"
+
+    if args.self_check:
+        if not args.rp_dir:
+            parser.error("--self-check requires --rp-dir")
+        passed = self_check(endpoint, args.rp_dir)
+        print(f"{_stats['requests']} requests, {_stats['rejected']} rejected")
+        sys.exit(0 if passed else 1)
+
+    print(f"Fake Vault listening on {endpoint} with {len(_secrets)} secret(s)")
+    if args.rp_dir:
+        for k, v in export_lines_env(endpoint, args.rp_dir).items():
+            print(f"export {k}={v}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end load test for the auth flow.
+
+Runs oidc_authn -> mock IdP authorize -> oidc_callback -> apigw_authzr (many
+times) -> oidc_logout for concurrent simulated users, entirely on this host:
+
+- the functions' handlers run in-process (scripts/fn_local.py)
+- the IdP is scripts/mock_idp.py (signed RS256 ID tokens, PKCE checked)
+- Vault is scripts/fake_vault.py, reached through VAULT_CLIENT=lite with a
+  throwaway resource principal
+- OCI Cache is a local Redis without TLS, e.g.
+      docker run --rm -p 6379:6379 redis:7
+
+Each flow runs as its own phase (all users log in, then all users make
+authorized requests, then all users log out) so that Redis operations can be
+attributed per flow from INFO commandstats.
+
+Usage:
+    python scripts/loadtest.py --users 20 --requests-per-user 50
+    python scripts/loadtest.py --users 50 --idp-latency-ms 80 --json results.json
+
+Latencies are measured around each in-process handler call (and the HTTP
+round trip for the mock IdP). All users share one Python process, so
+absolute numbers include GIL contention; use the results to compare changes,
+not to predict production latency.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import secrets
+import argparse
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fn_local  # noqa: E402
+import mock_idp  # noqa: E402
+import fake_vault  # noqa: E402
+
+GATEWAY_URL = "https://gateway.local"
+CLIENT_ID = "loadtest-client"
+CLIENT_SECRET = secrets.token_urlsafe(24)
+CREDS_OCID = "ocid1.vaultsecret.oc1..loadtestcreds"
+PEPPER_OCID = "ocid1.vaultsecret.oc1..loadtestpepper"
+COOKIE_NAME = "session_id"
+
+
+class Recorder:
+    """Thread-safe latency samples (ms) and error counts per step."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def timed(self, step: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.samples.setdefault(step, []).append(elapsed_ms)
+
+    def error(self, step: str, detail: str):
+        with self.lock:
+            count = self.errors.get(step, 0)
+            self.errors[step] = count + 1
+        if count == 0:
+            print(f"  first {step} error: {detail}", file=sys.stderr)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list) -> dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+def commandstats(r) -> dict:
+    """Redis calls per command since the server started (INFO commandstats)."""
+    stats = r.info("commandstats")
+    return {name[len("cmdstat_"):]: value["calls"] for name, value in stats.items()}
+
+
+def diff_stats(before: dict, after: dict) -> dict:
+    diff = {cmd: after[cmd] - before.get(cmd, 0) for cmd in after}
+    # Exclude the harness's own INFO calls
+    diff.pop("info", None)
+    return {cmd: calls for cmd, calls in sorted(diff.items(), key=lambda kv: -kv[1]) if calls}
+
+
+def setup_environment(args) -> tuple:
+    """Start the mock IdP and fake Vault and configure the functions' environment."""
+    scim_groups = getattr(args, "scim_groups", 0)
+    idp_server = mock_idp.start_server("127.0.0.1", 0, CLIENT_ID, CLIENT_SECRET, args.idp_latency_ms, scim_groups)
+
+    rp_dir = tempfile.mkdtemp(prefix="loadtest-rp-")
+    fake_vault._public_key = fake_vault.write_resource_principal(rp_dir)
+    fake_vault._secrets[CREDS_OCID] = json.dumps({"client_id": CLIENT_ID, "client_secret": CLIENT_SECRET})
+    fake_vault._secrets[PEPPER_OCID] = base64.b64encode(secrets.token_bytes(32)).decode("ascii")
+    vault_server = fake_vault.start_server("127.0.0.1", 0)
+    vault_endpoint = f"http://127.0.0.1:{vault_server.server_address[1]}"
+
+    os.environ.update(fake_vault.export_lines_env(vault_endpoint, rp_dir))
+    os.environ.update({
+        "OCI_IAM_BASE_URL": idp_server.idp.base_url,
+        "OIDC_REDIRECT_URI": f"{GATEWAY_URL}/auth/callback",
+        "POST_LOGOUT_REDIRECT_URI": f"{GATEWAY_URL}/logged-out",
+        "OCI_VAULT_CLIENT_CREDS_OCID": CREDS_OCID,
+        "OCI_VAULT_PEPPER_OCID": PEPPER_OCID,
+        "OCI_CACHE_ENDPOINT": args.redis_host,
+        "OCI_CACHE_PORT": str(args.redis_port),
+        "OCI_CACHE_TLS": "true" if args.redis_tls else "false",
+        "SESSION_COOKIE_NAME": COOKIE_NAME,
+    })
+    if scim_groups:
+        os.environ["GROUPS_SCIM_ENABLED"] = "true"
+    return idp_server, vault_server
+
+
+def login(user: int, functions: dict, rec: Recorder, http) -> str:
+    """Run one login; returns the session cookie value ('' on failure)."""
+    headers = {"X-Forwarded-For": f"10.{user // 65536 % 256}.{user // 256 % 256}.{user % 256}",
+               "User-Agent": "loadtest"}
+    result = rec.timed("login.oidc_authn", fn_local.invoke, functions["oidc_authn"], headers,
+                       request_url=f"{GATEWAY_URL}/auth/login")
+    if result.status != 302:
+        rec.error("login.oidc_authn", f"{result.status} {result.body[:200]}")
+        return ""
+
+    authorize_url = f"{result.headers['Location']}&login_hint=user{user}"
+    idp_resp = rec.timed("login.idp_authorize", http.get, authorize_url, allow_redirects=False, timeout=10)
+    if idp_resp.status_code != 302:
+        rec.error("login.idp_authorize", f"{idp_resp.status_code} {idp_resp.text[:200]}")
+        return ""
+
+    callback_url = idp_resp.headers["Location"]
+    result = rec.timed("login.oidc_callback", fn_local.invoke, functions["oidc_callback"], headers,
+                       request_url=callback_url)
+    session_id = result.cookie(COOKIE_NAME)
+    if result.status != 302 or not session_id:
+        rec.error("login.oidc_callback", f"{result.status} {result.body[:200]}")
+        return ""
+    return session_id
+
+
+def authorize(session_id: str, functions: dict, rec: Recorder, step: str = "authorize.apigw_authzr") -> bool:
+    body = {"type": "USER_DEFINED", "data": {"Cookie": f"{COOKIE_NAME}={session_id}", "User-Agent": "loadtest"}}
+    result = rec.timed(step, fn_local.invoke, functions["apigw_authzr"], body=body)
+    try:
+        return result.status == 200 and result.json().get("active") is True
+    except ValueError:
+        return False
+
+
+def logout(session_id: str, functions: dict, rec: Recorder) -> bool:
+    headers = {"Cookie": f"{COOKIE_NAME}={session_id}"}
+    result = rec.timed("logout.oidc_logout", fn_local.invoke, functions["oidc_logout"], headers,
+                       request_url=f"{GATEWAY_URL}/auth/logout")
+    location = urlsplit(result.headers.get("Location", ""))
+    return result.status == 302 and location.path.endswith("/userlogout")
+
+
+def run_phase(name: str, users: int, task, r) -> dict:
+    """Run task(user) for every user concurrently and measure wall time and Redis ops."""
+    before = commandstats(r)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix=f"user-{name}") as pool:
+        results = list(pool.map(task, range(users)))
+    wall = time.perf_counter() - start
+    return {"results": results, "wall_s": wall, "redis": diff_stats(before, commandstats(r))}
+
+
+def print_report(report: dict):
+    print()
+    print(f"{'step':<28}{'count':>8}{'errors':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}   (ms)")
+    for step, s in report["steps"].items():
+        print(f"{step:<28}{s['count']:>8}{s['errors']:>8}{s['mean_ms']:>9}{s['p50_ms']:>9}"
+              f"{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}")
+    print()
+    for flow, f in report["flows"].items():
+        ops = sum(f["redis_calls"].values())
+        per_op = ops / f["operations"] if f["operations"] else 0
+        calls = ", ".join(f"{cmd}={n}" for cmd, n in f["redis_calls"].items())
+        print(f"{flow:<10} {f['operations']:>7} ops in {f['wall_s']:.2f}s = {f['throughput_per_s']:.1f}/s; "
+              f"Redis {ops} calls ({per_op:.2f}/op): {calls}")
+    print()
+    print("mock IdP requests: " + ", ".join(f"{path}={n}" for path, n in report["idp_requests"].items()))
+    print(f"fake Vault requests: {report['vault_requests']} ({report['vault_rejected']} rejected)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the full OIDC flow")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--requests-per-user", type=int, default=20, help="Authorized requests per user")
+    parser.add_argument("--redis-host", default="127.0.0.1")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-tls", action="store_true", help="Connect to Redis with TLS")
+    parser.add_argument("--idp-latency-ms", type=float, default=0, help="Delay added by the mock IdP")
+    parser.add_argument("--scim-groups", type=int, default=0,
+                        help="Resolve groups through SCIM (GROUPS_SCIM_ENABLED), N extra groups per user")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the functions' INFO logging")
+    args = parser.parse_args()
+
+    idp_server, vault_server = setup_environment(args)
+    functions = {name: fn_local.load_function(name)
+                 for name in ("oidc_authn", "oidc_callback", "apigw_authzr", "oidc_logout")}
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    import redis
+    import requests
+    r = redis.Redis(host=args.redis_host, port=args.redis_port, ssl=args.redis_tls)
+    r.ping()
+
+    rec = Recorder()
+    http = requests.Session()
+    http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.users))
+
+    print(f"{args.users} users, {args.requests_per_user} authorized requests each")
+    sessions = {}
+
+    def login_task(user):
+        session_id = login(user, functions, rec, http)
+        if session_id:
+            sessions[user] = session_id
+        return bool(session_id)
+
+    def authorize_task(user):
+        ok = 0
+        for _ in range(args.requests_per_user if user in sessions else 0):
+            if authorize(sessions[user], functions, rec):
+                ok += 1
+            else:
+                rec.error("authorize.apigw_authzr", "session not active")
+        return ok
+
+    def logout_task(user):
+        if user not in sessions:
+            return False
+        if not logout(sessions[user], functions, rec):
+            rec.error("logout.oidc_logout", "logout did not redirect to the IdP")
+            return False
+        return True
+
+    phases = {
+        "login": run_phase("login", args.users, login_task, r),
+        "authorize": run_phase("authorize", args.users, authorize_task, r),
+        "logout": run_phase("logout", args.users, logout_task, r),
+    }
+
+    # Sessions must be gone after logout (not part of the measured phases)
+    for user, session_id in sessions.items():
+        if authorize(session_id, functions, rec, step="verify.after_logout"):
+            rec.error("verify.after_logout", f"session for user{user} still active after logout")
+    rec.samples.pop("verify.after_logout", None)
+
+    operations = {
+        "login": sum(phases["login"]["results"]),
+        "authorize": sum(phases["authorize"]["results"]),
+        "logout": sum(phases["logout"]["results"]),
+    }
+    report = {
+        "users": args.users,
+        "requests_per_user": args.requests_per_user,
+        "steps": {step: dict(summarize(values), errors=rec.errors.get(step, 0))
+                  for step, values in rec.samples.items()},
+        "flows": {
+            flow: {
+                "operations": operations[flow],
+                "wall_s": round(phase["wall_s"], 3),
+                "throughput_per_s": round(operations[flow] / phase["wall_s"], 1) if phase["wall_s"] else 0.0,
+                "redis_calls": phase["redis"],
+            }
+            for flow, phase in phases.items()
+        },
+        "errors": rec.errors,
+        "idp_requests": dict(idp_server.idp.stats),
+        "vault_requests": fake_vault._stats["requests"],
+        "vault_rejected": fake_vault._stats["rejected"],
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    sys.exit(1 if rec.errors else 0)
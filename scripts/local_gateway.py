@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Local API Gateway emulator driven by the deployment spec.
+
+Loads scripts/api_deployment.template.json (or a generated spec) and serves
+its routes over plain HTTP, so the whole flow can be clicked through,
+profiled or load-tested on one host with the gateway's behavior:
+
+- routes match on path ({param} and {param*} segments) and method
+- ORACLE_FUNCTIONS_BACKEND routes invoke the handler in-process
+  (scripts/fn_local.py) on a worker thread; placeholders such as
+  <oidc-callback-fn-ocid> name the function directory, real OCIDs are
+  mapped with --function OCID=name
+- routes with an authorization policy other than ANONYMOUS call the
+  CUSTOM_AUTHENTICATION function with its "parameters" (USER_DEFINED; an
+  absent header is not passed), optionally caching successes by "cacheKey"
+  until expiresAt (--authorizer-cache-seconds caps it)
+- a denial applies validationFailurePolicy (MODIFY_RESPONSE: status and
+  headers, e.g. the 302 to /auth/login), otherwise 401 with WWW-Authenticate;
+  an authorizer error is a 502
+- headerTransformations.setHeaders resolve ${request.auth[...]},
+  ${request.headers[...]} and ${request.query[...]} with OVERWRITE, APPEND
+  and SKIP
+- HTTP_BACKEND routes are proxied (http and https) with the route's connect
+  and read timeouts; <backend-ip> is replaced with --backend, and without
+  --backend a built-in echo backend returns the request it would have sent
+  as JSON, which shows the X-User-* headers the backend receives
+
+Each response carries a Server-Timing header (authorizer, backend and total
+milliseconds) and each request is logged with the same numbers.
+
+Usage:
+    # Everything local: mock IdP, fake Vault, Redis on 127.0.0.1:6379
+    python scripts/local_gateway.py --offline --port 8000
+    # then open http://localhost:8000/welcome (browsers keep the Secure
+    # session cookie on localhost)
+
+    # Functions configured from the environment, backend on port 8080
+    export OCI_CACHE_ENDPOINT=... OCI_IAM_BASE_URL=... VAULT_CLIENT=lite ...
+    python scripts/local_gateway.py --backend 127.0.0.1:8080
+
+Not emulated: TLS on the listener, request/response policies other than
+the authentication policy and setHeaders (warned about at startup), body
+size limits, the Fn invoke timeout, and rate limiting. Functions run in this
+process and share its GIL, so compare timings between changes rather than
+reading them as production latency.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from http import HTTPStatus
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fn_local  # noqa: E402
+
+logger = logging.getLogger("local_gateway")
+
+DEFAULT_SPEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_deployment.template.json")
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 10 * 1024 * 1024
+# Not forwarded between client, gateway and backend
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "te", "trailer", "upgrade"}
+CONTEXT_VARIABLE = re.compile(r"\$\{request\.(auth|headers|query)\[([^\]]+)\]\}")
+PARAMETER = re.compile(r"^request\.(headers|query)\[([^\]]+)\]$")
+FUNCTION_PLACEHOLDER = re.compile(r"^<([a-z0-9-]+)-fn-ocid>$")
+
+
+class Request:
+    """One client request; headers keep their order and original names."""
+
+    def __init__(self, method: str, target: str, headers: list, body: bytes, client_ip: str):
+        self.method = method
+        self.target = target
+        parts = urlsplit(target)
+        self.path = parts.path or "/"
+        self.query_string = parts.query
+        self.query = parse_qs(parts.query, keep_blank_values=True)
+        self.headers = headers
+        self.body = body
+        self.client_ip = client_ip
+
+    def header(self, name: str):
+        """Header value (repeated headers joined as the gateway does), or None."""
+        values = [v for n, v in self.headers if n.lower() == name.lower()]
+        if not values:
+            return None
+        return "; ".join(values) if name.lower() == "cookie" else ", ".join(values)
+
+    def query_value(self, name: str):
+        values = self.query.get(name)
+        return values[0] if values else None
+
+
+class Route:
+    """One entry of the spec's routes, with its path compiled to a regex."""
+
+    def __init__(self, spec: dict):
+        self.path = spec["path"]
+        self.methods = {m.upper() for m in spec.get("methods", ["ANY"])}
+        self.backend = spec.get("backend", {})
+        policies = spec.get("requestPolicies", {})
+        authorization = policies.get("authorization", {})
+        self.authorization = authorization.get("type", "AUTHENTICATION_ONLY")
+        self.allowed_scope = set(authorization.get("allowedScope", []))
+        transformations = policies.get("headerTransformations", {})
+        self.set_headers = transformations.get("setHeaders", {}).get("items", [])
+        self.unsupported = sorted(set(policies) - {"authorization", "headerTransformations"}) + \
+            sorted(set(transformations) - {"setHeaders"})
+        pattern = ""
+        for segment in re.split(r"(\{[^}]+\})", self.path):
+            if segment.startswith("{") and segment.endswith("*}"):
+                pattern += ".*"
+            elif segment.startswith("{"):
+                pattern += "[^/]+"
+            else:
+                pattern += re.escape(segment)
+        self.pattern = re.compile(f"^{pattern}$")
+
+    def allows(self, method: str) -> bool:
+        return "ANY" in self.methods or method in self.methods
+
+
+def resolve(value: str, request: Request, auth_context: dict) -> str:
+    """Substitute ${request.<table>[<name>]} context variables (unknown ones become '')."""
+    def lookup(match):
+        table, name = match.groups()
+        if table == "auth":
+            result = auth_context.get(name)
+        elif table == "headers":
+            result = request.header(name)
+        else:
+            result = request.query_value(name)
+        return "" if result is None else str(result)
+    return CONTEXT_VARIABLE.sub(lookup, value)
+
+
+def apply_set_headers(headers: dict, items: list, request: Request, auth_context: dict):
+    """Apply setHeaders items to a name -> value dict (case-insensitive names)."""
+    for item in items:
+        values = [v for v in (resolve(raw, request, auth_context) for raw in item.get("values", [])) if v]
+        if not values:
+            continue
+        name = item["name"]
+        existing = next((n for n in headers if n.lower() == name.lower()), None)
+        mode = item.get("ifExists", "OVERWRITE")
+        if existing is not None and mode == "SKIP":
+            continue
+        if existing is not None and mode == "APPEND":
+            headers[existing] = ", ".join([headers[existing]] + values)
+            continue
+        if existing is not None:
+            del headers[existing]
+        headers[name] = ", ".join(values)
+
+
+def parse_expires_at(value) -> float:
+    """expiresAt as epoch seconds (0 when missing or unparseable)."""
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class Gateway:
+    """Routes requests from the spec to in-process functions and HTTP backends."""
+
+    def __init__(self, spec: dict, function_map: dict, backend: str, cache_seconds: float, workers: int):
+        self.routes = [Route(r) for r in spec.get("routes", [])]
+        self.authentication = spec.get("requestPolicies", {}).get("authentication")
+        self.function_map = function_map
+        self.backend = backend
+        self.cache_seconds = cache_seconds
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fn")
+        # cacheKey values -> (valid until, authorizer response)
+        self.authorizer_cache = {}
+        self.functions = {}
+        for function_id in self.function_ids():
+            name = self.function_name(function_id)
+            self.functions[name] = fn_local.load_function(name)
+        for route in self.routes:
+            if route.unsupported:
+                logger.warning("%s: ignoring unsupported policies %s", route.path, ", ".join(route.unsupported))
+
+    def function_ids(self) -> set:
+        ids = {r.backend["functionId"] for r in self.routes if r.backend.get("type") == "ORACLE_FUNCTIONS_BACKEND"}
+        if self.authentication:
+            ids.add(self.authentication["functionId"])
+        return ids
+
+    def function_name(self, function_id: str) -> str:
+        if function_id in self.function_map:
+            return self.function_map[function_id]
+        match = FUNCTION_PLACEHOLDER.match(function_id)
+        if not match:
+            raise ValueError(f"No function for {function_id} (use --function {function_id}=<name>)")
+        return match.group(1).replace("-", "_")
+
+    async def call_function(self, function_id: str, headers: dict, body: bytes, request_url: str, method: str):
+        module = self.functions[self.function_name(function_id)]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, fn_local.invoke, module, headers, body, request_url, method)
+
+    async def authenticate(self, request: Request):
+        """Run the authorizer; returns its response (dict) or raises on authorizer errors."""
+        policy = self.authentication
+        arguments = {}
+        for argument, expression in policy.get("parameters", {}).items():
+            match = PARAMETER.match(expression)
+            if not match:
+                continue
+            table, name = match.groups()
+            value = request.header(name) if table == "headers" else request.query_value(name)
+            if value is not None:
+                arguments[argument] = value
+
+        cache_key = None
+        if self.cache_seconds > 0:
+            cache_key = tuple(arguments.get(k) for k in policy.get("cacheKey", sorted(arguments)))
+            cached = self.authorizer_cache.get(cache_key)
+            if cached and cached[0] > time.time():
+                return cached[1]
+
+        result = await self.call_function(policy["functionId"], {}, json.dumps({"type": "USER_DEFINED", "data": arguments}),
+                                          "", "POST")
+        if result.status >= 300:
+            raise RuntimeError(f"authorizer returned HTTP {result.status}")
+        decision = result.json()
+        if cache_key is not None and decision.get("active") is True:
+            valid_until = min(time.time() + self.cache_seconds, parse_expires_at(decision.get("expiresAt")))
+            self.authorizer_cache[cache_key] = (valid_until, decision)
+        return decision
+
+    def denied(self, decision: dict):
+        """The response for a failed authentication (validationFailurePolicy, else 401)."""
+        policy = self.authentication.get("validationFailurePolicy") or {}
+        if policy.get("type") == "MODIFY_RESPONSE":
+            headers = {}
+            items = policy.get("responseHeaderTransformations", {}).get("setHeaders", {}).get("items", [])
+            apply_set_headers(headers, items, Request("GET", "/", [], b"", ""), {})
+            return int(policy.get("responseCode", 401)), list(headers.items()), b""
+        headers = [("WWW-Authenticate", decision.get("wwwAuthenticate") or "Bearer")]
+        return 401, headers, b""
+
+    def backend_headers(self, request: Request, route: Route, auth_context: dict) -> dict:
+        headers = {}
+        for name, value in request.headers:
+            if name.lower() in HOP_BY_HOP or name.lower() == "content-length":
+                continue
+            existing = next((n for n in headers if n.lower() == name.lower()), None)
+            if existing is None:
+                headers[name] = value
+            else:
+                headers[existing] += ("; " if name.lower() == "cookie" else ", ") + value
+        forwarded = request.header("X-Forwarded-For")
+        headers["X-Forwarded-For"] = f"{forwarded}, {request.client_ip}" if forwarded else request.client_ip
+        apply_set_headers(headers, route.set_headers, request, auth_context)
+        return headers
+
+    async def dispatch(self, request: Request) -> tuple:
+        """Return (status, [(name, value)], body, {timing name: ms})."""
+        timings = {}
+        matching = [route for route in self.routes if route.pattern.match(request.path)]
+        if not matching:
+            return 404, [("Content-Type", "application/json")], b'{"message": "Not Found"}', timings
+        route = next((r for r in matching if r.allows(request.method)), None)
+        if route is None:
+            return 405, [("Content-Type", "application/json")], b'{"message": "Method Not Allowed"}', timings
+
+        auth_context = {}
+        if route.authorization != "ANONYMOUS" and self.authentication:
+            start = time.perf_counter()
+            try:
+                decision = await self.authenticate(request)
+            except Exception as e:
+                logger.error("Authorizer failed: %s", e)
+                return 502, [("Content-Type", "application/json")], b'{"message": "Bad Gateway"}', timings
+            finally:
+                timings["authz"] = (time.perf_counter() - start) * 1000
+            scopes = set(decision.get("scope") or [])
+            if decision.get("active") is not True or \
+                    (route.authorization == "ANY_OF" and not scopes & route.allowed_scope):
+                logger.info("Authorizer denied %s (%s)", request.path, decision.get("wwwAuthenticate", ""))
+                status, headers, body = self.denied(decision)
+                return status, headers, body, timings
+            auth_context = decision.get("context") or {}
+
+        headers = self.backend_headers(request, route, auth_context)
+        start = time.perf_counter()
+        try:
+            if route.backend.get("type") == "ORACLE_FUNCTIONS_BACKEND":
+                result = await self.call_function(route.backend["functionId"], headers, request.body,
+                                                  request.target, request.method)
+                response_headers = []
+                for name, value in result.headers.items():
+                    for item in value if isinstance(value, list) else [value]:
+                        response_headers.append((name, str(item)))
+                return result.status, response_headers, result.body.encode("utf-8"), timings
+            if route.backend.get("type") == "HTTP_BACKEND":
+                return (*await self.proxy(route, request, headers), timings)
+            if route.backend.get("type") == "STOCK_RESPONSE_BACKEND":
+                backend = route.backend
+                stock_headers = [(h["name"], h["value"]) for h in backend.get("headers", [])]
+                return int(backend.get("status", 200)), stock_headers, backend.get("body", "").encode("utf-8"), timings
+            return 500, [], b"", timings
+        except asyncio.TimeoutError:
+            logger.error("Backend timed out for %s", request.path)
+            return 504, [("Content-Type", "application/json")], b'{"message": "Gateway Timeout"}', timings
+        except Exception as e:
+            logger.error("Backend failed for %s: %s", request.path, e)
+            return 502, [("Content-Type", "application/json")], b'{"message": "Bad Gateway"}', timings
+        finally:
+            timings["backend"] = (time.perf_counter() - start) * 1000
+
+    async def proxy(self, route: Route, request: Request, headers: dict) -> tuple:
+        """Forward to an HTTP backend (or echo the request when no --backend is set)."""
+        url = route.backend["url"]
+        if "<backend-ip>" in url:
+            if not self.backend:
+                echo = {"method": request.method, "url": url, "query": request.query_string, "headers": headers}
+                return 200, [("Content-Type", "application/json")], json.dumps(echo, indent=2).encode("utf-8")
+            url = url.replace("<backend-ip>", self.backend)
+        parts = urlsplit(url)
+        tls = parts.scheme == "https"
+        port = parts.port or (443 if tls else 80)
+        target = (parts.path or "/") + (f"?{request.query_string}" if request.query_string else "")
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port, ssl=tls or None),
+            route.backend.get("connectTimeoutInSeconds", 60)
+        )
+        try:
+            headers = {n: v for n, v in headers.items() if n.lower() != "host"}
+            lines = [f"{request.method} {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+            lines += [f"{n}: {v}" for n, v in headers.items()]
+            if request.body or request.method in ("POST", "PUT", "PATCH"):
+                lines.append(f"Content-Length: {len(request.body)}")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + request.body)
+            await writer.drain()
+            raw = await asyncio.wait_for(reader.read(-1), route.backend.get("readTimeoutInSeconds", 60))
+        finally:
+            writer.close()
+
+        head, _, body = raw.partition(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split()[1])
+        response_headers = []
+        chunked = False
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            if name.lower() == "transfer-encoding" and "chunked" in value.lower():
+                chunked = True
+            if name.lower() not in HOP_BY_HOP and name.lower() != "content-length":
+                response_headers.append((name, value.strip()))
+        return status, response_headers, decode_chunked(body) if chunked else body
+
+
+def decode_chunked(data: bytes) -> bytes:
+    body = b""
+    while data:
+        size_line, _, data = data.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            break
+        body += data[:size]
+        data = data[size + 2:]
+    return body
+
+
+async def read_request(reader: asyncio.StreamReader, client_ip: str):
+    """Read one HTTP/1.1 request; None at end of connection."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = []
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    length = int(next((v for n, v in headers if n.lower() == "content-length"), "0") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target, headers, body, client_ip)
+
+
+async def handle_connection(gateway: Gateway, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    client_ip = (writer.get_extra_info("peername") or ("",))[0]
+    try:
+        while True:
+            try:
+                request = await read_request(reader, client_ip)
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                logger.warning("Bad request from %s: %s", client_ip, e)
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                break
+            if request is None:
+                break
+            start = time.perf_counter()
+            status, headers, body, timings = await gateway.dispatch(request)
+            timings["total"] = (time.perf_counter() - start) * 1000
+            keep_alive = (request.header("Connection") or "").lower() != "close"
+
+            lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+            lines += [f"{n}: {v}" for n, v in headers]
+            lines.append("Server-Timing: " + ", ".join(f"{k};dur={v:.1f}" for k, v in timings.items()))
+            lines.append(f"Content-Length: {len(body)}")
+            lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            logger.info("%s %s -> %d (%s)", request.method, request.path, status,
+                        ", ".join(f"{k} {v:.1f} ms" for k, v in timings.items()))
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(gateway: Gateway, host: str, port: int):
+    server = await asyncio.start_server(lambda r, w: handle_connection(gateway, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES)
+    print(f"Local gateway listening on http://{host}:{server.sockets[0].getsockname()[1]}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local API Gateway emulator")
+    parser.add_argument("--spec", default=DEFAULT_SPEC, help="Deployment spec (default: the template)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backend", help="host[:port] that replaces <backend-ip> (default: built-in echo)")
+    parser.add_argument("--function", action="append", default=[], metavar="OCID=NAME",
+                        help="Function directory for a functionId that is not a placeholder")
+    parser.add_argument("--authorizer-cache-seconds", type=float, default=0,
+                        help="Cache successful authorizations by cacheKey (0 = call the authorizer every time)")
+    parser.add_argument("--workers", type=int, default=16, help="Threads running function handlers")
+    parser.add_argument("--offline", action="store_true",
+                        help="Start the mock IdP and fake Vault and configure the functions for them")
+    parser.add_argument("--redis-host", default="127.0.0.1", help="With --offline")
+    parser.add_argument("--redis-port", type=int, default=6379, help="With --offline")
+    parser.add_argument("--redis-tls", action="store_true", help="With --offline")
+    parser.add_argument("--idp-latency-ms", type=float, default=0, help="With --offline")
+    parser.add_argument("--verbose", action="store_true", help="Keep the functions' INFO logging")
+    args = parser.parse_args()
+
+    if args.offline:
+        import loadtest
+        loadtest.setup_environment(args)
+        base_url = f"http://{args.host}:{args.port}"
+        os.environ.update({
+            "OIDC_REDIRECT_URI": f"{base_url}/auth/callback",
+            "POST_LOGOUT_REDIRECT_URI": f"{base_url}/logged-out",
+        })
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    gateway = Gateway(spec, dict(m.split("=", 1) for m in args.function), args.backend,
+                      args.authorizer_cache_seconds, args.workers)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+    try:
+        asyncio.run(serve(gateway, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OCI Identity Domain (OIDC provider).
+
+Serves just enough of the Identity Domain for the functions to complete the
+full login flow offline:
+
+    GET  /.well-known/openid-configuration
+    GET  /oauth2/v1/authorize       redirects straight back with a code (no login page)
+    POST /oauth2/v1/token           authorization_code (PKCE checked), refresh_token
+                                    (rotated on use) and client_credentials
+    GET  /admin/v1/SigningCert/jwk  JWKS for the RS256 signing key
+    GET  /oauth2/v1/userlogout      redirects to post_logout_redirect_uri
+    GET  /admin/v1/Users            SCIM: filter=userName eq "<sub>" (app token)
+    GET  /admin/v1/Groups           SCIM: filter=members.value eq "<id>", paged
+
+The authenticated user is taken from the login_hint parameter of the
+authorize request (default "user"), so a load test can simulate many users.
+ID tokens carry sub, sid, nonce and the custom user_* claims the callback
+reads. A refresh token is issued when the scope includes offline_access.
+With --groups-per-user N, SCIM lists N more groups per user than the ID
+token's user_groups claim (["users"]), like a directory whose claim is
+truncated.
+
+Usage:
+    python scripts/mock_idp.py --port 8300 --client-id test-client --client-secret test-secret
+
+    # In another shell, point the functions at it
+    export OCI_IAM_BASE_URL=http://127.0.0.1:8300
+
+Use --latency-ms to add a fixed delay to every response (simulating a remote IdP).
+"""
+
+import re
+import sys
+import json
+import time
+import base64
+import hashlib
+import secrets
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+KEY_ID = "mock-idp-key"
+CODE_TTL_SECONDS = 120
+TOKEN_TTL_SECONDS = 3600
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class MockIdP:
+    """Signing key, registered client and issued codes for one mock IdP."""
+
+    def __init__(self, client_id: str, client_secret: str, latency_ms: float = 0, groups_per_user: int = 0):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.latency_ms = latency_ms
+        self.groups_per_user = groups_per_user
+        self.base_url = ""
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.codes = {}
+        self.refresh_tokens = {}
+        self.app_tokens = set()
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.stats[endpoint] = self.stats.get(endpoint, 0) + 1
+
+    def jwks(self) -> dict:
+        numbers = self.key.public_key().public_numbers()
+        return {"keys": [{
+            "kty": "RSA",
+            "kid": KEY_ID,
+            "use": "sig",
+            "alg": "RS256",
+            "n": b64url(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, "big")),
+            "e": b64url(numbers.e.to_bytes((numbers.e.bit_length() + 7) // 8, "big")),
+        }]}
+
+    def openid_configuration(self) -> dict:
+        return {
+            "issuer": self.base_url,
+            "authorization_endpoint": f"{self.base_url}/oauth2/v1/authorize",
+            "token_endpoint": f"{self.base_url}/oauth2/v1/token",
+            "jwks_uri": f"{self.base_url}/admin/v1/SigningCert/jwk",
+            "end_session_endpoint": f"{self.base_url}/oauth2/v1/userlogout",
+            "response_types_supported": ["code"],
+            "id_token_signing_alg_values_supported": ["RS256"],
+            "code_challenge_methods_supported": ["S256"],
+        }
+
+    def sign(self, claims: dict) -> str:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        header = {"alg": "RS256", "typ": "JWT", "kid": KEY_ID}
+        signing_input = f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}"
+        signature = self.key.sign(signing_input.encode("ascii"), padding.PKCS1v15(), hashes.SHA256())
+        return f"{signing_input}.{b64url(signature)}"
+
+    def issue_code(self, params: dict) -> str:
+        code = secrets.token_urlsafe(24)
+        user = params.get("login_hint") or "user"
+        with self.lock:
+            self.codes[code] = {
+                "user": user,
+                "redirect_uri": params.get("redirect_uri"),
+                "nonce": params.get("nonce"),
+                "code_challenge": params.get("code_challenge"),
+                "offline": "offline_access" in (params.get("scope") or "").split(),
+                "expires": time.time() + CODE_TTL_SECONDS,
+            }
+        return code
+
+    def redeem_code(self, form: dict) -> tuple:
+        """Return (token response, error) for an authorization_code grant."""
+        with self.lock:
+            grant = self.codes.pop(form.get("code", ""), None)
+        if grant is None or grant["expires"] < time.time():
+            return None, "invalid_grant"
+        if form.get("redirect_uri") != grant["redirect_uri"]:
+            return None, "invalid_grant"
+        verifier = form.get("code_verifier", "")
+        if grant["code_challenge"] and b64url(hashlib.sha256(verifier.encode("ascii")).digest()) != grant["code_challenge"]:
+            return None, "invalid_grant"
+
+        sid = secrets.token_hex(16)
+        tokens = self.tokens(grant["user"], sid, grant["nonce"])
+        if grant["offline"]:
+            tokens["refresh_token"] = self.issue_refresh_token(grant["user"], sid)
+        return tokens, None
+
+    def issue_refresh_token(self, user: str, sid: str) -> str:
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.refresh_tokens[token] = (user, sid)
+        return token
+
+    def redeem_refresh_token(self, form: dict) -> tuple:
+        """Return (token response, error) for a refresh_token grant (rotates the token)."""
+        with self.lock:
+            grant = self.refresh_tokens.pop(form.get("refresh_token", ""), None)
+        if grant is None:
+            return None, "invalid_grant"
+        user, sid = grant
+        tokens = self.tokens(user, sid)
+        tokens["refresh_token"] = self.issue_refresh_token(user, sid)
+        return tokens, None
+
+    def issue_app_token(self) -> str:
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.app_tokens.add(token)
+        return token
+
+    def groups(self, user: str) -> list:
+        return ["users"] + [f"{user}-group-{i:04d}" for i in range(self.groups_per_user)]
+
+    def scim(self, resource: str, params: dict) -> tuple:
+        """Return (status, body) for a SCIM Users or Groups search."""
+        query = params.get("filter", "")
+        if resource == "Users":
+            match = re.fullmatch(r'userName eq "ocid1\.user\.oc1\.\.(.+)"', query)
+            resources = [{"id": f"scim-{match.group(1)}"}] if match else []
+        else:
+            match = re.fullmatch(r'members\.value eq "scim-(.+)"', query)
+            if not match:
+                return 400, {"detail": "unsupported filter"}
+            resources = [{"displayName": name} for name in self.groups(match.group(1))]
+        total = len(resources)
+        start = max(int(params.get("startIndex", 1)), 1)
+        count = int(params.get("count", 50))
+        page = resources[start - 1:start - 1 + count]
+        return 200, {"schemas": ["urn:ietf:params:scim:api:messages:2.0:ListResponse"],
+                     "totalResults": total, "startIndex": start, "itemsPerPage": len(page), "Resources": page}
+
+    def tokens(self, user: str, sid: str, nonce: str = None) -> dict:
+        now = int(time.time())
+        claims = {
+            "iss": self.base_url,
+            "aud": [self.client_id],
+            "sub": f"ocid1.user.oc1..{user}",
+            "sid": sid,
+            "iat": now,
+            "exp": now + TOKEN_TTL_SECONDS,
+            "user_email": f"{user}@example.com",
+            "user_displayname": user.title(),
+            "user_given_name": user.title(),
+            "user_family_name": "Test",
+            "user_groups": ["users"],
+        }
+        if nonce:
+            claims["nonce"] = nonce
+        return {
+            "access_token": secrets.token_urlsafe(32),
+            "token_type": "Bearer",
+            "expires_in": TOKEN_TTL_SECONDS,
+            "id_token": self.sign(claims),
+        }
+
+
+class IdPHandler(BaseHTTPRequestHandler):
+    idp = None
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None):
+        if self.idp.latency_ms:
+            time.sleep(self.idp.latency_ms / 1000)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, body: dict):
+        self._send(status, json.dumps(body).encode(), {"Content-Type": "application/json", "Cache-Control": "no-store"})
+
+    def do_GET(self):
+        parsed = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        self.idp.count(parsed.path)
+
+        if parsed.path == "/.well-known/openid-configuration":
+            return self._json(200, self.idp.openid_configuration())
+        if parsed.path == "/admin/v1/SigningCert/jwk":
+            return self._json(200, self.idp.jwks())
+        if parsed.path == "/oauth2/v1/authorize":
+            if params.get("client_id") != self.idp.client_id or params.get("response_type") != "code":
+                return self._json(400, {"error": "invalid_request"})
+            if params.get("code_challenge_method", "S256") != "S256":
+                return self._json(400, {"error": "invalid_request", "error_description": "S256 required"})
+            query = urlencode({"code": self.idp.issue_code(params), "state": params.get("state", "")})
+            return self._send(302, headers={"Location": f"{params.get('redirect_uri')}?{query}"})
+        if parsed.path == "/oauth2/v1/userlogout":
+            target = params.get("post_logout_redirect_uri")
+            if target:
+                return self._send(302, headers={"Location": target})
+            return self._send(200, b"Signed out", {"Content-Type": "text/plain"})
+        if parsed.path in ("/admin/v1/Users", "/admin/v1/Groups"):
+            auth = self.headers.get("Authorization", "")
+            if not auth.startswith("Bearer ") or auth[7:] not in self.idp.app_tokens:
+                return self._json(401, {"detail": "invalid token"})
+            return self._json(*self.idp.scim(parsed.path.rsplit("/", 1)[1], params))
+        return self._json(404, {"error": "not_found"})
+
+    def do_POST(self):
+        parsed = urlsplit(self.path)
+        self.idp.count(parsed.path)
+        if parsed.path != "/oauth2/v1/token":
+            return self._json(404, {"error": "not_found"})
+
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        client_id, client_secret = form.get("client_id"), form.get("client_secret")
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Basic "):
+            client_id, _, client_secret = base64.b64decode(auth[6:]).decode("utf-8").partition(":")
+        if client_id != self.idp.client_id or client_secret != self.idp.client_secret:
+            return self._json(401, {"error": "invalid_client"})
+
+        grant_type = form.get("grant_type")
+        if grant_type == "client_credentials":
+            return self._json(200, {
+                "access_token": self.idp.issue_app_token(),
+                "token_type": "Bearer",
+                "expires_in": TOKEN_TTL_SECONDS,
+            })
+        if grant_type in ("authorization_code", "refresh_token"):
+            if grant_type == "authorization_code":
+                tokens, error = self.idp.redeem_code(form)
+            else:
+                tokens, error = self.idp.redeem_refresh_token(form)
+            if error:
+                return self._json(400, {"error": error})
+            return self._json(200, tokens)
+        return self._json(400, {"error": "unsupported_grant_type"})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_server(host: str, port: int, client_id: str, client_secret: str, latency_ms: float = 0,
+                 groups_per_user: int = 0) -> ThreadingHTTPServer:
+    """Start a mock IdP in a background thread; its MockIdP is server.idp."""
+    idp = MockIdP(client_id, client_secret, latency_ms, groups_per_user)
+    handler = type("BoundIdPHandler", (IdPHandler,), {"idp": idp})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    idp.base_url = f"http://{host}:{server.server_address[1]}"
+    server.idp = idp
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OIDC provider stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--client-id", default="test-client")
+    parser.add_argument("--client-secret", default="test-secret")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every response")
+    parser.add_argument("--groups-per-user", type=int, default=0, help="Extra groups listed by SCIM per user")
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, args.client_id, args.client_secret, args.latency_ms,
+                          args.groups_per_user)
+    print(f"Mock IdP listening on {server.idp.base_url} (client_id={args.client_id})")
+    print(f"export OCI_IAM_BASE_URL={server.idp.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(json.dumps(server.idp.stats, indent=2), file=sys.stderr)
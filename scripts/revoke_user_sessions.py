@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Revoke all sessions for one or many users.
+
+Uses the per-user session index maintained by oidc_callback
+(user_sessions:<user_ref>) so revocation costs O(sessions for those users)
+instead of a SCAN over the whole keyspace. Each user's revocation epoch is
+also bumped, which makes the authorizer reject any of their sessions that
+predate the index. Work is done in pipelined batches.
+
+Must run from a host that can reach OCI Cache (e.g. the backend VM in the
+private subnet).
+
+Usage:
+    export OCI_CACHE_ENDPOINT="xxx.redis.us-chicago-1.oci.oraclecloud.com"
+
+    # One or more users by sub
+    python scripts/revoke_user_sessions.py --sub ocid1.user.oc1..aaa --sub ocid1.user.oc1..bbb
+
+    # Many users, one sub per line
+    python scripts/revoke_user_sessions.py --subs-file compromised.txt --batch-size 200
+
+    # Show what would be revoked without changing anything
+    python scripts/revoke_user_sessions.py --subs-file compromised.txt --dry-run
+
+    # Sharded cache (OCI_CACHE_CLUSTER_MODE=true on the functions)
+    python scripts/revoke_user_sessions.py --sub ocid1.user.oc1..aaa --cluster
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+
+# Key layout and client shared with the other admin scripts
+from cache_admin import session_store, get_redis_client
+
+
+def user_ref(sub: str) -> str:
+    """Per-user key component, identical to oidc_callback.user_ref."""
+    return hashlib.sha256(sub.encode('utf-8')).hexdigest()[:32]
+
+
+def count_sessions(r, owners: list, batch_size: int) -> int:
+    total = 0
+    for i in range(0, len(owners), batch_size):
+        pipe = r.pipeline(transaction=False)
+        for owner in owners[i:i + batch_size]:
+            pipe.zcard(session_store.user_sessions_key(owner))
+        total += sum(pipe.execute())
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revoke all sessions for the given users")
+    parser.add_argument("--sub", action="append", default=[], help="User sub claim (repeatable)")
+    parser.add_argument("--subs-file", help="File with one sub per line")
+    parser.add_argument("--endpoint", default=os.environ.get("OCI_CACHE_ENDPOINT"),
+                        help="OCI Cache endpoint (or set OCI_CACHE_ENDPOINT)")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--no-tls", action="store_true", help="Disable TLS (local Redis only)")
+    parser.add_argument("--cluster", action="store_true",
+                        default=os.environ.get("OCI_CACHE_CLUSTER_MODE", "false").lower() == "true",
+                        help="Cache runs in cluster mode (or set OCI_CACHE_CLUSTER_MODE=true)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Only count sessions")
+    args = parser.parse_args()
+
+    subs = list(args.sub)
+    if args.subs_file:
+        with open(args.subs_file) as f:
+            subs.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not subs:
+        parser.error("no users given (use --sub or --subs-file)")
+    if not args.endpoint:
+        parser.error("OCI Cache endpoint not set (use --endpoint or OCI_CACHE_ENDPOINT)")
+
+    owners = sorted({user_ref(sub) for sub in subs})
+    session_store.CLUSTER_MODE = args.cluster
+    r = get_redis_client(args.endpoint, args.port, not args.no_tls)
+
+    if args.dry_run:
+        print(f"{len(owners)} user(s), {count_sessions(r, owners, args.batch_size)} indexed session(s) would be revoked")
+        sys.exit(0)
+
+    start = time.monotonic()
+    revoked = session_store.revoke_user_sessions(
+        r, owners, args.batch_size,
+        progress=lambda n, users, sessions: print(f"  batch {n}: {users} user(s), {sessions} session(s)"))
+    print(f"Revoked {revoked} session(s) for {len(owners)} user(s) in {time.monotonic() - start:.2f}s")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Re-encrypt live sessions after a pepper rotation or a session format change,
+so neither has to sign every user out.
+
+Walks session:* (and the shared claims, user_claims:*) with SCAN. Each batch
+is fetched with one pipelined GET, decrypted with the new pepper or else the
+previous one, upgraded to the current session format (upgrade_session) and
+re-encrypted with the new pepper in a process pool. It is then written back
+with a pipelined compare-and-set that keeps the key's remaining TTL: a
+session that was renewed, revoked or logged out in the meantime is left
+alone.
+
+Rotation procedure:
+    1. Create the new pepper secret in Vault.
+    2. Set OCI_VAULT_PEPPER_OCID to the new secret and
+       OCI_VAULT_PEPPER_PREVIOUS_OCID to the old one on apigw_authzr,
+       oidc_callback, oidc_logout (and auth_router). New sessions use the
+       new pepper; old ones keep working.
+    3. Run this script until it reports no remaining old-pepper keys.
+    4. Remove OCI_VAULT_PEPPER_PREVIOUS_OCID and retire the old secret.
+       With SESSION_MODE=stateless, sessions live in sealed cookies in the
+       browser, which this script cannot re-encrypt: wait
+       SESSION_TTL_SECONDS after step 2, until every cookie sealed with the
+       old pepper has expired, or those users are signed out.
+
+Progress is checkpointed (SCAN cursors and counters) after every batch, so an
+interrupted run resumes where it stopped. Re-processing a key is harmless:
+keys already under the new pepper and format are skipped.
+
+Must run from a host that can reach OCI Cache (e.g. the backend VM in the
+private subnet). Peppers come from Vault through ~/.oci/config, or from
+files holding the secret value (base64).
+
+Usage:
+    export OCI_CACHE_ENDPOINT="xxx.redis.us-chicago-1.oci.oraclecloud.com"
+
+    # Pepper rotation
+    python scripts/rotate_session_keys.py --old-pepper-ocid ocid1.vaultsecret.oc1..old \\
+        --new-pepper-ocid ocid1.vaultsecret.oc1..new
+
+    # Format upgrade only (same pepper), count first
+    python scripts/rotate_session_keys.py --new-pepper-ocid ocid1.vaultsecret.oc1..cur --dry-run
+
+    # Tuning: 8 crypto workers, at most 2000 keys/s, custom checkpoint
+    python scripts/rotate_session_keys.py --old-pepper-file old.b64 --new-pepper-file new.b64 \\
+        --workers 8 --max-keys-per-sec 2000 --checkpoint /var/tmp/rotation.json
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Key layout, client, peppers and ciphers shared with the other admin scripts
+from cache_admin import (Pacer, session_store, get_redis_client, load_pepper, session_id_from_key,
+                         session_cipher_key, claims_cipher_key, seal, unseal)
+
+SESSIONS = "session:*"
+CLAIMS = "user_claims:*"
+
+# Replace the value only if it is still the one that was read; keep the TTL
+COMPARE_AND_SET_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'KEEPTTL')
+    return 1
+end
+return 0
+"""
+
+STATUSES = ("current", "migrated", "upgraded", "undecryptable", "conflict", "vanished")
+
+# Set in each worker process by _init_worker
+_new_pepper = None
+_old_pepper = None
+
+
+def upgrade_session(session_data: dict) -> bool:
+    """Bring session data written by older releases to the current format; True if changed."""
+    changed = False
+    if 'exp_ts' not in session_data and session_data.get('exp'):
+        # Integer expiry read by the authorizer (ISO exp kept for older readers)
+        session_data['exp_ts'] = int(datetime.fromisoformat(session_data['exp'].replace('Z', '+00:00')).timestamp())
+        changed = True
+    return changed
+
+
+def _init_worker(new_pepper: bytes, old_pepper: bytes):
+    global _new_pepper, _old_pepper
+    _new_pepper = new_pepper
+    _old_pepper = old_pepper
+
+
+def reencrypt_sessions(items: list) -> list:
+    """[(session_id, blob)] -> [(status, new blob or None)] (runs in a worker process)."""
+    from cryptography.exceptions import InvalidTag
+    results = []
+    for session_id, blob in items:
+        status = "current"
+        try:
+            session_data = json.loads(unseal(session_cipher_key(session_id, _new_pepper), blob, None))
+        except InvalidTag:
+            if _old_pepper is None:
+                results.append(("undecryptable", None))
+                continue
+            try:
+                session_data = json.loads(unseal(session_cipher_key(session_id, _old_pepper), blob, None))
+                status = "migrated"
+            except InvalidTag:
+                results.append(("undecryptable", None))
+                continue
+        if upgrade_session(session_data) and status == "current":
+            status = "upgraded"
+        if status == "current":
+            results.append((status, None))
+        else:
+            plaintext = json.dumps(session_data).encode('utf-8')
+            results.append((status, seal(session_cipher_key(session_id, _new_pepper), plaintext, None)))
+    return results
+
+
+def reencrypt_claims(items: list) -> list:
+    """[((owner, version), blob)] -> [(status, new blob or None)] (runs in a worker process)."""
+    from cryptography.exceptions import InvalidTag
+    results = []
+    for (owner, version), blob in items:
+        aad = version.encode('utf-8')
+        try:
+            unseal(claims_cipher_key(owner, _new_pepper), blob, aad)
+            results.append(("current", None))
+            continue
+        except InvalidTag:
+            pass
+        try:
+            plaintext = unseal(claims_cipher_key(owner, _old_pepper), blob, aad) if _old_pepper else None
+        except InvalidTag:
+            plaintext = None
+        if plaintext is None:
+            results.append(("undecryptable", None))
+        else:
+            # The version keeps its name: sessions and the current pointer refer to it
+            results.append(("migrated", seal(claims_cipher_key(owner, _new_pepper), plaintext, aad)))
+    return results
+
+
+def parse_claims_key(key: str) -> tuple:
+    """user_claims:<ref>:<version> (ref hash-tagged in cluster mode) -> (ref, version)."""
+    owner, version = key[len("user_claims:"):].rsplit(":", 1)
+    return owner.strip("{}"), version
+
+
+FAMILIES = {
+    SESSIONS: (session_id_from_key, reencrypt_sessions),
+    CLAIMS: (parse_claims_key, reencrypt_claims),
+}
+
+
+class Checkpoint:
+    """SCAN cursors per pattern and node, and counters, saved as JSON after every batch."""
+
+    def __init__(self, path: str, fingerprint: str, restart: bool):
+        self.path = path
+        self.state = {"fingerprint": fingerprint, "cursors": {}, "counters": {}}
+        if path and os.path.exists(path) and not restart:
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("fingerprint") != fingerprint:
+                sys.exit(f"{path} belongs to a different rotation (other peppers); use --restart to discard it")
+            self.state = saved
+            print(f"Resuming from {path}")
+
+    def cursors(self, pattern: str) -> dict:
+        return self.state["cursors"].setdefault(pattern, {})
+
+    def counters(self, pattern: str) -> dict:
+        return self.state["counters"].setdefault(pattern, {s: 0 for s in ("scanned",) + STATUSES})
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+def scan_pages(r, pattern: str, count: int, cursors: dict):
+    """
+    Yield (node, next cursor, keys) per SCAN page, resuming from `cursors`
+    ({node: cursor}, None once a node is finished). Cluster mode scans each
+    primary in turn.
+    """
+    if session_store.CLUSTER_MODE:
+        nodes = [(node.name, node) for node in r.get_primaries()]
+    else:
+        nodes = [("standalone", None)]
+    for name, node in sorted(nodes, key=lambda n: n[0]):
+        cursor = cursors.get(name, 0)
+        while cursor is not None:
+            if node is None:
+                cursor, keys = r.scan(cursor=cursor, match=pattern, count=count)
+            else:
+                cursors_by_node, keys = r.scan(cursor=cursor, match=pattern, count=count, target_nodes=node)
+                cursor = cursors_by_node[name]
+            cursor = cursor or None
+            yield name, cursor, keys
+
+
+def compare_and_set(r, writes: list) -> list:
+    """[(key, old blob, new blob)] -> [True if written] in one pipelined round trip."""
+    pipe = r.pipeline(transaction=False)
+    for key, old, new in writes:
+        pipe.eval(COMPARE_AND_SET_SCRIPT, 1, key, old, new)
+    return [bool(written) for written in pipe.execute()]
+
+
+def process_batch(r, pool, workers: int, pattern: str, keys: list, counters: dict, dry_run: bool):
+    parse, reencrypt = FAMILIES[pattern]
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+    blobs = pipe.execute()
+    counters["scanned"] += len(keys)
+
+    live = [(key, blob) for key, blob in zip(keys, blobs) if blob is not None]
+    counters["vanished"] += len(keys) - len(live)
+    if not live:
+        return
+    items = [(parse(key.decode('utf-8')), blob) for key, blob in live]
+    size = -(-len(items) // workers)
+    results = [res for chunk in pool.map(reencrypt, [items[i:i + size] for i in range(0, len(items), size)])
+               for res in chunk]
+
+    writes = []
+    for (key, old), (status, new) in zip(live, results):
+        if new is None:
+            counters[status] += 1
+        else:
+            writes.append((key, old, new, status))
+    if dry_run:
+        for *_, status in writes:
+            counters[status] += 1
+        return
+    if writes:
+        for (*_, status), written in zip(writes, compare_and_set(r, [w[:3] for w in writes])):
+            counters[status if written else "conflict"] += 1
+
+
+def report(pattern: str, counters: dict, rate: float, stream=sys.stdout):
+    details = ", ".join(f"{s} {counters[s]}" for s in STATUSES if counters[s])
+    print(f"  {pattern}: scanned {counters['scanned']} ({rate:.0f}/s){', ' + details if details else ''}",
+          file=stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-encrypt sessions with a new pepper and/or format")
+    parser.add_argument("--new-pepper-ocid", default=os.environ.get("OCI_VAULT_PEPPER_OCID"),
+                        help="Pepper sessions should end up under (or set OCI_VAULT_PEPPER_OCID)")
+    parser.add_argument("--new-pepper-file", help="File containing the new pepper secret value (base64)")
+    parser.add_argument("--old-pepper-ocid", default=os.environ.get("OCI_VAULT_PEPPER_PREVIOUS_OCID"),
+                        help="Pepper being rotated out (or set OCI_VAULT_PEPPER_PREVIOUS_OCID); omit for a format upgrade")
+    parser.add_argument("--old-pepper-file", help="File containing the old pepper secret value (base64)")
+    parser.add_argument("--endpoint", default=os.environ.get("OCI_CACHE_ENDPOINT"),
+                        help="OCI Cache primary endpoint (or set OCI_CACHE_ENDPOINT)")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--no-tls", action="store_true", help="Disable TLS (local Redis only)")
+    parser.add_argument("--cluster", action="store_true",
+                        default=os.environ.get("OCI_CACHE_CLUSTER_MODE", "false").lower() == "true",
+                        help="Cache runs in cluster mode (or set OCI_CACHE_CLUSTER_MODE=true)")
+    parser.add_argument("--no-claims", action="store_true", help="Skip shared user claims (user_claims:*)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Crypto worker processes")
+    parser.add_argument("--scan-count", type=int, default=200, help="SCAN COUNT hint (keys per batch, roughly)")
+    parser.add_argument("--max-keys-per-sec", type=float, default=2000, help="Pacing limit (0 = unlimited)")
+    parser.add_argument("--checkpoint", default="rotate_session_keys.checkpoint.json",
+                        help="Progress file for resuming ('' to disable)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Decrypt and count, but write nothing")
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        parser.error("OCI Cache endpoint not set (use --endpoint or OCI_CACHE_ENDPOINT)")
+    new_pepper = load_pepper(args.new_pepper_ocid, args.new_pepper_file)
+    if new_pepper is None:
+        parser.error("new pepper not set (use --new-pepper-ocid or --new-pepper-file)")
+    old_pepper = load_pepper(args.old_pepper_ocid, args.old_pepper_file)
+    if old_pepper == new_pepper:
+        old_pepper = None
+
+    fingerprint = hashlib.sha256(new_pepper + (old_pepper or b"")).hexdigest()[:16]
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint, fingerprint, args.restart)
+    session_store.CLUSTER_MODE = args.cluster
+    r = get_redis_client(args.endpoint, args.port, not args.no_tls)
+    pacer = Pacer(args.max_keys_per_sec)
+
+    patterns = [SESSIONS] if args.no_claims else [SESSIONS, CLAIMS]
+    print(f"{'Dry run: ' if args.dry_run else ''}re-encrypting {', '.join(patterns)} "
+          f"({'pepper rotation' if old_pepper else 'format upgrade'}, {args.workers} worker(s))")
+    start = time.monotonic()
+    last_report = start
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(new_pepper, old_pepper)) as pool:
+        for pattern in patterns:
+            cursors = checkpoint.cursors(pattern)
+            counters = checkpoint.counters(pattern)
+            for node, cursor, keys in scan_pages(r, pattern, args.scan_count, cursors):
+                if keys:
+                    process_batch(r, pool, args.workers, pattern, keys, counters, args.dry_run)
+                    pacer.wait(len(keys))
+                cursors[node] = cursor
+                checkpoint.save()
+                if time.monotonic() - last_report >= 5:
+                    report(pattern, counters, pacer.done / (time.monotonic() - start), sys.stderr)
+                    last_report = time.monotonic()
+
+    elapsed = time.monotonic() - start
+    print(f"Done in {elapsed:.1f}s")
+    remaining = 0
+    for pattern in patterns:
+        counters = checkpoint.counters(pattern)
+        report(pattern, counters, pacer.done / elapsed if elapsed > 0 else 0)
+        remaining += counters["undecryptable"]
+    if remaining:
+        print(f"{remaining} key(s) could not be decrypted with either pepper; they stop working once "
+              f"OCI_VAULT_PEPPER_PREVIOUS_OCID is removed (or already did)")
+    if checkpoint.path and not args.dry_run:
+        print(f"Delete {checkpoint.path} before the next rotation, or run with --restart")
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Report how many session and login-state keys OCI Cache holds, their memory
+footprint and TTL distribution, for capacity planning.
+
+Streams the keyspace with cursor-based SCAN and queries TTL and MEMORY USAGE
+in pipelined batches, adding each batch to fixed-size histograms; keys are
+never collected, so memory use does not grow with the keyspace. A pacing
+limit (--max-keys-per-sec) and small batches keep the load on a production
+cache low; point --endpoint at the replicas endpoint to keep it off the
+primary altogether.
+
+With --decrypt and the pepper, a random sample of sessions (--sample-rate)
+is decrypted to report group counts and per-field sizes. Only sizes and
+counts are reported, never values.
+
+Must run from a host that can reach OCI Cache (e.g. the backend VM in the
+private subnet).
+
+Usage:
+    export OCI_CACHE_ENDPOINT="xxx.redis.us-chicago-1.oci.oraclecloud.com"
+
+    # Counts, sizes and TTLs of session:* and state:* keys
+    python scripts/session_capacity.py
+
+    # Include other key families, machine-readable output
+    python scripts/session_capacity.py --pattern 'session:*' --pattern 'user_claims:*' --json report.json
+
+    # Decrypt 1% of sessions (pepper from Vault via ~/.oci/config, or a file holding the secret value)
+    python scripts/session_capacity.py --decrypt --pepper-ocid ocid1.vaultsecret.oc1..xxx --sample-rate 0.01
+    python scripts/session_capacity.py --decrypt --pepper-file pepper.b64
+
+    # Sharded cache (OCI_CACHE_CLUSTER_MODE=true on the functions): scans every primary
+    python scripts/session_capacity.py --cluster
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# Key layout, client, pepper and session cipher shared with the other admin scripts
+from cache_admin import Pacer, session_store, get_redis_client, load_pepper, decrypt_session, session_id_from_key
+
+DEFAULT_PATTERNS = ["session:*", "state:*"]
+
+# Upper bounds (seconds) of the TTL buckets; keys without a TTL are counted separately
+TTL_BUCKETS = [60, 300, 900, 3600, 4 * 3600, 8 * 3600, 24 * 3600, 7 * 24 * 3600]
+
+
+class Histogram:
+    """Counts per bucket with fixed upper bounds (the last bucket is open-ended)."""
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value: int):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def rows(self, label) -> list:
+        """(bucket label, count) pairs, skipping empty buckets."""
+        rows = []
+        lower = None
+        for i, count in enumerate(self.counts):
+            upper = self.bounds[i] if i < len(self.bounds) else None
+            if count:
+                rows.append((f"<= {label(upper)}" if upper is not None else f"> {label(lower)}", count))
+            lower = upper
+        return rows
+
+    def to_dict(self) -> dict:
+        return {"bounds": self.bounds, "counts": self.counts, "total": self.total,
+                "sum": self.sum, "max": self.max}
+
+
+def size_histogram() -> Histogram:
+    """Power-of-two byte buckets from 64 B to 1 MiB."""
+    return Histogram([2 ** n for n in range(6, 21)])
+
+
+def format_bytes(n) -> str:
+    if n < 1024:
+        return f"{n} B"
+    for unit in ("KiB", "MiB"):
+        n /= 1024
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024:.1f} GiB"
+
+
+def format_seconds(n) -> str:
+    if n >= 86400:
+        return f"{n // 86400}d"
+    if n >= 3600:
+        return f"{n // 3600}h"
+    if n >= 60:
+        return f"{n // 60}m"
+    return f"{n}s"
+
+
+class FamilyStats:
+    """Streaming totals for one key pattern."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.keys = 0
+        self.vanished = 0
+        self.no_ttl = 0
+        self.memory = size_histogram()
+        self.ttl = Histogram(TTL_BUCKETS)
+
+    def add(self, ttl: int, memory):
+        if ttl == -2 or memory is None:
+            # Expired or deleted between SCAN and the batch
+            self.vanished += 1
+            return
+        self.keys += 1
+        self.memory.add(memory)
+        if ttl == -1:
+            self.no_ttl += 1
+        else:
+            self.ttl.add(ttl)
+
+    def to_dict(self) -> dict:
+        return {"pattern": self.pattern, "keys": self.keys, "vanished": self.vanished, "no_ttl": self.no_ttl,
+                "memory": self.memory.to_dict(), "ttl": self.ttl.to_dict()}
+
+
+class SampleStats:
+    """Aggregates over decrypted session samples (sizes and counts only)."""
+
+    def __init__(self):
+        self.sampled = 0
+        self.failed = 0
+        self.renewable = 0
+        self.shared_claims = 0
+        self.groups = Histogram([0, 1, 2, 5, 10, 20, 50, 100, 200])
+        self.field_bytes = {}
+
+    def add(self, session_data: dict):
+        self.sampled += 1
+        if session_data.get('refresh_token'):
+            self.renewable += 1
+        if session_data.get('claims_version'):
+            self.shared_claims += 1
+        else:
+            self.groups.add(len(session_data.get('groups') or []))
+        for field, value in session_data.items():
+            size = len(json.dumps(value, separators=(',', ':')))
+            count, total, largest = self.field_bytes.get(field, (0, 0, 0))
+            self.field_bytes[field] = (count + 1, total + size, max(largest, size))
+
+    def to_dict(self) -> dict:
+        return {"sampled": self.sampled, "failed": self.failed, "renewable": self.renewable,
+                "shared_claims": self.shared_claims, "groups": self.groups.to_dict(),
+                "field_bytes": {f: {"count": c, "mean": t / c, "max": m}
+                                for f, (c, t, m) in sorted(self.field_bytes.items())}}
+
+
+def process_batch(r, keys: list, stats: FamilyStats, samples, pepper, sample_rate: float):
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.ttl(key)
+        pipe.memory_usage(key)
+    results = pipe.execute()
+    for i in range(len(keys)):
+        stats.add(results[2 * i], results[2 * i + 1])
+
+    if samples is None or not stats.pattern.startswith("session:"):
+        return
+    picked = [k for k in keys if random.random() < sample_rate]
+    if not picked:
+        return
+    pipe = r.pipeline(transaction=False)
+    for key in picked:
+        pipe.get(key)
+    for key, blob in zip(picked, pipe.execute()):
+        if blob is None:
+            continue
+        try:
+            samples.add(decrypt_session(pepper, session_id_from_key(key.decode('utf-8')), blob))
+        except Exception:
+            samples.failed += 1
+
+
+def scan_family(r, pattern: str, args, pacer: Pacer, samples, pepper) -> FamilyStats:
+    stats = FamilyStats(pattern)
+    batch = []
+    seen = 0
+    for key in r.scan_iter(match=pattern, count=args.scan_count):
+        batch.append(key)
+        if len(batch) >= args.batch_size:
+            process_batch(r, batch, stats, samples, pepper, args.sample_rate)
+            pacer.wait(len(batch))
+            seen += len(batch)
+            batch = []
+            if seen % (args.batch_size * 100) == 0:
+                print(f"  {pattern}: {seen} keys scanned", file=sys.stderr)
+        if args.limit and seen + len(batch) >= args.limit:
+            break
+    if batch:
+        process_batch(r, batch, stats, samples, pepper, args.sample_rate)
+        pacer.wait(len(batch))
+    return stats
+
+
+def print_report(families: list, samples, elapsed: float):
+    for stats in families:
+        print(f"\n{stats.pattern}: {stats.keys} key(s), {format_bytes(stats.memory.sum)} total, "
+              f"{format_bytes(stats.memory.max)} largest")
+        if stats.vanished:
+            print(f"  {stats.vanished} key(s) expired or deleted during the scan")
+        if stats.no_ttl:
+            print(f"  WARNING: {stats.no_ttl} key(s) without a TTL")
+        if stats.keys:
+            print(f"  memory per key (mean {format_bytes(round(stats.memory.sum / stats.keys))}):")
+            for label, count in stats.memory.rows(format_bytes):
+                print(f"    {label:>12}  {count:>10}")
+        if stats.ttl.total:
+            print("  remaining TTL:")
+            for label, count in stats.ttl.rows(format_seconds):
+                print(f"    {label:>12}  {count:>10}")
+
+    if samples is not None:
+        print(f"\nDecrypted sample: {samples.sampled} session(s), {samples.failed} failed, "
+              f"{samples.renewable} renewable, {samples.shared_claims} with shared claims")
+        if samples.groups.total:
+            print("  groups per session:")
+            for label, count in samples.groups.rows(str):
+                print(f"    {label:>12}  {count:>10}")
+        if samples.field_bytes:
+            print(f"  {'field':<20} {'present':>8} {'mean B':>8} {'max B':>8}")
+            for field, (count, total, largest) in sorted(samples.field_bytes.items(), key=lambda x: -x[1][1]):
+                print(f"  {field:<20} {count:>8} {total / count:>8.0f} {largest:>8}")
+    print(f"\nScanned in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report session keyspace size, memory and TTL distribution")
+    parser.add_argument("--pattern", action="append", help="Key pattern to scan (repeatable; default session:* and state:*)")
+    parser.add_argument("--endpoint", default=os.environ.get("OCI_CACHE_ENDPOINT"),
+                        help="OCI Cache endpoint, preferably the replicas endpoint (or set OCI_CACHE_ENDPOINT)")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--no-tls", action="store_true", help="Disable TLS (local Redis only)")
+    parser.add_argument("--cluster", action="store_true",
+                        default=os.environ.get("OCI_CACHE_CLUSTER_MODE", "false").lower() == "true",
+                        help="Cache runs in cluster mode (or set OCI_CACHE_CLUSTER_MODE=true)")
+    parser.add_argument("--scan-count", type=int, default=500, help="SCAN COUNT hint")
+    parser.add_argument("--batch-size", type=int, default=200, help="Keys per pipelined TTL/MEMORY USAGE batch")
+    parser.add_argument("--max-keys-per-sec", type=float, default=5000, help="Pacing limit (0 = unlimited)")
+    parser.add_argument("--limit", type=int, default=0, help="Stop each pattern after this many keys")
+    parser.add_argument("--decrypt", action="store_true", help="Decrypt a sample of sessions")
+    parser.add_argument("--pepper-ocid", default=os.environ.get("OCI_VAULT_PEPPER_OCID"),
+                        help="Pepper secret OCID, read with ~/.oci/config (or set OCI_VAULT_PEPPER_OCID)")
+    parser.add_argument("--pepper-file", help="File containing the pepper secret value (base64)")
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="Fraction of sessions to decrypt")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        parser.error("OCI Cache endpoint not set (use --endpoint or OCI_CACHE_ENDPOINT)")
+    if args.decrypt and not (args.pepper_file or args.pepper_ocid):
+        parser.error("--decrypt needs --pepper-file or --pepper-ocid")
+
+    pepper = load_pepper(args.pepper_ocid, args.pepper_file) if args.decrypt else None
+    samples = SampleStats() if args.decrypt else None
+
+    session_store.CLUSTER_MODE = args.cluster
+    r = get_redis_client(args.endpoint, args.port, not args.no_tls)
+    pacer = Pacer(args.max_keys_per_sec)
+
+    start = time.monotonic()
+    families = [scan_family(r, pattern, args, pacer, samples, pepper) for pattern in args.pattern or DEFAULT_PATTERNS]
+    elapsed = time.monotonic() - start
+    print_report(families, samples, elapsed)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"families": [s.to_dict() for s in families],
+                       "sample": samples.to_dict() if samples is not None else None,
+                       "elapsed_seconds": round(elapsed, 2)}, f, indent=2)
+        print(f"Report written to {args.json}")
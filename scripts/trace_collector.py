@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Local trace collector stand-in.
+
+Accepts OTLP/JSON trace exports (POST /v1/traces) from the functions when
+TRACE_EXPORTER=otlp, and prints each trace as an indented span tree with
+durations so a login can be attributed hop by hop without a real collector.
+
+Usage:
+    python scripts/trace_collector.py                    # listen on :4318
+    python scripts/trace_collector.py --port 4318 --output traces.jsonl
+
+    # Point the functions at it
+    export TRACE_EXPORTER=otlp
+    export TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+
+    # Or replay logged traces (TRACE_EXPORTER=log) from a log file
+    python scripts/trace_collector.py --from-log function.log
+"""
+
+import json
+import argparse
+import threading
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# trace_id -> list of (service, span dict)
+_traces = defaultdict(list)
+_lock = threading.Lock()
+_output = None
+
+
+def ingest(payload: dict):
+    """Store spans from one OTLP/JSON export request and print affected traces."""
+    touched = set()
+    with _lock:
+        for resource_spans in payload.get("resourceSpans", []):
+            service = "unknown"
+            for attr in resource_spans.get("resource", {}).get("attributes", []):
+                if attr.get("key") == "service.name":
+                    service = attr.get("value", {}).get("stringValue", service)
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    _traces[span["traceId"]].append((service, span))
+                    touched.add(span["traceId"])
+                    if _output:
+                        _output.write(json.dumps({"service": service, **span}) + "\n")
+                        _output.flush()
+        for trace_id in touched:
+            print_trace(trace_id)
+
+
+def print_trace(trace_id: str):
+    spans = _traces[trace_id]
+    by_id = {s["spanId"]: (svc, s) for svc, s in spans}
+    children = defaultdict(list)
+    roots = []
+    for svc, s in spans:
+        parent = s.get("parentSpanId")
+        if parent and parent in by_id:
+            children[parent].append((svc, s))
+        else:
+            roots.append((svc, s))
+
+    start = min(int(s["startTimeUnixNano"]) for _, s in spans)
+    print(f"\ntrace {trace_id} ({len(spans)} spans)")
+
+    def walk(svc, s, depth):
+        offset_ms = (int(s["startTimeUnixNano"]) - start) / 1e6
+        duration_ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+        failed = " ERROR" if s.get("status", {}).get("code") == 2 else ""
+        print(f"  {'  ' * depth}{s['name']:<40} [{svc}] +{offset_ms:8.1f}ms {duration_ms:8.1f}ms{failed}")
+        for child in sorted(children[s["spanId"]], key=lambda c: int(c[1]["startTimeUnixNano"])):
+            walk(*child, depth + 1)
+
+    for root in sorted(roots, key=lambda r: int(r[1]["startTimeUnixNano"])):
+        walk(*root, 0)
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/traces":
+            self.send_response(404)
+            self.end_headers()
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            ingest(json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError) as e:
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(str(e).encode())
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def replay_log(path: str):
+    """Ingest 'TRACE {...}' lines written by the log exporter."""
+    with open(path) as f:
+        for line in f:
+            marker = line.find("TRACE {")
+            if marker >= 0:
+                ingest(json.loads(line[marker + len("TRACE "):]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OTLP/JSON trace collector")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="Append received spans to this JSONL file")
+    parser.add_argument("--from-log", help="Replay TRACE lines from a function log file and exit")
+    args = parser.parse_args()
+
+    if args.output:
+        _output = open(args.output, "a")
+
+    if args.from_log:
+        replay_log(args.from_log)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), CollectorHandler)
+        print(f"Trace collector listening on http://{args.host}:{args.port}/v1/traces")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
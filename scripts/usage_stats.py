@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Show per-hour usage counters recorded by the functions (USAGE_STATS_ENABLED).
+
+For each UTC hour: distinct users and sessions (HyperLogLog estimates,
+about 0.8% error), logins started, succeeded and failed, authorizations
+allowed and denied with the authorization rate, then totals for the whole
+window: distinct users and sessions across all hours (one PFCOUNT over the
+hourly sketches, not their sum) and a breakdown of login failure and deny
+reasons. Reads one pipeline; nothing is scanned.
+
+Must run from a host that can reach OCI Cache (e.g. the backend VM in the
+private subnet).
+
+Usage:
+    export OCI_CACHE_ENDPOINT="xxx.redis.us-chicago-1.oci.oraclecloud.com"
+
+    # Last 24 hours (default)
+    python scripts/usage_stats.py
+
+    # Last week, machine-readable
+    python scripts/usage_stats.py --hours 168 --json usage.json
+
+    # Sharded cache (OCI_CACHE_CLUSTER_MODE=true on the functions)
+    python scripts/usage_stats.py --cluster
+"""
+
+import os
+import json
+import time
+import calendar
+import argparse
+
+# Key layout and client shared with the other admin scripts; hour buckets from the functions' usage module
+from cache_admin import session_store, get_redis_client
+import usage
+
+
+def read_usage(r, hours: int, now: float = None) -> dict:
+    """Counters and distinct counts for the last `hours` UTC hours (oldest first) and the window."""
+    now = time.time() if now is None else now
+    buckets = [usage.hour(now - 3600 * i) for i in reversed(range(hours))]
+    keys = [session_store.usage_keys(bucket) for bucket in buckets]
+
+    pipe = r.pipeline(transaction=False)
+    for counts_key, users_key, sessions_key in keys:
+        pipe.hgetall(counts_key)
+        pipe.pfcount(users_key)
+        pipe.pfcount(sessions_key)
+    results = pipe.execute()
+    # Union over all hours; the keys share a hash tag, so this also works in cluster mode
+    total_users = r.pfcount(*[k[1] for k in keys])
+    total_sessions = r.pfcount(*[k[2] for k in keys])
+
+    rows = []
+    totals = {}
+    for i, bucket in enumerate(buckets):
+        counts = {name.decode('utf-8'): int(value) for name, value in results[3 * i].items()}
+        for name, value in counts.items():
+            totals[name] = totals.get(name, 0) + value
+        # The current hour has only partly elapsed
+        elapsed = min(3600.0, now - calendar.timegm(time.strptime(bucket, "%Y%m%d%H")))
+        rows.append(summarize(bucket, counts, results[3 * i + 1], results[3 * i + 2], max(elapsed, 1.0)))
+    return {
+        "hours": rows,
+        "total": summarize(f"{buckets[0]}-{buckets[-1]}", totals, total_users, total_sessions, 3600.0 * hours),
+        "login_failures": reasons(totals, "login.failure."),
+        "deny_reasons": reasons(totals, "authz.deny."),
+        "counters": dict(sorted(totals.items())),
+    }
+
+
+def summarize(label: str, counts: dict, users: int, sessions: int, seconds: float) -> dict:
+    denied = sum(v for k, v in counts.items() if k.startswith("authz.deny."))
+    allowed = counts.get("authz.allow", 0)
+    return {
+        "hour": label,
+        "users": users,
+        "sessions": sessions,
+        "login_start": counts.get("login.start", 0),
+        "login_success": counts.get("login.success", 0),
+        "login_failure": sum(v for k, v in counts.items() if k.startswith("login.failure.")),
+        "authz_allow": allowed,
+        "authz_deny": denied,
+        "authz_per_s": round((allowed + denied) / seconds, 2),
+        "logout": sum(v for k, v in counts.items() if k.startswith("logout.")),
+    }
+
+
+def reasons(counts: dict, prefix: str) -> dict:
+    found = {k[len(prefix):]: v for k, v in counts.items() if k.startswith(prefix)}
+    return dict(sorted(found.items(), key=lambda kv: -kv[1]))
+
+
+def print_report(report: dict):
+    columns = ("users", "sessions", "login_start", "login_success", "login_failure",
+               "authz_allow", "authz_deny", "authz_per_s", "logout")
+    header = f"{'hour (UTC)':<23}" + "".join(f"{c:>14}" for c in columns)
+    print(header)
+    for row in report["hours"]:
+        print(f"{row['hour']:<23}" + "".join(f"{row[c]:>14}" for c in columns))
+    print("-" * len(header))
+    print(f"{report['total']['hour']:<23}" + "".join(f"{report['total'][c]:>14}" for c in columns))
+    print()
+    for title, key in (("Login failures", "login_failures"), ("Deny reasons", "deny_reasons")):
+        found = report[key]
+        print(f"{title}: " + (", ".join(f"{k}={v}" for k, v in found.items()) if found else "none"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show per-hour usage counters")
+    parser.add_argument("--hours", type=int, default=24, help="Hours to show, ending with the current one")
+    parser.add_argument("--endpoint", default=os.environ.get("OCI_CACHE_ENDPOINT"),
+                        help="OCI Cache endpoint (or set OCI_CACHE_ENDPOINT)")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--no-tls", action="store_true", help="Disable TLS (local Redis only)")
+    parser.add_argument("--cluster", action="store_true",
+                        default=os.environ.get("OCI_CACHE_CLUSTER_MODE", "false").lower() == "true",
+                        help="Cache runs in cluster mode (or set OCI_CACHE_CLUSTER_MODE=true)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.endpoint:
+        parser.error("OCI Cache endpoint not set (use --endpoint or OCI_CACHE_ENDPOINT)")
+    if args.hours < 1:
+        parser.error("--hours must be at least 1")
+
+    session_store.CLUSTER_MODE = args.cluster
+    report = read_usage(get_redis_client(args.endpoint, args.port, not args.no_tls), args.hours)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
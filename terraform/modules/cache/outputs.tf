@@ -13,6 +13,11 @@ output "cache_fqdn" {
   value       = oci_redis_redis_cluster.this.primary_fqdn
 }
 
+output "cache_replicas_fqdn" {
+  description = "The FQDN that load-balances reads across replicas (node_count > 1)"
+  value       = oci_redis_redis_cluster.this.replicas_fqdn
+}
+
 output "cache_port" {
   description = "The port for the cache cluster"
   value       = 6379
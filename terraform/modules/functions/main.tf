@@ -1,5 +1,5 @@
 # OCI Functions Module
-# Deploys all 5 functions for the OIDC authentication solution
+# Deploys all 7 functions for the OIDC authentication solution (plus optional auth_router)
 
 # Create OCI Functions Application
 resource "oci_functions_application" "this" {
@@ -38,8 +38,15 @@ resource "oci_functions_function" "health" {
   application_id     = oci_functions_application.this.id
   display_name       = "health"
   image              = "${var.container_repo}/health:${var.function_version}"
-  memory_in_mbs      = 128
+  memory_in_mbs      = 256
   timeout_in_seconds = 30
+
+  # Used only by readiness probes (/health?mode=ready)
+  config = {
+    OCI_CACHE_ENDPOINT       = var.cache_endpoint
+    OCI_IAM_BASE_URL         = var.oci_iam_base_url
+    HEALTH_VAULT_SECRET_OCID = var.client_creds_secret_ocid
+  }
 }
 
 # ============================================
@@ -78,6 +85,7 @@ resource "oci_functions_function" "oidc_callback" {
     OCI_VAULT_PEPPER_OCID      = var.pepper_secret_ocid
     SESSION_TTL_SECONDS        = "28800"
     SESSION_COOKIE_NAME        = "session_id"
+    SESSION_MODE               = var.session_mode
     DEFAULT_RETURN_TO          = "/"
     COOKIE_DOMAIN              = var.cookie_domain
   }
@@ -94,8 +102,10 @@ resource "oci_functions_function" "apigw_authzr" {
   timeout_in_seconds = 60
 
   config = {
-    OCI_VAULT_PEPPER_OCID = var.pepper_secret_ocid
-    SESSION_COOKIE_NAME   = "session_id"
+    OCI_VAULT_PEPPER_OCID          = var.pepper_secret_ocid
+    OCI_VAULT_PEPPER_PREVIOUS_OCID = var.pepper_previous_secret_ocid
+    SESSION_COOKIE_NAME            = "session_id"
+    OCI_CACHE_READER_ENDPOINT      = var.cache_reader_endpoint
   }
 }
 
@@ -109,10 +119,74 @@ resource "oci_functions_function" "oidc_logout" {
   memory_in_mbs      = 256
   timeout_in_seconds = 60
 
+  # The pepper opens sealed session cookies (session_mode = "stateless")
   config = {
-    OCI_IAM_BASE_URL         = var.oci_iam_base_url
-    POST_LOGOUT_REDIRECT_URI = "https://${var.gateway_hostname}/logged-out"
-    SESSION_COOKIE_NAME      = "session_id"
-    COOKIE_DOMAIN            = var.cookie_domain
+    OCI_IAM_BASE_URL               = var.oci_iam_base_url
+    POST_LOGOUT_REDIRECT_URI       = "https://${var.gateway_hostname}/logged-out"
+    SESSION_COOKIE_NAME            = "session_id"
+    COOKIE_DOMAIN                  = var.cookie_domain
+    OCI_VAULT_PEPPER_OCID          = var.pepper_secret_ocid
+    OCI_VAULT_PEPPER_PREVIOUS_OCID = var.pepper_previous_secret_ocid
+  }
+}
+
+# ============================================
+# Function: oidc_backchannel_logout (IdP-initiated logout)
+# ============================================
+resource "oci_functions_function" "oidc_backchannel_logout" {
+  application_id     = oci_functions_application.this.id
+  display_name       = "oidc_backchannel_logout"
+  image              = "${var.container_repo}/oidc_backchannel_logout:${var.function_version}"
+  memory_in_mbs      = 256
+  timeout_in_seconds = 30
+
+  config = {
+    OCI_IAM_BASE_URL            = var.oci_iam_base_url
+    OCI_VAULT_CLIENT_CREDS_OCID = var.client_creds_secret_ocid
+  }
+}
+
+# ============================================
+# Function: session_info (Current user's profile for SPAs)
+# ============================================
+resource "oci_functions_function" "session_info" {
+  application_id     = oci_functions_application.this.id
+  display_name       = "session_info"
+  image              = "${var.container_repo}/session_info:${var.function_version}"
+  memory_in_mbs      = 256
+  timeout_in_seconds = 30
+
+  config = {
+    OCI_VAULT_PEPPER_OCID          = var.pepper_secret_ocid
+    OCI_VAULT_PEPPER_PREVIOUS_OCID = var.pepper_previous_secret_ocid
+    SESSION_COOKIE_NAME            = "session_id"
+  }
+}
+
+# ============================================
+# Function: auth_router (optional, all handlers in one image)
+# ============================================
+resource "oci_functions_function" "auth_router" {
+  count              = var.enable_auth_router ? 1 : 0
+  application_id     = oci_functions_application.this.id
+  display_name       = "auth_router"
+  image              = "${var.container_repo}/auth_router:${var.function_version}"
+  memory_in_mbs      = 512
+  timeout_in_seconds = 60
+
+  config = {
+    OCI_IAM_BASE_URL               = var.oci_iam_base_url
+    OIDC_REDIRECT_URI              = "https://${var.gateway_hostname}/auth/callback"
+    OCI_VAULT_CLIENT_CREDS_OCID    = var.client_creds_secret_ocid
+    OCI_VAULT_PEPPER_OCID          = var.pepper_secret_ocid
+    POST_LOGOUT_REDIRECT_URI       = "https://${var.gateway_hostname}/logged-out"
+    STATE_TTL_SECONDS              = "300"
+    SESSION_TTL_SECONDS            = "28800"
+    SESSION_COOKIE_NAME            = "session_id"
+    SESSION_MODE                   = var.session_mode
+    DEFAULT_RETURN_TO              = "/"
+    COOKIE_DOMAIN                  = var.cookie_domain
+    OCI_CACHE_READER_ENDPOINT      = var.cache_reader_endpoint
+    OCI_VAULT_PEPPER_PREVIOUS_OCID = var.pepper_previous_secret_ocid
   }
 }
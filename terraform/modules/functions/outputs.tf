@@ -30,7 +30,22 @@ output "oidc_logout_function_id" {
   value       = oci_functions_function.oidc_logout.id
 }
 
+output "oidc_backchannel_logout_function_id" {
+  description = "The OCID of the oidc_backchannel_logout function"
+  value       = oci_functions_function.oidc_backchannel_logout.id
+}
+
+output "session_info_function_id" {
+  description = "The OCID of the session_info function"
+  value       = oci_functions_function.session_info.id
+}
+
 output "dynamic_group_id" {
   description = "The OCID of the functions dynamic group"
   value       = oci_identity_dynamic_group.functions.id
 }
+
+output "auth_router_function_id" {
+  description = "The OCID of the auth_router function (null unless enable_auth_router)"
+  value       = var.enable_auth_router ? oci_functions_function.auth_router[0].id : null
+}
@@ -36,6 +36,12 @@ variable "cache_endpoint" {
   type        = string
 }
 
+variable "cache_reader_endpoint" {
+  description = "Optional OCI Cache replicas FQDN for authorizer session lookups (empty = primary only)"
+  type        = string
+  default     = ""
+}
+
 variable "oci_iam_base_url" {
   description = "OCI IAM Identity Domain base URL"
   type        = string
@@ -56,6 +62,24 @@ variable "pepper_secret_ocid" {
   type        = string
 }
 
+variable "pepper_previous_secret_ocid" {
+  description = "Pepper secret being rotated out, still accepted for decryption (empty = none)"
+  type        = string
+  default     = ""
+}
+
+variable "session_mode" {
+  description = "Session cookie mode: server (session ID cookie) or stateless (sealed cookie, cache used for revocations)"
+  type        = string
+  default     = "server"
+}
+
+variable "enable_auth_router" {
+  description = "Also deploy auth_router, which serves all auth routes from one function (run scripts/build_auth_router.sh before pushing its image)"
+  type        = bool
+  default     = false
+}
+
 variable "cookie_domain" {
   description = "Domain for session cookies (optional, leave empty for default)"
   type        = string
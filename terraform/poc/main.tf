@@ -223,6 +223,36 @@ resource "oci_apigateway_deployment" "this" {
       }
     }
 
+    # Called by the IdP (OIDC Back-Channel Logout); the logout token is the credential
+    routes {
+      path    = "/auth/backchannel-logout"
+      methods = ["POST"]
+      backend {
+        type        = "ORACLE_FUNCTIONS_BACKEND"
+        function_id = module.functions.oidc_backchannel_logout_function_id
+      }
+      request_policies {
+        authorization {
+          type = "ANONYMOUS"
+        }
+      }
+    }
+
+    # Validates the session cookie itself (no authorizer call)
+    routes {
+      path    = "/auth/session"
+      methods = ["GET"]
+      backend {
+        type        = "ORACLE_FUNCTIONS_BACKEND"
+        function_id = module.functions.session_info_function_id
+      }
+      request_policies {
+        authorization {
+          type = "ANONYMOUS"
+        }
+      }
+    }
+
     routes {
       path    = "/logged-out"
       methods = ["GET"]
@@ -0,0 +1,31 @@
+"""
+Shared fixtures. The functions are loaded in-process with scripts/fn_local.py
+(as the load test does); Redis is faked with fakeredis.
+
+    pip install pytest fakeredis fdk redis cryptography pyjwt requests
+    python -m pytest tests/
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_DIR, "scripts"))
+# Shared modules (session_store, vault_client, ...) are identical copies
+sys.path.insert(0, os.path.join(REPO_DIR, "functions", "apigw_authzr"))
+
+# Read by the functions at import time
+os.environ.setdefault("OCI_CACHE_ENDPOINT", "127.0.0.1")
+os.environ.setdefault("OCI_CACHE_TLS", "false")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """A fresh fake cache, installed as session_store's process-wide client."""
+    fakeredis = pytest.importorskip("fakeredis")
+    import session_store
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(session_store, "_client", client)
+    return client
@@ -0,0 +1,27 @@
+"""apigw_authzr input handling (no session lookup needed)."""
+
+import pytest
+
+import fn_local
+
+
+@pytest.fixture
+def authz(redis_client):
+    return fn_local.load_function("apigw_authzr")
+
+
+@pytest.mark.parametrize("body", [
+    {"type": "TOKEN", "token": "session_id=abc"},
+    {"data": {"Cookie": "session_id=abc"}},
+    ["USER_DEFINED"],
+    "not json",
+])
+def test_rejects_non_user_defined_payloads(authz, body):
+    result = fn_local.invoke(authz, body=body)
+    assert result.status == 200
+    assert result.json() == {"active": False, "wwwAuthenticate": 'Bearer realm="app", error="invalid_request"'}
+
+
+def test_user_defined_payload_reaches_the_cookie_check(authz):
+    result = fn_local.invoke(authz, body={"type": "USER_DEFINED", "data": {"Cookie": "theme=dark"}})
+    assert result.json() == {"active": False, "wwwAuthenticate": 'Bearer realm="app", error="no_session"'}
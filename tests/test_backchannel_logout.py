@@ -0,0 +1,64 @@
+"""oidc_backchannel_logout.remove_sessions (logout token already validated)."""
+
+import pytest
+
+import fn_local
+import session_store
+
+
+@pytest.fixture
+def bcl(redis_client):
+    return fn_local.load_function("oidc_backchannel_logout")
+
+
+def add_session(r, bcl, session_id: str, sub: str, sid: str = None):
+    owner = bcl.key_ref(sub)
+    r.set(session_store.session_key(session_id), b"blob")
+    r.set(session_store.owner_key(session_id), owner)
+    r.zadd(session_store.user_sessions_key(owner), {session_id: 2000000000})
+    if sid:
+        r.sadd(session_store.idp_sessions_key(bcl.key_ref(sid)), session_id)
+
+
+def test_sub_logout_bumps_epoch_once(redis_client, bcl):
+    r = redis_client
+    add_session(r, bcl, "s1", "alice")
+    epoch_key = session_store.user_epoch_key(bcl.key_ref("alice"))
+
+    assert bcl.remove_sessions(r, {"jti": "j1", "sub": "alice"}) == (False, 1)
+    assert int(r.get(epoch_key)) == 1
+    assert not r.exists(session_store.session_key("s1"))
+
+    # Redelivery of the same token: acknowledged, and sessions opened since survive
+    add_session(r, bcl, "s2", "alice")
+    assert bcl.remove_sessions(r, {"jti": "j1", "sub": "alice"}) == (True, 0)
+    assert int(r.get(epoch_key)) == 1
+    assert r.exists(session_store.session_key("s2"))
+
+
+def test_failed_removal_can_be_retried(redis_client, bcl, monkeypatch):
+    r = redis_client
+    add_session(r, bcl, "s1", "alice", sid="idp-1")
+    claims = {"jti": "j2", "sid": "idp-1"}
+
+    def fail(*args):
+        raise RuntimeError("cache unavailable")
+    with monkeypatch.context() as m:
+        m.setattr(session_store, "mark_revoked", fail)
+        with pytest.raises(RuntimeError):
+            bcl.remove_sessions(r, claims)
+
+    assert bcl.remove_sessions(r, claims) == (False, 1)
+    assert not r.exists(session_store.session_key("s1"))
+    assert bcl.remove_sessions(r, claims) == (True, 0)
+
+
+def test_sid_logout_prunes_user_index(redis_client, bcl):
+    r = redis_client
+    add_session(r, bcl, "s1", "alice", sid="idp-1")
+    add_session(r, bcl, "s2", "alice", sid="idp-2")
+    index_key = session_store.user_sessions_key(bcl.key_ref("alice"))
+
+    assert bcl.remove_sessions(r, {"jti": "j3", "sid": "idp-1"}) == (False, 1)
+    assert r.zrange(index_key, 0, -1) == [b"s2"]
+    assert r.exists(session_store.session_key("s2"))
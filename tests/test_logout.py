@@ -0,0 +1,49 @@
+"""oidc_logout: scope=all (log out everywhere) needs a same-origin POST."""
+
+import pytest
+
+import fn_local
+import session_store
+
+URL = "https://gw.example.com/auth/logout"
+
+
+@pytest.fixture
+def logout(redis_client, monkeypatch):
+    module = fn_local.load_function("oidc_logout")
+    monkeypatch.setattr(module, "get_pepper", lambda ocid=None: b"\0" * 32)
+    for session_id in ("s1", "s2"):
+        redis_client.set(session_store.session_key(session_id), b"blob")
+        redis_client.set(session_store.owner_key(session_id), "alice")
+        redis_client.zadd(session_store.user_sessions_key("alice"), {session_id: 2000000000})
+    return module
+
+
+def sessions_left(r) -> set:
+    return {sid for sid in ("s1", "s2") if r.exists(session_store.session_key(sid))}
+
+
+@pytest.mark.parametrize("method, headers, url, body", [
+    ("POST", {"Origin": "https://gw.example.com"}, URL + "?scope=all", b""),
+    ("POST", {"Origin": "https://gw.example.com"}, URL, {"scope": "all"}),
+    ("POST", {"Referer": "https://gw.example.com/welcome"}, URL, b"scope=all"),
+])
+def test_same_origin_post_logs_out_everywhere(redis_client, logout, method, headers, url, body):
+    result = fn_local.invoke(logout, {"Cookie": "session_id=s1", **headers}, body, url, method)
+    assert result.status == 302
+    assert sessions_left(redis_client) == set()
+    assert int(redis_client.get(session_store.user_epoch_key("alice"))) == 1
+
+
+@pytest.mark.parametrize("method, headers", [
+    ("GET", {"Origin": "https://gw.example.com"}),
+    ("POST", {"Origin": "https://evil.example.net"}),
+    ("POST", {"Referer": "https://evil.example.net/gw.example.com"}),
+    ("POST", {"Origin": "null"}),
+    ("POST", {}),
+])
+def test_other_requests_only_end_the_current_session(redis_client, logout, method, headers):
+    result = fn_local.invoke(logout, {"Cookie": "session_id=s1", **headers}, b"", URL + "?scope=all", method)
+    assert result.status == 302
+    assert sessions_left(redis_client) == {"s2"}
+    assert redis_client.get(session_store.user_epoch_key("alice")) is None
@@ -0,0 +1,78 @@
+"""Login and authorizer rate limits."""
+
+from collections import OrderedDict
+
+import pytest
+
+import fn_local
+import session_store
+
+
+@pytest.fixture
+def authz(redis_client, monkeypatch):
+    module = fn_local.load_function("apigw_authzr")
+    monkeypatch.setattr(module, "AUTHZ_RATE_PER_SEC", 0.5)
+    monkeypatch.setattr(module, "AUTHZ_RATE_BURST", 1)
+    monkeypatch.setattr(module, "_rate_buckets", OrderedDict())
+    monkeypatch.setattr(module, "_throttled", OrderedDict())
+    # No background sync against the fake cache
+    monkeypatch.setattr(module, "_rate_sync_thread", object())
+    return module
+
+
+@pytest.fixture
+def authn(redis_client, monkeypatch):
+    module = fn_local.load_function("oidc_authn")
+    monkeypatch.setattr(module, "get_client_id", lambda: "client")
+    # The registered script is bound to the client it was registered on
+    monkeypatch.setattr(module, "_login_limiter", None)
+    return module
+
+
+def authorize(authz, cookie: str) -> dict:
+    ctx = fn_local.InvokeContext()
+    success = authz.authorize_success({"sub": "alice", "email": "alice@example.com"}, cookie)
+    return fn_local.Result(200, {}, authz.authorized(ctx, success, cookie).body()).json()
+
+
+def test_throttled_session_is_not_sent_to_the_idp(redis_client, authz, authn):
+    assert authorize(authz, "cookie-1")["active"] is True
+    denied = authorize(authz, "cookie-1")
+    assert denied["active"] is False
+    marker = session_store.authz_throttled_key(session_store.revocation_ref("cookie-1"))
+    assert 0 < redis_client.ttl(marker) <= 2
+
+    # The gateway redirects the denial to /auth/login, which answers 429
+    result = fn_local.invoke(authn, {"Cookie": "theme=dark; session_id=cookie-1"})
+    assert result.status == 429
+    assert 0 < int(result.headers["Retry-After"]) <= 2
+    assert result.json()["error"] == "rate_limited"
+    assert not list(redis_client.scan_iter("state:*"))
+
+    # Another browser, or this one once the marker is gone, logs in as usual
+    assert fn_local.invoke(authn, {"Cookie": "session_id=cookie-2"}).status == 302
+    redis_client.delete(marker)
+    assert fn_local.invoke(authn, {"Cookie": "session_id=cookie-1"}).status == 302
+
+
+def test_marker_written_once_per_throttled_period(redis_client, authz, monkeypatch):
+    writes = []
+    monkeypatch.setattr(redis_client, "set", lambda *args, **kwargs: writes.append(args))
+    for _ in range(5):
+        authorize(authz, "cookie-1")
+    assert len(writes) == 1
+
+
+def test_login_rate_script_is_registered_once(redis_client, authn, monkeypatch):
+    pytest.importorskip("lupa")
+    monkeypatch.setattr(authn, "LOGIN_RATE_IP_PER_SEC", 0.5)
+    monkeypatch.setattr(authn, "LOGIN_RATE_IP_BURST", 2)
+    registered = []
+    register_script = redis_client.register_script
+    monkeypatch.setattr(redis_client, "register_script", lambda script: registered.append(script) or register_script(script))
+
+    headers = {"X-Forwarded-For": "203.0.113.7"}
+    statuses = [fn_local.invoke(authn, headers).status for _ in range(3)]
+
+    assert statuses == [302, 302, 429]
+    assert len(registered) == 1
@@ -0,0 +1,34 @@
+"""session_store.revoke_user_sessions, shared by logout everywhere and the admin script."""
+
+import session_store
+
+
+def add_session(r, session_id: str, owner: str):
+    r.set(session_store.session_key(session_id), b"blob")
+    r.set(session_store.owner_key(session_id), owner)
+    r.zadd(session_store.user_sessions_key(owner), {session_id: 2000000000})
+
+
+def test_revokes_every_session_of_the_users(redis_client):
+    r = redis_client
+    for session_id, owner in (("a1", "alice"), ("a2", "alice"), ("b1", "bob"), ("c1", "carol")):
+        add_session(r, session_id, owner)
+    batches = []
+
+    revoked = session_store.revoke_user_sessions(r, ["alice", "bob"], 1, progress=lambda *b: batches.append(b))
+
+    assert revoked == 3
+    assert batches == [(1, 1, 2), (2, 1, 1)]
+    for session_id in ("a1", "a2", "b1"):
+        assert not r.exists(session_store.session_key(session_id), session_store.owner_key(session_id))
+    assert not r.exists(session_store.user_sessions_key("alice"), session_store.user_sessions_key("bob"))
+    assert int(r.get(session_store.user_epoch_key("alice"))) == 1
+    assert r.zscore(session_store.revoked_sessions_key(), session_store.revocation_ref("a1"))
+    # Other users are untouched
+    assert r.exists(session_store.session_key("c1"))
+    assert r.get(session_store.user_epoch_key("carol")) is None
+
+
+def test_user_without_indexed_sessions_still_gets_a_new_epoch(redis_client):
+    assert session_store.revoke_user_sessions(redis_client, ["dave"]) == 0
+    assert int(redis_client.get(session_store.user_epoch_key("dave"))) == 1
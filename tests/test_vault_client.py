@@ -0,0 +1,108 @@
+"""vault_client (VAULT_CLIENT=lite) against scripts/fake_vault.py."""
+
+import os
+import base64
+import socket
+import threading
+import time
+
+import pytest
+
+import fake_vault
+import vault_client
+
+SECRET_OCID = "ocid1.vaultsecret.oc1..pepper"
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """Fake Vault on a free port, with a resource principal in tmp_path; returns the rp dir."""
+    rp_dir = str(tmp_path / "rp")
+    monkeypatch.setattr(fake_vault, "_public_key", fake_vault.write_resource_principal(rp_dir))
+    monkeypatch.setattr(fake_vault, "_secrets", {SECRET_OCID: "s3cret"})
+    server = fake_vault.start_server("127.0.0.1", 0)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    for name, value in fake_vault.export_lines_env(endpoint, rp_dir).items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(vault_client, "VAULT_SECRETS_ENDPOINT", endpoint)
+    yield rp_dir
+    server.shutdown()
+
+
+def test_fetches_secret_bundle(vault):
+    content = vault_client.get_secret_bundle_content(SECRET_OCID)
+    assert base64.b64decode(content).decode() == "s3cret"
+
+
+def test_missing_secret_raises(vault):
+    with pytest.raises(vault_client.VaultClientError, match="404"):
+        vault_client.get_secret_bundle_content("ocid1.vaultsecret.oc1..missing")
+
+
+def test_wrong_key_is_rejected(vault, tmp_path, monkeypatch):
+    # A key the server does not know signs the request
+    other = str(tmp_path / "other")
+    fake_vault.write_resource_principal(other)
+    monkeypatch.setenv("OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM", os.path.join(other, "private.pem"))
+    with pytest.raises(vault_client.VaultClientError, match="401"):
+        vault_client.get_secret_bundle_content(SECRET_OCID)
+
+
+def test_refreshed_credentials_are_picked_up(vault, monkeypatch):
+    vault_client.get_secret_bundle_content(SECRET_OCID)
+    # The platform rotates the session key and RPST files in place
+    monkeypatch.setattr(fake_vault, "_public_key", fake_vault.write_resource_principal(vault))
+    content = vault_client.get_secret_bundle_content(SECRET_OCID)
+    assert base64.b64decode(content).decode() == "s3cret"
+
+
+def test_encrypted_private_key(vault, monkeypatch):
+    from cryptography.hazmat.primitives import serialization
+    pem_path = os.path.join(vault, "private.pem")
+    with open(pem_path, "rb") as f:
+        key = serialization.load_pem_private_key(f.read(), password=None)
+    with open(pem_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.BestAvailableEncryption(b"pass")))
+    monkeypatch.setenv("OCI_RESOURCE_PRINCIPAL_PRIVATE_PEM_PASSPHRASE", "pass")
+    assert vault_client.get_secret_bundle_content(SECRET_OCID)
+
+
+def test_missing_resource_principal(vault, monkeypatch):
+    monkeypatch.delenv("OCI_RESOURCE_PRINCIPAL_RPST")
+    with pytest.raises(vault_client.VaultClientError, match="OCI_RESOURCE_PRINCIPAL_RPST"):
+        vault_client.get_secret_bundle_content(SECRET_OCID)
+
+
+def test_missing_region_without_endpoint(vault, monkeypatch):
+    monkeypatch.setattr(vault_client, "VAULT_SECRETS_ENDPOINT", "")
+    monkeypatch.delenv("OCI_RESOURCE_PRINCIPAL_REGION")
+    with pytest.raises(vault_client.VaultClientError, match="REGION"):
+        vault_client.get_secret_bundle_content(SECRET_OCID)
+
+
+def test_unreachable_endpoint(vault, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(vault_client, "VAULT_SECRETS_ENDPOINT", f"http://127.0.0.1:{port}")
+    with pytest.raises(vault_client.VaultClientError, match="request failed"):
+        vault_client.get_secret_bundle_content(SECRET_OCID)
+
+
+def test_timeout(vault, monkeypatch):
+    # Accepts the connection but never answers
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    accepted = []
+    threading.Thread(target=lambda: accepted.append(listener.accept()), daemon=True).start()
+    monkeypatch.setattr(vault_client, "VAULT_SECRETS_ENDPOINT", f"http://127.0.0.1:{listener.getsockname()[1]}")
+    start = time.monotonic()
+    try:
+        with pytest.raises(vault_client.VaultClientError):
+            vault_client.get_secret_bundle_content(SECRET_OCID, timeout=0.3)
+    finally:
+        listener.close()
+    assert time.monotonic() - start < 3
+    assert vault_client.VAULT_TIMEOUT_SECONDS != 0.3